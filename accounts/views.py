@@ -9,6 +9,7 @@ from django.utils.encoding import force_bytes
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.urls import reverse
+from givegrip.pagination import KeysetPaginator
 from .models import User, PhoneVerification
 from django.contrib.auth.hashers import make_password
 from django.conf import settings
@@ -123,22 +124,21 @@ def logout_view(request):
 @login_required
 def profile_view(request):
     """User profile view."""
-    # Get user's donations
-    donations = request.user.donations.all().order_by('-created_at')
+    # Get user's recent donations
+    donations = request.user.donations.select_related('campaign').order_by('-created_at')
     
-    # Calculate donation statistics
-    total_donations = donations.count()
-    total_amount = sum(donation.amount for donation in donations if donation.status == 'paid')
-    campaigns_supported = donations.values('campaign').distinct().count()
+    # Donation statistics come from the donor's snapshot row
+    from donations.models import DonorStats
+    stats = DonorStats.for_donor(request.user)
     
     # Get user's campaigns
     campaigns = request.user.campaigns.all().order_by('-created_at')
     
     context = {
         'donations': donations[:5],  # Show last 5 donations
-        'total_donations': total_donations,
-        'total_amount': total_amount,
-        'campaigns_supported': campaigns_supported,
+        'total_donations': stats.donation_count,
+        'total_amount': stats.total_amount,
+        'campaigns_supported': stats.campaigns_supported,
         'campaigns': campaigns[:5],  # Show last 5 campaigns
         'campaigns_count': campaigns.count(),
     }
@@ -256,5 +256,6 @@ def otp_verify(request):
 @login_required
 def my_donations(request):
     """View user's donations."""
-    donations = request.user.donations.all().order_by('-created_at')
-    return render(request, 'my_donations.html', {'donations': donations})
+    donations = request.user.donations.select_related('campaign')
+    page = KeysetPaginator(donations, 10).get_page(request.GET.get('cursor'))
+    return render(request, 'my_donations.html', {'donations': page})
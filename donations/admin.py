@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Campaign, Donation
+from .models import Campaign, Donation, DonationLedgerEntry
 
 
 @admin.register(Campaign)
@@ -22,7 +22,7 @@ class CampaignAdmin(admin.ModelAdmin):
             'fields': ('cover_image', 'video_url')
         }),
         ('Statistics', {
-            'fields': ('view_count', 'share_count', 'donor_count'),
+            'fields': ('view_count', 'share_count', 'donor_count', 'counter_shards'),
             'classes': ('collapse',)
         }),
         ('Timestamps', {
@@ -31,19 +31,19 @@ class CampaignAdmin(admin.ModelAdmin):
         })
     )
     
+    def get_queryset(self, request):
+        # Progress and days remaining come from SQL for the whole changelist
+        return super().get_queryset(request).with_progress()
+    
     def progress_percentage(self, obj):
-        if obj.goal_amount > 0:
-            return f"{(obj.collected_amount / obj.goal_amount) * 100:.1f}%"
-        return "0%"
+        return f"{obj.progress_percentage:.1f}%"
     progress_percentage.short_description = 'Progress'
+    progress_percentage.admin_order_field = 'progress_percentage'
     
     def days_remaining(self, obj):
-        from django.utils import timezone
-        if obj.end_date:
-            remaining = obj.end_date - timezone.now()
-            return max(0, remaining.days)
-        return "No end date"
+        return obj.days_remaining
     days_remaining.short_description = 'Days Remaining'
+    days_remaining.admin_order_field = 'days_remaining'
 
 
 @admin.register(Donation)
@@ -70,3 +70,15 @@ class DonationAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(DonationLedgerEntry)
+class DonationLedgerEntryAdmin(admin.ModelAdmin):
+    list_display = ['donation', 'campaign', 'amount', 'created_at']
+    search_fields = ['campaign__title', 'donation__id']
+    readonly_fields = ['donation', 'campaign', 'amount', 'created_at']
+    
+    def has_add_permission(self, request):
+        # Entries are only written by the ledger
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
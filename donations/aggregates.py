@@ -0,0 +1,74 @@
+"""
+Cached aggregates for the campaign detail page and the donor dashboard.
+
+Both are filled through ``givegrip.singleflight``, so when an entry expires
+one request recomputes it while the others are served the previous value.
+Entries are keyed by the versions of ``givegrip.pagecache`` tags, so they are
+retired together with the pages showing the same data: ``campaign_tag`` on a
+payment or edit of the campaign, ``donor_tag`` when one of the donor's
+donations is paid, and ``CAMPAIGN_LIST_TAG`` when a campaign starts or stops
+being active. Neighbours and recommendations rebuilt in the background show
+up within ``AGGREGATE_CACHE_TIMEOUT`` seconds.
+"""
+from django.conf import settings
+
+from givegrip import singleflight
+from givegrip.pagecache import CAMPAIGN_LIST_TAG, campaign_tag, tag_versions
+
+from .models import CampaignSimilarity, DonorRecommendation, DonorStats
+
+
+def donor_tag(donor_id):
+    return f'donor:{donor_id}'
+
+
+def _key(kind, owner_id, *tags):
+    versions = tag_versions(tags)
+    return ':'.join(['aggregates', kind, str(owner_id)] + [versions[tag] for tag in tags])
+
+
+def campaign_aggregates(campaign):
+    """Recent paid donations, active neighbours and the donation count of ``campaign``."""
+    key = _key('campaign', campaign.pk, campaign_tag(campaign.pk), CAMPAIGN_LIST_TAG)
+    return singleflight.get_or_compute(
+        key, lambda: _campaign_aggregates(campaign), settings.AGGREGATE_CACHE_TIMEOUT,
+    )
+
+
+def _campaign_aggregates(campaign):
+    return {
+        'recent_donations': list(
+            campaign.donations.filter(status='paid').select_related('donor').order_by('-created_at')[:5]
+        ),
+        # Neighbours precomputed by donations.similarity
+        'similar_campaigns': [
+            entry.similar for entry in CampaignSimilarity.objects.filter(
+                campaign=campaign, similar__status='active'
+            ).select_related('similar')[:3]
+        ],
+        'donation_count': campaign.stats.donation_count if hasattr(campaign, 'stats') else 0,
+    }
+
+
+def donor_aggregates(donor):
+    """Donation totals and active recommended campaigns for ``donor``'s dashboard."""
+    key = _key('donor', donor.pk, donor_tag(donor.pk), CAMPAIGN_LIST_TAG)
+    return singleflight.get_or_compute(
+        key, lambda: _donor_aggregates(donor), settings.AGGREGATE_CACHE_TIMEOUT,
+    )
+
+
+def _donor_aggregates(donor):
+    # Donation statistics come from the donor's snapshot row
+    stats = DonorStats.for_donor(donor)
+    return {
+        'total_donations': stats.donation_count,
+        'total_amount': stats.total_amount,
+        'campaigns_supported': stats.campaigns_supported,
+        # Precomputed by donations.recommendations
+        'recommended_campaigns': [
+            entry.campaign for entry in DonorRecommendation.objects.filter(
+                donor=donor, campaign__status='active'
+            ).select_related('campaign')[:3]
+        ],
+    }
@@ -5,3 +5,6 @@ class DonationsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'donations'
     verbose_name = 'Donations'
+
+    def ready(self):
+        import donations.signals
@@ -0,0 +1,243 @@
+"""
+In-process prefix index for the campaign search box.
+
+Every worker keeps the normalized title tokens of active campaigns in a
+sorted list, with one ``array`` of campaign slots per token, so a keystroke
+is a ``bisect`` plus a short scan instead of a database query. Matches are
+ranked by ``collected_amount`` and then ``donor_count``.
+
+The index is built on first use, updated in place when this process saves
+or deletes a campaign, picks up other workers' edits by polling
+``updated_at`` every ``CAMPAIGN_AUTOCOMPLETE_REFRESH_INTERVAL`` seconds, and
+is rebuilt from scratch every ``CAMPAIGN_AUTOCOMPLETE_REBUILD_INTERVAL``
+seconds to drop deletions and refresh the ranking amounts. One thread at a
+time refreshes or rebuilds; the others keep answering from the current
+index, which a rebuild swaps for the new one only once it is complete.
+Database queries run outside the lock lookups take.
+"""
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left, insort
+
+from django.conf import settings
+
+from .models import Campaign
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def normalize(text):
+    """Lowercased word tokens with accents stripped."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return TOKEN_RE.findall(text.lower())
+
+
+class TitleIndex:
+    """Sorted token list with per-token posting arrays of campaign slots."""
+
+    # What a rebuild replaces
+    _STATE = ('_tokens', '_postings', '_ids', '_titles', '_amounts', '_donors', '_slots', '_free', '_watermark')
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # Held by the one thread refreshing or rebuilding
+        self._maintenance_lock = threading.Lock()
+        self._reset()
+        self._built_at = None
+        self._refreshed_at = 0.0
+
+    def _reset(self):
+        self._tokens = []          # sorted, unique
+        self._postings = []        # array('I') of slots, parallel to _tokens
+        self._ids = []             # slot -> campaign id, None once removed
+        self._titles = []
+        self._amounts = array('d')
+        self._donors = array('I')
+        self._slots = {}           # campaign id -> slot
+        self._free = []            # slots of removed campaigns, reused first
+        self._watermark = None     # newest updated_at seen
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+            self._built_at = None
+
+    def __len__(self):
+        return len(self._slots)
+
+    # Building and refreshing
+
+    def build(self):
+        """Load a new index from the database and swap it in; lookups use the old one meanwhile."""
+        fresh = TitleIndex()
+        fresh._load()
+        with self._lock:
+            for name in self._STATE:
+                setattr(self, name, getattr(fresh, name))
+            self._built_at = self._refreshed_at = time.monotonic()
+
+    def _load(self):
+        rows = Campaign.objects.filter(status='active').values_list(
+            'id', 'title', 'collected_amount', 'donor_count', 'updated_at'
+        )
+        postings = {}
+        for campaign_id, title, amount, donors, updated_at in rows.iterator(chunk_size=2000):
+            slot = self._allocate(campaign_id, title)
+            self._amounts[slot] = float(amount)
+            self._donors[slot] = donors
+            for token in set(normalize(title)):
+                postings.setdefault(token, array('I')).append(slot)
+            if self._watermark is None or updated_at > self._watermark:
+                self._watermark = updated_at
+        # Slots are handed out in increasing order, so every posting
+        # array is already sorted; only the token list needs sorting.
+        self._tokens = sorted(postings)
+        self._postings = [postings[token] for token in self._tokens]
+
+    def _maintenance_due(self):
+        """``'build'``, ``'refresh'`` or None."""
+        now = time.monotonic()
+        if self._built_at is None or now - self._built_at >= settings.CAMPAIGN_AUTOCOMPLETE_REBUILD_INTERVAL:
+            return 'build'
+        if now - self._refreshed_at >= settings.CAMPAIGN_AUTOCOMPLETE_REFRESH_INTERVAL:
+            return 'refresh'
+        return None
+
+    def ensure_fresh(self):
+        if self._maintenance_due() is None:
+            return
+        # With nothing to answer from yet, wait for whichever thread builds it;
+        # otherwise leave the work to the thread already doing it
+        if not self._maintenance_lock.acquire(blocking=self._built_at is None):
+            return
+        try:
+            # Checked again: another thread may have just done it
+            due = self._maintenance_due()
+            if due == 'build':
+                self.build()
+            elif due == 'refresh':
+                self.refresh()
+        finally:
+            self._maintenance_lock.release()
+
+    def refresh(self):
+        """Apply campaigns changed since the last build or refresh, in any worker."""
+        changed = Campaign.objects.all()
+        if self._watermark is not None:
+            changed = changed.filter(updated_at__gt=self._watermark)
+        rows = list(changed.values_list('id', 'title', 'collected_amount', 'donor_count', 'updated_at', 'status'))
+        with self._lock:
+            for campaign_id, title, amount, donors, updated_at, status in rows:
+                if status == 'active':
+                    self._apply(campaign_id, title, amount, donors, updated_at)
+                else:
+                    self._remove(campaign_id)
+            self._refreshed_at = time.monotonic()
+
+    # Incremental updates from this process
+
+    def update(self, campaign):
+        """Reflect a saved campaign, dropping it if it is no longer active."""
+        with self._lock:
+            if self._built_at is None:
+                return
+            if campaign.status == 'active':
+                self._apply(campaign.pk, campaign.title, campaign.collected_amount,
+                            campaign.donor_count, campaign.updated_at)
+            else:
+                self._remove(campaign.pk)
+
+    def remove(self, campaign_id):
+        with self._lock:
+            self._remove(campaign_id)
+
+    def _apply(self, campaign_id, title, amount, donors, updated_at):
+        if campaign_id in self._slots:
+            slot = self._slots[campaign_id]
+            if self._titles[slot] != title:
+                self._unlink(slot)
+                self._titles[slot] = title
+                self._link(slot, title)
+        else:
+            slot = self._allocate(campaign_id, title)
+            self._link(slot, title)
+        self._amounts[slot] = float(amount)
+        self._donors[slot] = donors
+        if updated_at is not None and (self._watermark is None or updated_at > self._watermark):
+            self._watermark = updated_at
+
+    def _allocate(self, campaign_id, title):
+        if self._free:
+            slot = self._free.pop()
+            self._ids[slot] = campaign_id
+            self._titles[slot] = title
+        else:
+            slot = len(self._ids)
+            self._ids.append(campaign_id)
+            self._titles.append(title)
+            self._amounts.append(0.0)
+            self._donors.append(0)
+        self._slots[campaign_id] = slot
+        return slot
+
+    def _remove(self, campaign_id):
+        slot = self._slots.pop(campaign_id, None)
+        if slot is None:
+            return
+        self._unlink(slot)
+        self._ids[slot] = None
+        self._titles[slot] = None
+        self._free.append(slot)
+
+    def _link(self, slot, title):
+        for token in set(normalize(title)):
+            i = bisect_left(self._tokens, token)
+            if i == len(self._tokens) or self._tokens[i] != token:
+                self._tokens.insert(i, token)
+                self._postings.insert(i, array('I'))
+            insort(self._postings[i], slot)
+
+    def _unlink(self, slot):
+        for token in set(normalize(self._titles[slot])):
+            i = bisect_left(self._tokens, token)
+            if i < len(self._tokens) and self._tokens[i] == token:
+                postings = self._postings[i]
+                postings.remove(slot)
+                if not postings:
+                    del self._tokens[i]
+                    del self._postings[i]
+
+    # Lookups
+
+    def _prefix_slots(self, prefix):
+        slots = set()
+        i = bisect_left(self._tokens, prefix)
+        while i < len(self._tokens) and self._tokens[i].startswith(prefix):
+            slots.update(self._postings[i])
+            i += 1
+        return slots
+
+    def lookup(self, query, limit=8):
+        """Active campaigns whose title has a word starting with every query word."""
+        terms = normalize(query)
+        if not terms:
+            return []
+        self.ensure_fresh()
+        with self._lock:
+            # Rarest-looking (longest) words first keeps the candidate set small
+            candidates = None
+            for term in sorted(terms, key=len, reverse=True):
+                slots = self._prefix_slots(term)
+                candidates = slots if candidates is None else candidates & slots
+                if not candidates:
+                    return []
+            ranked = heapq.nlargest(limit, candidates, key=lambda slot: (self._amounts[slot], self._donors[slot]))
+            return [{'id': str(self._ids[slot]), 'title': self._titles[slot]} for slot in ranked]
+
+
+title_index = TitleIndex()
@@ -0,0 +1,262 @@
+"""
+Incrementally maintained campaign counters.
+
+``donor_count`` is bumped on the paid transition, using the
+``CampaignDonor`` seen-set so each donor is counted once per campaign.
+
+``view_count`` and ``share_count`` are far hotter, so increments are
+buffered per process and flushed to the database in a single batched
+``UPDATE`` within ``CAMPAIGN_COUNTER_FLUSH_INTERVAL`` seconds, or sooner
+once ``CAMPAIGN_COUNTER_MAX_PENDING`` increments are waiting. A crashed
+worker loses at most that many increments. Repeat views from the same
+visitor within ``CAMPAIGN_VIEW_DEDUP_WINDOW`` seconds, and repeat shares
+within ``CAMPAIGN_SHARE_DEDUP_WINDOW`` seconds, are not counted.
+"""
+import hashlib
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Case, Count, F, FloatField, IntegerField, Value, When
+
+from . import shards
+from .models import Campaign, CampaignDonor, Donation
+from .trending import counter_score
+
+logger = logging.getLogger(__name__)
+
+
+def record_new_donors(donations):
+    """Add unseen (campaign, donor) pairs and bump ``donor_count``.
+
+    Returns the set of pairs that were seen for the first time.
+    """
+    pairs = {(d.campaign_id, d.donor_id) for d in donations}
+    if not pairs:
+        return set()
+
+    with transaction.atomic():
+        existing = set(
+            CampaignDonor.objects.filter(
+                campaign_id__in={campaign_id for campaign_id, _ in pairs},
+                donor_id__in={donor_id for _, donor_id in pairs},
+            ).values_list('campaign_id', 'donor_id')
+        )
+        new_pairs = _insert_pairs(pairs - existing)
+
+        per_campaign = Counter(campaign_id for campaign_id, _ in new_pairs)
+        sharded = shards.shards_for(donations)
+        for campaign_id, count in per_campaign.items():
+            if campaign_id in sharded:
+                shards.add(campaign_id, sharded[campaign_id], donor_count=count)
+            else:
+                Campaign.objects.filter(pk=campaign_id).update(donor_count=F('donor_count') + count)
+
+    return new_pairs
+
+
+def _insert_pairs(pairs):
+    """Insert seen-set rows, skipping pairs another worker inserted concurrently."""
+    rows = [CampaignDonor(campaign_id=campaign_id, donor_id=donor_id) for campaign_id, donor_id in pairs]
+    try:
+        with transaction.atomic():
+            CampaignDonor.objects.bulk_create(rows)
+        return set(pairs)
+    except IntegrityError:
+        pass
+
+    inserted = set()
+    for row in rows:
+        try:
+            with transaction.atomic():
+                row.pk = None
+                row.save(force_insert=True)
+        except IntegrityError:
+            continue
+        inserted.add((row.campaign_id, row.donor_id))
+    return inserted
+
+
+def rebuild_campaign_donors():
+    """Rebuild the seen-set and ``donor_count`` from paid donations."""
+    shards.compact()
+    paid = Donation.objects.filter(status='paid')
+    with transaction.atomic():
+        CampaignDonor.objects.all().delete()
+        CampaignDonor.objects.bulk_create(
+            [
+                CampaignDonor(campaign_id=campaign_id, donor_id=donor_id)
+                for campaign_id, donor_id in paid.order_by().values_list('campaign_id', 'donor_id').distinct().iterator()
+            ],
+            batch_size=1000,
+        )
+        counts = dict(
+            CampaignDonor.objects.values('campaign_id')
+            .annotate(total=Count('id'))
+            .values_list('campaign_id', 'total')
+        )
+        Campaign.objects.exclude(pk__in=counts).update(donor_count=0)
+        for campaign_id, total in counts.items():
+            Campaign.objects.filter(pk=campaign_id).update(donor_count=total)
+    return len(counts)
+
+
+class CounterBuffer:
+    """Per-process buffer of campaign counter increments.
+
+    If ``score`` is given, each flush also adds ``score(deltas)`` for every
+    campaign to ``score_field`` in the same statement.
+    """
+
+    def __init__(self, fields, score_field=None, score=None):
+        self.fields = tuple(fields)
+        self.score_field = score_field
+        self.score = score
+        self._lock = threading.Lock()
+        self._pending = defaultdict(Counter)
+        self._pending_total = 0
+        self._last_flush = time.monotonic()
+        self._timer = None
+
+    def increment(self, campaign_id, field, amount=1):
+        if field not in self.fields:
+            raise ValueError(f'Unknown counter {field}')
+        with self._lock:
+            self._pending[campaign_id][field] += amount
+            self._pending_total += amount
+            due = (
+                self._pending_total >= settings.CAMPAIGN_COUNTER_MAX_PENDING
+                or time.monotonic() - self._last_flush >= settings.CAMPAIGN_COUNTER_FLUSH_INTERVAL
+            )
+            if not due and self._timer is None:
+                # Make sure increments reach the database even if traffic stops
+                self._timer = threading.Timer(settings.CAMPAIGN_COUNTER_FLUSH_INTERVAL, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if due:
+            self.flush()
+
+    def pending(self, campaign_id):
+        """Increments for ``campaign_id`` not yet written to the database."""
+        with self._lock:
+            return dict(self._pending.get(campaign_id, {}))
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        finally:
+            connections.close_all()
+
+    def flush(self):
+        """Write all buffered increments in one statement. Returns the rows touched."""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(Counter)
+            self._pending_total = 0
+            self._last_flush = time.monotonic()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return 0
+
+        updates = {}
+        for field in self.fields:
+            whens = [
+                When(pk=campaign_id, then=Value(deltas[field]))
+                for campaign_id, deltas in pending.items() if deltas[field]
+            ]
+            if whens:
+                updates[field] = F(field) + Case(*whens, default=Value(0), output_field=IntegerField())
+        if self.score_field:
+            try:
+                whens = [
+                    When(pk=campaign_id, then=Value(self.score(deltas))) for campaign_id, deltas in pending.items()
+                ]
+            except Exception:
+                logger.exception("Could not score campaign counters, writing them unscored")
+                whens = []
+            if whens:
+                updates[self.score_field] = F(self.score_field) + Case(
+                    *whens, default=Value(0.0), output_field=FloatField()
+                )
+
+        try:
+            return Campaign.objects.filter(pk__in=list(pending)).update(**updates)
+        except Exception:
+            logger.exception("Could not flush campaign counters, keeping them buffered")
+            with self._lock:
+                for campaign_id, deltas in pending.items():
+                    self._pending[campaign_id].update(deltas)
+                    self._pending_total += sum(deltas.values())
+            return 0
+
+
+campaign_counters = CounterBuffer(
+    fields=('view_count', 'share_count'), score_field='trending_score', score=counter_score,
+)
+atexit.register(campaign_counters.flush)
+
+
+def record_view(campaign_id):
+    campaign_counters.increment(campaign_id, 'view_count')
+
+
+def track_campaign_view(request, campaign_id):
+    """Count a campaign page view unless this visitor was counted recently.
+
+    Returns True if the view was counted.
+    """
+    if not settings.CAMPAIGN_VIEW_TRACKING:
+        return False
+    if not _first_in_window('campaign-view', campaign_id, request, settings.CAMPAIGN_VIEW_DEDUP_WINDOW):
+        return False
+    record_view(campaign_id)
+    return True
+
+
+def track_campaign_share(request, campaign_id):
+    """Count a share unless this visitor shared the campaign recently.
+
+    Returns True if the share was counted.
+    """
+    if not _first_in_window('campaign-share', campaign_id, request, settings.CAMPAIGN_SHARE_DEDUP_WINDOW):
+        return False
+    record_share(campaign_id)
+    return True
+
+
+def _first_in_window(kind, campaign_id, request, window):
+    return not window or cache.add(f'{kind}:{campaign_id}:{_visitor_key(request)}', 1, window)
+
+
+def _visitor_key(request):
+    """Session key when there is one, otherwise a hash of client address and user agent."""
+    session = getattr(request, 'session', None)
+    if session is not None and session.session_key:
+        return session.session_key
+    visitor = f"{_client_ip(request)}|{request.META.get('HTTP_USER_AGENT', '')}"
+    return hashlib.md5(visitor.encode()).hexdigest()
+
+
+def _client_ip(request):
+    """The address of the client, as seen by the outermost of ``TRUSTED_PROXY_COUNT`` proxies.
+
+    Each trusted proxy appends the address it received the request from to
+    ``X-Forwarded-For``; anything further left was sent by the client and
+    could be anything. With too few entries the header is ignored.
+    """
+    proxies = settings.TRUSTED_PROXY_COUNT
+    if proxies:
+        forwarded = [part.strip() for part in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if part.strip()]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def record_share(campaign_id):
+    campaign_counters.increment(campaign_id, 'share_count')
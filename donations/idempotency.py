@@ -0,0 +1,243 @@
+"""
+Idempotency keys for POST endpoints that create payments.
+
+A client sends a key with each logical request, either in an
+``Idempotency-Key`` header or in an ``idempotency_key`` form field (the
+donate form renders a fresh one each time). The first request with a key
+runs the view. Its response is stored under a digest of the user, path and
+key, and every retry gets that response back instead of creating another
+donation and gateway order.
+
+* Stored responses are kept in the cache for ``IDEMPOTENCY_CACHE_TIMEOUT``
+  seconds. An ``IdempotencyKey`` row keeps them for ``IDEMPOTENCY_KEY_TTL``
+  seconds and covers cache misses and evictions.
+* A duplicate that arrives while the first request is still running waits
+  for its response, up to ``IDEMPOTENCY_WAIT_TIMEOUT`` seconds, and replays
+  it. It gets a 409 if the response is still not there.
+* The view is not run inside a transaction, so it can call the payment
+  gateway without holding one open. It calls ``claim`` in the
+  ``transaction.atomic()`` block that writes what the request creates,
+  which inserts the key row, still without a response, alongside those
+  writes. If two workers that do not share a cache race on one key, the
+  unique index lets one of them commit. ``claim`` raises ``Duplicate`` in
+  the other, which rolls back its writes and replays the winner's response.
+  The response is stored in the key row once the view returns.
+* Reusing a key with different parameters gets a 422. Server errors are
+  not stored, so the client can retry them with the same key, unless the
+  view had already committed its writes.
+"""
+import hashlib
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+FORM_FIELD = 'idempotency_key'
+MAX_KEY_LENGTH = 255
+# Form fields that differ between retries of the same request
+IGNORED_FIELDS = ('csrfmiddlewaretoken', FORM_FIELD)
+
+WAIT_POLL = 0.05
+
+# response_status of a claimed key whose view has not returned yet
+PENDING = 0
+
+
+class Duplicate(Exception):
+    """Another request with the same idempotency key committed its writes first."""
+
+
+class _Claim:
+    def __init__(self, scope, fingerprint):
+        self.scope = scope
+        self.fingerprint = fingerprint
+        self.claimed = False
+
+
+def _client_key(request):
+    key = request.headers.get(HEADER) or request.POST.get(FORM_FIELD)
+    if key and len(key) <= MAX_KEY_LENGTH:
+        return key
+    return None
+
+
+def _scope(request, client_key):
+    raw = f'{request.user.pk}:{request.path}:{client_key}'
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _fingerprint(request):
+    fields = sorted(
+        (name, value) for name, values in request.POST.lists() if name not in IGNORED_FIELDS for value in values
+    )
+    return hashlib.sha256(repr(fields).encode()).hexdigest()
+
+
+def _cache_key(scope):
+    return f'idempotency:{scope}'
+
+
+def _entry(record):
+    return {
+        'fingerprint': record.fingerprint,
+        'status': record.response_status,
+        'content_type': record.response_content_type,
+        'content': bytes(record.response_body),
+    }
+
+
+def lookup(scope):
+    """The stored response for ``scope``: from the cache, else from the database.
+
+    A key claimed by a request that is still running has status ``PENDING``.
+    """
+    entry = cache.get(_cache_key(scope))
+    if entry is not None:
+        return entry
+    record = IdempotencyKey.objects.filter(key=scope, expires_at__gt=timezone.now()).first()
+    if record is None:
+        return None
+    entry = _entry(record)
+    if entry['status'] != PENDING:
+        cache.set(_cache_key(scope), entry, settings.IDEMPOTENCY_CACHE_TIMEOUT)
+    return entry
+
+
+def _replay(entry, fingerprint):
+    if entry['fingerprint'] != fingerprint:
+        return HttpResponse('This idempotency key was already used for a different request.', status=422)
+    if entry['status'] == PENDING:
+        return _in_progress()
+    response = HttpResponse(entry['content'], status=entry['status'], content_type=entry['content_type'])
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _in_progress():
+    return HttpResponse('A request with this idempotency key is still in progress.', status=409)
+
+
+def _wait_for(scope):
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_POLL)
+        entry = lookup(scope)
+        if entry is not None and entry['status'] != PENDING:
+            return entry
+    return None
+
+
+def _answer(scope, fingerprint, entry=None):
+    """Replay the stored response, waiting for it while the first request is still running."""
+    if entry is None or (entry['status'] == PENDING and entry['fingerprint'] == fingerprint):
+        entry = _wait_for(scope) or entry
+    return _replay(entry, fingerprint) if entry is not None else _in_progress()
+
+
+def claim(request):
+    """Insert the request's idempotency key in the caller's transaction.
+
+    Call it in the ``transaction.atomic()`` block that writes what the
+    request creates, so the key commits or rolls back with those writes.
+    Raises ``Duplicate`` if another request with the same key committed
+    first; let it propagate out of the block, and ``idempotent`` answers
+    with that request's response. Does nothing for requests without a key.
+    """
+    state = getattr(request, '_idempotency', None)
+    if state is None:
+        return
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(
+                key=state.scope,
+                fingerprint=state.fingerprint,
+                response_status=PENDING,
+                response_content_type='',
+                response_body=b'',
+                expires_at=timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+            )
+    except IntegrityError:
+        raise Duplicate(state.scope)
+    state.claimed = True
+
+
+def _execute(view, request, scope, fingerprint, args, kwargs):
+    """Run the view, then store its response under the key it claimed, or a new one."""
+    request._idempotency = state = _Claim(scope, fingerprint)
+    try:
+        response = view(request, *args, **kwargs)
+    except Duplicate:
+        return _answer(scope, fingerprint)
+    if hasattr(response, 'render') and callable(response.render):
+        response = response.render()
+    if response.streaming:
+        return response
+
+    fields = {
+        'response_status': response.status_code,
+        'response_content_type': response.get('Content-Type', ''),
+        'response_body': response.content,
+    }
+    # Once the view's writes are committed, even an error is stored so retries do not repeat them;
+    # nothing is updated if the claim was rolled back after all
+    stored = state.claimed and IdempotencyKey.objects.filter(key=scope, response_status=PENDING).update(**fields)
+    if not stored:
+        if response.status_code >= 500:
+            return response
+        try:
+            with transaction.atomic():
+                IdempotencyKey.objects.create(
+                    key=scope, fingerprint=fingerprint,
+                    expires_at=timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL), **fields,
+                )
+        except IntegrityError:
+            # Another worker finished the same request first
+            return _answer(scope, fingerprint)
+
+    entry = {'fingerprint': fingerprint, 'status': fields['response_status'],
+             'content_type': fields['response_content_type'], 'content': fields['response_body']}
+    transaction.on_commit(lambda: cache.set(_cache_key(scope), entry, settings.IDEMPOTENCY_CACHE_TIMEOUT))
+    return response
+
+
+def idempotent(view):
+    """Replay the stored response to POSTs that repeat an idempotency key.
+
+    Requests without a key are passed through unchanged.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        client_key = _client_key(request) if request.method == 'POST' else None
+        if client_key is None:
+            return view(request, *args, **kwargs)
+
+        scope = _scope(request, client_key)
+        fingerprint = _fingerprint(request)
+        entry = lookup(scope)
+        if entry is not None:
+            return _answer(scope, fingerprint, entry)
+
+        lock = f'{_cache_key(scope)}:lock'
+        if cache.add(lock, 1, settings.IDEMPOTENCY_LOCK_TIMEOUT):
+            try:
+                return _execute(view, request, scope, fingerprint, args, kwargs)
+            finally:
+                cache.delete(lock)
+
+        # A duplicate of a request that is still running: answer with its response
+        return _answer(scope, fingerprint)
+    return wrapper
+
+
+def purge_expired():
+    """Delete stored responses past their TTL. Returns the number deleted."""
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
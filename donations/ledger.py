@@ -0,0 +1,145 @@
+"""
+Donation ledger for the donations application.
+
+Every paid donation is counted towards its campaign through this module.
+Recording a donation appends a ``DonationLedgerEntry`` and bumps
+``Campaign.collected_amount`` with a single ``F()`` expression, so concurrent
+checkouts never lose updates and the hot path never aggregates. Campaigns
+with sharded counters are bumped through ``donations.shards`` instead.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+
+from . import shards
+from .models import Campaign, Donation, DonationLedgerEntry
+from .signals import donations_paid
+
+
+def record_paid_donation(donation):
+    """Count a single paid donation. Returns True if it was newly recorded."""
+    return bool(record_paid_donations([donation]))
+
+
+def record_paid_donations(donations):
+    """Count a batch of paid donations towards their campaigns.
+
+    Donations that already have a ledger entry are skipped, so calling this
+    again for the same donation (webhook plus redirect, retries) is a no-op.
+    Returns the list of donations that were newly recorded.
+    """
+    donations = [d for d in donations if d.status == 'paid']
+    if not donations:
+        return []
+
+    with transaction.atomic():
+        already_recorded = set(
+            DonationLedgerEntry.objects.filter(
+                donation_id__in=[d.pk for d in donations]
+            ).values_list('donation_id', flat=True)
+        )
+        pending = {d.pk: d for d in donations if d.pk not in already_recorded}
+        if not pending:
+            return []
+
+        recorded = _append_entries(list(pending.values()))
+        if not recorded:
+            return []
+
+        totals = defaultdict(Decimal)
+        for donation in recorded:
+            totals[donation.campaign_id] += Decimal(donation.amount)
+        sharded = shards.shards_for(recorded)
+        for campaign_id, amount in totals.items():
+            if campaign_id in sharded:
+                shards.add(campaign_id, sharded[campaign_id], collected_amount=amount)
+            else:
+                Campaign.objects.filter(pk=campaign_id).update(
+                    collected_amount=F('collected_amount') + amount
+                )
+
+        donations_paid.send(sender=DonationLedgerEntry, donations=recorded)
+
+    return recorded
+
+
+def _append_entries(donations):
+    """Insert ledger rows, tolerating rows written concurrently by another worker."""
+    entries = [
+        DonationLedgerEntry(donation_id=d.pk, campaign_id=d.campaign_id, amount=d.amount)
+        for d in donations
+    ]
+    try:
+        with transaction.atomic():
+            DonationLedgerEntry.objects.bulk_create(entries)
+        return donations
+    except IntegrityError:
+        pass
+
+    # Another worker recorded some of these between our check and insert;
+    # fall back to one savepoint per row so only the losers are skipped.
+    recorded = []
+    for donation, entry in zip(donations, entries):
+        try:
+            with transaction.atomic():
+                entry.pk = None
+                entry.save(force_insert=True)
+        except IntegrityError:
+            continue
+        recorded.append(donation)
+    return recorded
+
+
+def backfill_ledger(batch_size=1000):
+    """Create ledger entries for paid donations that are missing one.
+
+    Migration 0015 does this once for donations made before the ledger
+    existed. Campaign totals are left untouched; run
+    ``reconcile_campaign_totals`` afterwards to bring them in line with the
+    ledger.
+    """
+    missing = (
+        Donation.objects.filter(status='paid', ledger_entry__isnull=True)
+        .values_list('pk', 'campaign_id', 'amount')
+    )
+    entries = [
+        DonationLedgerEntry(donation_id=pk, campaign_id=campaign_id, amount=amount)
+        for pk, campaign_id, amount in missing.iterator(chunk_size=batch_size)
+    ]
+    DonationLedgerEntry.objects.bulk_create(entries, batch_size=batch_size, ignore_conflicts=True)
+    return len(entries)
+
+
+def reconcile_campaign_totals(campaign_ids=None, dry_run=False):
+    """Rebuild ``collected_amount`` from the ledger.
+
+    Campaigns without any ledger entry are left alone: their totals were
+    entered before the ledger existed (or by hand) and there is nothing to
+    rebuild them from. Returns a list of ``(campaign_id, stored, expected)``
+    tuples for every campaign whose stored total drifted from its ledger sum.
+    """
+    shards.compact(campaign_ids or None)
+    campaigns = Campaign.objects.all()
+    if campaign_ids:
+        campaigns = campaigns.filter(pk__in=campaign_ids)
+
+    ledger_totals = dict(
+        DonationLedgerEntry.objects.filter(campaign__in=campaigns)
+        .values('campaign_id')
+        .annotate(total=Sum('amount'))
+        .values_list('campaign_id', 'total')
+    )
+
+    drifted = []
+    for campaign_id, stored in campaigns.values_list('pk', 'collected_amount').iterator():
+        expected = ledger_totals.get(campaign_id)
+        if expected is not None and stored != expected:
+            drifted.append((campaign_id, stored, expected))
+
+    if not dry_run:
+        for campaign_id, _stored, expected in drifted:
+            Campaign.objects.filter(pk=campaign_id).update(collected_amount=expected)
+
+    return drifted
@@ -0,0 +1,197 @@
+"""
+Live campaign totals pushed to browsers over Server-Sent Events.
+
+When donations are recorded as paid, ``publish_campaign_totals`` sends each
+affected campaign's new ``collected_amount`` and ``donor_count`` (plus the
+amount just added) to a channel per campaign. The ``campaign_events`` view
+holds one asyncio queue per open connection, so an ASGI worker keeps
+thousands of streams open without a thread each.
+
+``LocalBroker`` fans messages out inside one process and is enough for a
+single worker and for tests. ``RedisBroker`` publishes through Redis and
+keeps one subscriber connection per process, which hands each message to
+that process's local subscribers. ``LIVE_UPDATES_BROKER`` selects the class.
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .models import Campaign
+from .shards import pending_totals
+
+logger = logging.getLogger(__name__)
+
+# Messages waiting per connection. The oldest are dropped first: each
+# message carries absolute totals, so a slow client only skips steps.
+SUBSCRIBER_QUEUE_SIZE = 16
+
+
+def campaign_channel(campaign_id):
+    return f'campaign:{campaign_id}'
+
+
+class Subscription:
+    """Messages for one subscriber, delivered onto its event loop."""
+
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def push(self, message):
+        """Queue ``message``; safe to call from any thread."""
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # The subscriber's loop has closed
+            self.broker.unsubscribe(self)
+
+    def _put(self, message):
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout=None):
+        """The next message, or ``None`` after ``timeout`` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """Publish/subscribe between the connections of this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, channel):
+        """Must be called from the subscriber's event loop."""
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def subscriber_count(self, channel=None):
+        with self._lock:
+            if channel is not None:
+                return len(self._subscribers.get(channel, ()))
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def publish(self, channel, message):
+        self._deliver(channel, message)
+
+    def _deliver(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.push(message)
+
+
+class RedisBroker(LocalBroker):
+    """Publish through Redis so every worker's subscribers receive each message."""
+
+    prefix = 'givegrip:live:'
+
+    def __init__(self, url=None):
+        super().__init__()
+        self.url = url or settings.LIVE_UPDATES_REDIS_URL
+        self._client = None
+        self._listeners = {}  # event loop -> listener task
+
+    def publish(self, channel, message):
+        import redis
+        if self._client is None:
+            self._client = redis.Redis.from_url(self.url)
+        self._client.publish(self.prefix + channel, json.dumps(message))
+
+    def subscribe(self, channel):
+        subscription = super().subscribe(channel)
+        loop = subscription.loop
+        task = self._listeners.get(loop)
+        if task is None or task.done():
+            self._listeners[loop] = loop.create_task(self._listen())
+        return subscription
+
+    async def _listen(self):
+        """Relay every live message from Redis to this process's subscribers."""
+        import redis.asyncio as aioredis
+        client = aioredis.from_url(self.url)
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.psubscribe(self.prefix + '*')
+            async for item in pubsub.listen():
+                channel = item['channel'].decode()[len(self.prefix):]
+                try:
+                    self._deliver(channel, json.loads(item['data']))
+                except ValueError:
+                    logger.warning('Ignoring malformed live update on %s', channel)
+        except Exception:
+            # The next subscriber restarts the listener
+            logger.exception('Live update listener stopped')
+        finally:
+            await pubsub.aclose()
+            await client.aclose()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.LIVE_UPDATES_BROKER)()
+    return _broker
+
+
+def campaign_totals(campaign_ids):
+    """The live payload of each campaign, keyed by campaign id."""
+    rows = list(Campaign.objects.filter(pk__in=campaign_ids).values_list(
+        'pk', 'collected_amount', 'goal_amount', 'donor_count', 'counter_shards'
+    ))
+    sharded = [row[0] for row in rows if row[4]]
+    pending = pending_totals(sharded) if sharded else {}
+    totals = {}
+    for pk, collected, goal, donors, _shards in rows:
+        if pk in pending:
+            collected += pending[pk]['amount']
+            donors += pending[pk]['donors']
+        progress = min(collected / goal * 100, 100) if goal > 0 else 0
+        totals[pk] = {
+            'collected_amount': str(collected),
+            'donor_count': donors,
+            'progress_percentage': round(float(progress), 1),
+        }
+    return totals
+
+
+def publish_campaign_totals(amounts):
+    """Push new totals for ``{campaign_id: amount just added}`` to live subscribers."""
+    for campaign_id, payload in campaign_totals(list(amounts)).items():
+        payload['amount_added'] = str(amounts[campaign_id])
+        try:
+            broker().publish(campaign_channel(campaign_id), payload)
+        except Exception:
+            # A live counter must never fail a payment
+            logger.exception('Could not publish live totals for campaign %s', campaign_id)
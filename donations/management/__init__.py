@@ -0,0 +1 @@
+# Management package for donations app
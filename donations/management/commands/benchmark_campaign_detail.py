@@ -0,0 +1,66 @@
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from donations.counters import campaign_counters
+from donations.models import Campaign
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Measure campaign detail page throughput with view tracking on and off'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--campaign', help='Campaign id to request (a temporary one is created otherwise)')
+        parser.add_argument('--repeat-visitor', action='store_true',
+                            help='Send every request from the same visitor so deduplication kicks in')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                campaign = self.get_campaign(options['campaign'])
+                url = reverse('main_campaigns:campaign_detail', kwargs={'pk': campaign.pk})
+                client = Client(HTTP_HOST='localhost')
+                client.get(url)  # warm up templates and caches
+
+                for tracking in (False, True):
+                    with override_settings(CAMPAIGN_VIEW_TRACKING=tracking):
+                        rate = self.run(client, url, options['requests'], options['repeat_visitor'])
+                    campaign_counters.flush()
+                    self.stdout.write(f"Tracking {'on ' if tracking else 'off'}: {rate:.0f} requests/s")
+
+                campaign.refresh_from_db(fields=['view_count'])
+                self.stdout.write(f'Views recorded: {campaign.view_count}')
+                raise Rollback
+        except Rollback:
+            pass
+
+    def get_campaign(self, campaign_id):
+        if campaign_id:
+            return Campaign.objects.get(pk=campaign_id)
+        creator, _ = User.objects.get_or_create(username='detail_bench', defaults={'email': 'detail_bench@example.com'})
+        now = timezone.now()
+        return Campaign.objects.create(
+            title='Detail benchmark', description='Benchmark campaign', goal_amount=Decimal('1000.00'),
+            creator=creator, status='active', start_date=now, end_date=now + timedelta(days=30),
+        )
+
+    def run(self, client, url, count, repeat_visitor):
+        started = time.perf_counter()
+        for i in range(count):
+            address = '10.0.0.1' if repeat_visitor else f'10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}'
+            client.get(url, REMOTE_ADDR=address)
+        return count / (time.perf_counter() - started)
@@ -0,0 +1,102 @@
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, transaction
+from django.utils import timezone
+
+from donations.ledger import record_paid_donations
+from donations.models import Campaign, Donation
+from donations.shards import compact
+from givegrip.transitions import transition
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Measure concurrent paid-donation throughput on one campaign with and without counter shards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', default='1,8,64', help='Comma-separated numbers of concurrent writers')
+        parser.add_argument('--donations', type=int, default=2000, help='Donations recorded per run')
+        parser.add_argument('--shards', type=int, default=16)
+        parser.add_argument('--hold-ms', type=float, default=0.0,
+                            help='Extra time each payment transaction keeps its locks, like a slower checkout')
+
+    def handle(self, *args, **options):
+        writer_counts = [int(value) for value in options['writers'].split(',')]
+        if connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING(
+                'SQLite lets one transaction write at a time, so both modes measure the same lock; '
+                'run this against PostgreSQL for meaningful numbers.'
+            ))
+        donors = [
+            User.objects.get_or_create(username=f'shard_bench_{i}', defaults={'email': f'shard_bench_{i}@example.com'})[0]
+            for i in range(max(writer_counts))
+        ]
+
+        for shards in (0, options['shards']):
+            label = f'{shards} shards' if shards else 'campaign row'
+            for writers in writer_counts:
+                campaign = self.create_campaign(donors[0], shards)
+                try:
+                    rate = self.run(campaign, donors[:writers], options['donations'], options['hold_ms'] / 1000)
+                    compact([campaign.pk])
+                    campaign.refresh_from_db(fields=['collected_amount'])
+                    expected = Decimal(options['donations'])
+                    check = '✓' if campaign.collected_amount == expected else f'✗ total {campaign.collected_amount}, expected {expected}'
+                    self.stdout.write(f'{label:>12}, {writers:>3} writer(s): {rate:8.0f} donations/s {check}')
+                finally:
+                    campaign.delete()
+
+    def create_campaign(self, creator, shards):
+        now = timezone.now()
+        return Campaign.objects.create(
+            title='Counter shard benchmark', description='Benchmark campaign', goal_amount=Decimal('1000000.00'),
+            creator=creator, status='active', start_date=now, end_date=now + timedelta(days=30),
+            counter_shards=shards,
+        )
+
+    def pay(self, donation, hold):
+        try:
+            with transaction.atomic():
+                record_paid_donations(transition(Donation.objects.filter(pk=donation.pk), 'paid'))
+                if hold:
+                    time.sleep(hold)
+            return True
+        except OperationalError:
+            # SQLite aborts a writer that would deadlock on its database lock; retry it
+            if connection.vendor != 'sqlite':
+                raise
+            return False
+
+    def run(self, campaign, donors, count, hold):
+        donations = Donation.objects.bulk_create([
+            Donation(campaign=campaign, donor=donors[i % len(donors)], amount=Decimal('1.00'), status='pending')
+            for i in range(count)
+        ])
+        errors = []
+
+        def write(batch):
+            try:
+                for donation in batch:
+                    while not self.pay(donation, hold):
+                        pass
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=write, args=(donations[i::len(donors)],)) for i in range(len(donors))]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        if errors:
+            raise errors[0]
+        return count / elapsed
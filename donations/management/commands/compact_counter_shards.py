@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from donations.shards import compact
+
+
+class Command(BaseCommand):
+    help = 'Fold sharded campaign counters back into their campaigns'
+
+    def add_arguments(self, parser):
+        parser.add_argument('campaign_ids', nargs='*', help='Only compact these campaigns')
+
+    def handle(self, *args, **options):
+        folded = compact(options['campaign_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(f'✓ Compacted counters of {folded} campaign(s)'))
@@ -0,0 +1,30 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from donations.recommendations import rebuild_recommendations, refresh_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Precompute the "donors like you also supported" campaigns shown on the dashboard'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--n', type=int, help='Campaigns to keep per donor (default DONOR_RECOMMENDATIONS_N)')
+        parser.add_argument(
+            '--since-minutes', type=int,
+            help='Only rescore donors with paid donations in the last N minutes',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['since_minutes']:
+            since = timezone.now() - timedelta(minutes=options['since_minutes'])
+            self.stdout.write(f'Rescoring donors active since {since:%Y-%m-%d %H:%M}...')
+            donors, rows = refresh_recommendations(since, n=options['n'])
+        else:
+            self.stdout.write('Rescoring all donors...')
+            donors, rows = rebuild_recommendations(n=options['n'])
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Stored {rows} recommendation(s) for {donors} donor(s) in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+from donations.similarity import compute_similarities
+
+
+class Command(BaseCommand):
+    help = 'Precompute the similar campaigns shown on each campaign page'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, help='Neighbours to keep per campaign (default SIMILAR_CAMPAIGNS_K)')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Computing similar campaigns...')
+        started = time.perf_counter()
+        count = compute_similarities(k=options['k'])
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Stored {count} neighbour(s) in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from donations.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the donor and campaign donation snapshots from paid donations'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding donation stats...')
+        donors, campaigns = rebuild_stats()
+        self.stdout.write(self.style.SUCCESS(f'✓ Rebuilt stats for {donors} donor(s) and {campaigns} campaign(s)'))
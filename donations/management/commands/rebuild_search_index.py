@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from donations.search import backend, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text campaign search index'
+
+    def handle(self, *args, **options):
+        if backend() != 'sqlite':
+            self.stdout.write(self.style.SUCCESS('✓ Search uses an expression index here; nothing to rebuild'))
+            return
+        self.stdout.write('Rebuilding campaign search index...')
+        count = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'✓ Indexed {count} campaign(s)'))
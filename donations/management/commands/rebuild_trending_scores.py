@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from donations.trending import rebase_scores, rebuild_scores
+
+
+class Command(BaseCommand):
+    help = 'Recompute trending scores from recent paid donations, or move the decay landmark'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebase', metavar='LANDMARK',
+            help='Rescale stored scores to a new landmark (ISO datetime) instead of rebuilding',
+        )
+
+    def handle(self, *args, **options):
+        if options['rebase']:
+            landmark = parse_datetime(options['rebase'])
+            if landmark is None:
+                raise CommandError(f"Invalid landmark {options['rebase']!r}")
+            if timezone.is_naive(landmark):
+                landmark = timezone.make_aware(landmark)
+            count = rebase_scores(landmark)
+            self.stdout.write(self.style.SUCCESS(
+                f'✓ Rebased {count} campaign score(s) to {landmark.isoformat()}'
+            ))
+            return
+
+        self.stdout.write('Rebuilding trending scores...')
+        count = rebuild_scores()
+        self.stdout.write(self.style.SUCCESS(f'✓ Scored {count} campaign(s) with recent donations'))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from donations.counters import rebuild_campaign_donors
+from donations.ledger import backfill_ledger, reconcile_campaign_totals
+
+
+class Command(BaseCommand):
+    help = 'Reconcile campaign collected amounts against the donation ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument('campaign_ids', nargs='*', help='Only reconcile these campaigns')
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without fixing it')
+        parser.add_argument('--backfill', action='store_true', help='Add ledger entries for paid donations missing one first')
+        parser.add_argument('--donors', action='store_true', help='Also rebuild the donor seen-set and donor counts')
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            created = backfill_ledger()
+            self.stdout.write(f'Backfilled {created} ledger entries')
+
+        drifted = reconcile_campaign_totals(
+            campaign_ids=options['campaign_ids'],
+            dry_run=options['dry_run'],
+        )
+
+        if options['donors'] and not options['dry_run']:
+            campaigns = rebuild_campaign_donors()
+            self.stdout.write(f'Rebuilt donor counts for {campaigns} campaign(s)')
+
+        for campaign_id, stored, expected in drifted:
+            self.stdout.write(f'{campaign_id}: stored {stored}, ledger {expected}')
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('✓ All campaign totals match the ledger'))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'{len(drifted)} campaign(s) drifted (dry run, nothing changed)'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'✓ Reconciled {len(drifted)} campaign(s)'))
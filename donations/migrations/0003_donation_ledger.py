@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donations', '0002_alter_campaign_currency_alter_donation_currency'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DonationLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='donations.campaign')),
+                ('donation', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entry', to='donations.donation')),
+            ],
+            options={
+                'verbose_name': 'Donation Ledger Entry',
+                'verbose_name_plural': 'Donation Ledger Entries',
+                'db_table': 'donations_ledger_entry',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('donations', '0003_donation_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CampaignDonor',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='campaign_donors', to='donations.campaign')),
+                ('donor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='supported_campaigns', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Campaign Donor',
+                'verbose_name_plural': 'Campaign Donors',
+                'db_table': 'donations_campaign_donor',
+                'unique_together': {('campaign', 'donor')},
+            },
+        ),
+    ]
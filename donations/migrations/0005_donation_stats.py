@@ -0,0 +1,49 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:04
+
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('donations', '0004_campaign_donor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CampaignStats',
+            fields=[
+                ('campaign', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='donations.campaign')),
+                ('donation_count', models.PositiveIntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('largest_donation', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('last_donation_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Campaign Stats',
+                'verbose_name_plural': 'Campaign Stats',
+                'db_table': 'donations_campaign_stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='DonorStats',
+            fields=[
+                ('donor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='donation_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('donation_count', models.PositiveIntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('campaigns_supported', models.PositiveIntegerField(default=0)),
+                ('last_donation_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Donor Stats',
+                'verbose_name_plural': 'Donor Stats',
+                'db_table': 'donations_donor_stats',
+            },
+        ),
+    ]
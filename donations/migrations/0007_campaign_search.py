@@ -0,0 +1,47 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:11
+
+from django.db import migrations
+
+# Copied from donations.search as it was when this migration was written;
+# migrations must not import code that may change after them.
+FTS_TABLE = 'donations_campaign_fts'
+PG_INDEX = 'campaign_search_idx'
+PG_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(\"donations_campaign\".\"title\", '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(\"donations_campaign\".\"description\", '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(\"donations_campaign\".\"story\", '')), 'C')"
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {PG_INDEX} ON donations_campaign USING gin (({PG_VECTOR}))')
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+            "campaign_id UNINDEXED, title, description, story, prefix='2 3', tokenize='porter unicode61')"
+        )
+        schema_editor.execute(
+            f'INSERT INTO {FTS_TABLE} (campaign_id, title, description, story) '
+            'SELECT id, title, description, story FROM donations_campaign'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {PG_INDEX}')
+    elif vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donations', '0006_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
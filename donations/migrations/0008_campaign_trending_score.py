@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donations', '0007_campaign_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='trending_score',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddIndex(
+            model_name='campaign',
+            index=models.Index(fields=['status', '-trending_score'], name='campaign_status_trending_idx'),
+        ),
+    ]
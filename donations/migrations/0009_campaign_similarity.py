@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donations', '0008_campaign_trending_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CampaignSimilarity',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_entries', to='donations.campaign')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='donations.campaign')),
+            ],
+            options={
+                'verbose_name': 'Campaign Similarity',
+                'verbose_name_plural': 'Campaign Similarities',
+                'db_table': 'donations_campaign_similarity',
+                'ordering': ['campaign', 'rank'],
+                'unique_together': {('campaign', 'rank')},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('donations', '0009_campaign_similarity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DonorRecommendation',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='donations.campaign')),
+                ('donor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Donor Recommendation',
+                'verbose_name_plural': 'Donor Recommendations',
+                'db_table': 'donations_donor_recommendation',
+                'ordering': ['donor', 'rank'],
+                'unique_together': {('donor', 'rank')},
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:42
+
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donations', '0010_donor_recommendation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='counter_shards',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Number of counter shards for very busy campaigns (0 = off)'),
+        ),
+        migrations.CreateModel(
+            name='CampaignCounterShard',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('collected_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('donor_count', models.PositiveIntegerField(default=0)),
+                ('trending_score', models.FloatField(default=0.0)),
+                ('donation_count', models.PositiveIntegerField(default=0)),
+                ('largest_donation', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('last_donation_at', models.DateTimeField(blank=True, null=True)),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counter_shard_rows', to='donations.campaign')),
+            ],
+            options={
+                'verbose_name': 'Campaign Counter Shard',
+                'verbose_name_plural': 'Campaign Counter Shards',
+                'db_table': 'donations_campaign_counter_shard',
+                'unique_together': {('campaign', 'shard')},
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donations', '0013_donation_status_created_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingLandmark',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('landmark', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Trending Landmark',
+                'verbose_name_plural': 'Trending Landmark',
+                'db_table': 'donations_trending_landmark',
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:25
+
+from django.db import migrations
+
+
+def backfill_ledger(apps, schema_editor):
+    """Give every paid donation made before the ledger existed its ledger entry."""
+    Donation = apps.get_model('donations', 'Donation')
+    DonationLedgerEntry = apps.get_model('donations', 'DonationLedgerEntry')
+    missing = (
+        Donation.objects.filter(status='paid', ledger_entry__isnull=True)
+        .values_list('pk', 'campaign_id', 'amount')
+    )
+    entries = [
+        DonationLedgerEntry(donation_id=pk, campaign_id=campaign_id, amount=amount)
+        for pk, campaign_id, amount in missing.iterator(chunk_size=1000)
+    ]
+    DonationLedgerEntry.objects.bulk_create(entries, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donations', '0014_trending_landmark'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:40
+
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Count, Max, Sum
+
+
+def backfill_stats(apps, schema_editor):
+    """Snapshot every donor and campaign, including donations paid before the snapshots existed."""
+    Donation = apps.get_model('donations', 'Donation')
+    DonorStats = apps.get_model('donations', 'DonorStats')
+    CampaignStats = apps.get_model('donations', 'CampaignStats')
+    CampaignCounterShard = apps.get_model('donations', 'CampaignCounterShard')
+    paid = Donation.objects.filter(status='paid').order_by()
+    DonorStats.objects.all().delete()
+    CampaignStats.objects.all().delete()
+
+    DonorStats.objects.bulk_create([
+        DonorStats(
+            donor_id=row['donor_id'], donation_count=row['count'], total_amount=row['total'] or Decimal('0.00'),
+            campaigns_supported=row['campaigns'], last_donation_at=row['last'],
+        )
+        for row in paid.values('donor_id').annotate(
+            count=Count('id'), total=Sum('amount'), campaigns=Count('campaign_id', distinct=True),
+            last=Max('updated_at'),
+        )
+    ], batch_size=1000)
+    # Increments still pending in shards are added to the snapshot when they are folded
+    pending = {
+        row['campaign_id']: row
+        for row in CampaignCounterShard.objects.order_by().values('campaign_id').annotate(
+            count=Sum('donation_count'), total=Sum('collected_amount'),
+        )
+    }
+    no_pending = {'count': 0, 'total': Decimal('0.00')}
+    CampaignStats.objects.bulk_create([
+        CampaignStats(
+            campaign_id=row['campaign_id'],
+            donation_count=row['count'] - pending.get(row['campaign_id'], no_pending)['count'],
+            total_amount=(row['total'] or Decimal('0.00')) - pending.get(row['campaign_id'], no_pending)['total'],
+            largest_donation=row['largest'] or Decimal('0.00'), last_donation_at=row['last'],
+        )
+        for row in paid.values('campaign_id').annotate(
+            count=Count('id'), total=Sum('amount'), largest=Max('amount'), last=Max('updated_at'),
+        )
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donations', '0016_donation_pending_status'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
@@ -1,14 +1,66 @@
 from django.db import models
+from django.db.models import Case, ExpressionWrapper, F, Value, When
+from django.db.models.functions import Cast, Greatest, Least
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.urls import reverse
+from givegrip.transitions import StatusTransitionMixin
 from decimal import Decimal
 import uuid
 
 User = get_user_model()
 
 
+class DaysUntil(models.Func):
+    """Whole days from ``now`` until a datetime expression, negative once it has passed."""
+    
+    output_field = models.IntegerField()
+    
+    def __init__(self, expression, now, **extra):
+        super().__init__(expression, Value(now, output_field=models.DateTimeField()), **extra)
+    
+    def as_sql(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection,
+            template='CAST(EXTRACT(DAY FROM (%(expressions)s)) AS integer)', arg_joiner=' - ',
+            **extra_context
+        )
+    
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection,
+            template='CAST(julianday(%(expressions)s) AS integer)', arg_joiner=') - julianday(',
+            **extra_context
+        )
+
+
+class CampaignQuerySet(models.QuerySet):
+    
+    def with_progress(self, now=None):
+        """Annotate ``progress_percentage`` and ``days_remaining`` in SQL.
+        
+        The annotations take the place of the model's computed properties,
+        so templates, the admin and serializers read them unchanged.
+        """
+        now = now or timezone.now()
+        # Divide as floats: SQLite stores whole amounts as integers
+        ratio = ExpressionWrapper(
+            Cast(F('collected_amount'), models.FloatField()) * 100 / F('goal_amount'),
+            output_field=models.FloatField(),
+        )
+        percentage = models.DecimalField(max_digits=5, decimal_places=2)
+        return self.annotate(
+            progress_percentage=Case(
+                When(goal_amount__gt=0, then=Cast(Least(ratio, Value(100.0)), percentage)),
+                default=Value(Decimal('0')),
+                output_field=percentage,
+            ),
+            days_remaining=Greatest(DaysUntil(F('end_date'), now), Value(0)),
+        )
+
+
 class Campaign(models.Model):
     """Campaign model for fundraising campaigns."""
     
@@ -52,16 +104,30 @@ class Campaign(models.Model):
     view_count = models.PositiveIntegerField(default=0)
     share_count = models.PositiveIntegerField(default=0)
     donor_count = models.PositiveIntegerField(default=0)
+    # Forward-decayed activity score, see donations.trending
+    trending_score = models.FloatField(default=0.0)
+    # Spread paid-donation counters over this many rows, see donations.shards
+    counter_shards = models.PositiveSmallIntegerField(
+        default=0, help_text='Number of counter shards for very busy campaigns (0 = off)'
+    )
     
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = CampaignQuerySet.as_manager()
+    
     class Meta:
         verbose_name = _('Campaign')
         verbose_name_plural = _('Campaigns')
         db_table = 'donations_campaign'
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of the public campaign list
+            models.Index(fields=['status', '-created_at', '-id'], name='campaign_status_created_idx'),
+            # Top-N trending campaigns
+            models.Index(fields=['status', '-trending_score'], name='campaign_status_trending_idx'),
+        ]
     
     def __str__(self):
         return self.title
@@ -69,26 +135,49 @@ class Campaign(models.Model):
     def get_absolute_url(self):
         return reverse('campaigns:campaign_detail', kwargs={'pk': self.pk})
     
+    # Both read the annotations of ``with_progress()`` when the campaign was
+    # loaded through it, as long as the fields they were computed from are
+    # unchanged (a refresh_from_db after an F() update changes them), and are
+    # computed from the fields otherwise.
+    
+    def _annotation(self, name, *fields):
+        annotated = self.__dict__.get(f'_annotated_{name}')
+        if annotated is not None and annotated[0] == fields:
+            return annotated[1]
+        return None
+    
     @property
     def progress_percentage(self):
         """Calculate campaign progress as percentage."""
+        annotated = self._annotation('progress_percentage', self.collected_amount, self.goal_amount)
+        if annotated is not None:
+            return annotated
         if self.goal_amount > 0:
             return min((self.collected_amount / self.goal_amount) * 100, 100)
         return 0
     
+    @progress_percentage.setter
+    def progress_percentage(self, value):
+        self._annotated_progress_percentage = ((self.collected_amount, self.goal_amount), value)
+    
     @property
     def days_remaining(self):
         """Calculate days remaining in campaign."""
-        from django.utils import timezone
+        annotated = self._annotation('days_remaining', self.end_date)
+        if annotated is not None:
+            return annotated
         now = timezone.now()
         if now < self.end_date:
             return (self.end_date - now).days
         return 0
     
+    @days_remaining.setter
+    def days_remaining(self, value):
+        self._annotated_days_remaining = ((self.end_date,), value)
+    
     @property
     def is_active_campaign(self):
         """Check if campaign is currently active."""
-        from django.utils import timezone
         now = timezone.now()
         return (self.status == 'active' and 
                 self.start_date <= now <= self.end_date)
@@ -102,16 +191,26 @@ class Campaign(models.Model):
         self.collected_amount = total_paid
 
 
-class Donation(models.Model):
+class Donation(StatusTransitionMixin, models.Model):
     """Donation model for tracking all donations."""
     
     STATUS_CHOICES = [
         ('created', 'Created'),
+        # Sent to the gateway, waiting for the payment
+        ('pending', 'Pending'),
         ('paid', 'Paid'),
         ('failed', 'Failed'),
         ('cancelled', 'Cancelled'),
     ]
     
+    # Target status -> statuses it may be reached from (see givegrip.transitions).
+    # A capture always wins, even after a failed attempt; nothing leaves paid.
+    STATUS_TRANSITIONS = {
+        'paid': ('created', 'pending', 'failed', 'cancelled'),
+        'failed': ('created', 'pending'),
+        'cancelled': ('created', 'pending'),
+    }
+    
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='donations')
     donor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='donations')
@@ -142,6 +241,12 @@ class Donation(models.Model):
         verbose_name_plural = _('Donations')
         db_table = 'donations_donation'
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of a donor's history
+            models.Index(fields=['donor', '-created_at', '-id'], name='donation_donor_created_idx'),
+            # Keyset walk of abandoned donations by the stale order sweeper
+            models.Index(fields=['status', 'created_at', 'id'], name='donation_status_created_idx'),
+        ]
     
     def __str__(self):
         return f"Donation {self.id} - {self.amount} {self.currency}"
@@ -153,10 +258,10 @@ class Donation(models.Model):
         
         super().save(*args, **kwargs)
         
-        # Update campaign collected amount when donation is paid
-        if self.status == 'paid':
-            self.campaign.collected_amount += self.amount
-            self.campaign.save(update_fields=['collected_amount'])
+        # Count the donation towards the campaign total exactly once
+        if self.status_changed and self.status == 'paid':
+            from .ledger import record_paid_donation
+            record_paid_donation(self)
     
     @property
     def display_name(self):
@@ -166,4 +271,203 @@ class Donation(models.Model):
         return self.donor.display_name
 
 
+class DonationLedgerEntry(models.Model):
+    """Append-only record of every donation counted towards a campaign total.
+    
+    The one-to-one link to the donation makes counting idempotent: a second
+    attempt to record the same paid donation fails on the unique key instead
+    of incrementing the campaign again.
+    """
+    
+    id = models.BigAutoField(primary_key=True)
+    donation = models.OneToOneField(Donation, on_delete=models.CASCADE, related_name='ledger_entry')
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='ledger_entries')
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = _('Donation Ledger Entry')
+        verbose_name_plural = _('Donation Ledger Entries')
+        db_table = 'donations_ledger_entry'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"Ledger {self.donation_id} - {self.amount}"
+
+
+class IdempotencyKey(models.Model):
+    """Stored response of a request made with an idempotency key, replayed to its retries."""
+    
+    id = models.BigAutoField(primary_key=True)
+    # Digest of the user, path and client key
+    key = models.CharField(max_length=64, unique=True)
+    # Digest of the request parameters, so a key cannot be reused for another request
+    fingerprint = models.CharField(max_length=64)
+    response_status = models.PositiveSmallIntegerField()
+    response_content_type = models.CharField(max_length=100)
+    response_body = models.BinaryField()
+    
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        verbose_name = _('Idempotency Key')
+        verbose_name_plural = _('Idempotency Keys')
+        db_table = 'donations_idempotency_key'
+    
+    def __str__(self):
+        return f"Idempotency key {self.key[:12]}"
+
 
+class CampaignDonor(models.Model):
+    """Seen-set of (campaign, donor) pairs used to maintain ``Campaign.donor_count``."""
+    
+    id = models.BigAutoField(primary_key=True)
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='campaign_donors')
+    donor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='supported_campaigns')
+    
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = _('Campaign Donor')
+        verbose_name_plural = _('Campaign Donors')
+        db_table = 'donations_campaign_donor'
+        unique_together = [('campaign', 'donor')]
+    
+    def __str__(self):
+        return f"{self.donor_id} -> {self.campaign_id}"
+
+
+class DonorStats(models.Model):
+    """Snapshot of a donor's paid donations, maintained on the paid transition."""
+    
+    donor = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='donation_stats')
+    donation_count = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    campaigns_supported = models.PositiveIntegerField(default=0)
+    last_donation_at = models.DateTimeField(null=True, blank=True)
+    
+    # Timestamps
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = _('Donor Stats')
+        verbose_name_plural = _('Donor Stats')
+        db_table = 'donations_donor_stats'
+    
+    def __str__(self):
+        return f"Stats for {self.donor_id}"
+    
+    @classmethod
+    def for_donor(cls, donor):
+        """Get the donor's snapshot, or an empty unsaved one if they never donated."""
+        try:
+            return cls.objects.get(donor=donor)
+        except cls.DoesNotExist:
+            return cls(donor=donor)
+
+
+class CampaignStats(models.Model):
+    """Snapshot of a campaign's paid donations, maintained on the paid transition."""
+    
+    campaign = models.OneToOneField(Campaign, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    donation_count = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    largest_donation = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    last_donation_at = models.DateTimeField(null=True, blank=True)
+    
+    # Timestamps
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = _('Campaign Stats')
+        verbose_name_plural = _('Campaign Stats')
+        db_table = 'donations_campaign_stats'
+    
+    def __str__(self):
+        return f"Stats for {self.campaign_id}"
+
+
+class CampaignCounterShard(models.Model):
+    """Paid-donation counter increments of a sharded campaign not yet folded into it."""
+    
+    id = models.BigAutoField(primary_key=True)
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='counter_shard_rows')
+    shard = models.PositiveSmallIntegerField()
+    collected_amount = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    donor_count = models.PositiveIntegerField(default=0)
+    trending_score = models.FloatField(default=0.0)
+    donation_count = models.PositiveIntegerField(default=0)
+    largest_donation = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    last_donation_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = _('Campaign Counter Shard')
+        verbose_name_plural = _('Campaign Counter Shards')
+        db_table = 'donations_campaign_counter_shard'
+        unique_together = [('campaign', 'shard')]
+    
+    def __str__(self):
+        return f"{self.campaign_id} shard {self.shard}"
+
+
+class TrendingLandmark(models.Model):
+    """The time trending scores are currently stored relative to (single row, see ``donations.trending``)."""
+    
+    id = models.BigAutoField(primary_key=True)
+    landmark = models.DateTimeField()
+    
+    # Timestamps
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = _('Trending Landmark')
+        verbose_name_plural = _('Trending Landmark')
+        db_table = 'donations_trending_landmark'
+    
+    def __str__(self):
+        return f"Trending landmark {self.landmark.isoformat()}"
+
+
+class CampaignSimilarity(models.Model):
+    """Precomputed nearest neighbours of a campaign, refreshed by a batch job."""
+    
+    id = models.BigAutoField(primary_key=True)
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='similar_entries')
+    similar = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    
+    class Meta:
+        verbose_name = _('Campaign Similarity')
+        verbose_name_plural = _('Campaign Similarities')
+        db_table = 'donations_campaign_similarity'
+        unique_together = [('campaign', 'rank')]
+        ordering = ['campaign', 'rank']
+    
+    def __str__(self):
+        return f"{self.campaign_id} ~ {self.similar_id} ({self.score:.3f})"
+
+
+class DonorRecommendation(models.Model):
+    """Precomputed "donors like you also supported" campaigns for a donor."""
+    
+    id = models.BigAutoField(primary_key=True)
+    donor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recommendations')
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    
+    class Meta:
+        verbose_name = _('Donor Recommendation')
+        verbose_name_plural = _('Donor Recommendations')
+        db_table = 'donations_donor_recommendation'
+        unique_together = [('donor', 'rank')]
+        ordering = ['donor', 'rank']
+    
+    def __str__(self):
+        return f"{self.donor_id} -> {self.campaign_id} ({self.score:.3f})"
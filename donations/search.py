@@ -0,0 +1,127 @@
+"""
+Full-text campaign search.
+
+On PostgreSQL campaigns are matched against a weighted ``tsvector`` over
+title (A), description (B) and story (C), served by a GIN expression index
+on exactly that expression, and ranked with ``ts_rank_cd``. On SQLite the
+same columns are mirrored into an FTS5 table (``donations_campaign_fts``),
+kept in sync by the ``Campaign`` save/delete signals, and ranked with
+``bm25``. Other backends fall back to ``icontains`` without ranking.
+
+The index itself is created by migration ``0007_campaign_search``;
+``rebuild_index`` recreates the FTS5 rows from scratch.
+"""
+import re
+import uuid
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from .models import Campaign
+
+FTS_TABLE = 'donations_campaign_fts'
+
+# Must stay identical to the expression indexed by migration 0007 for the GIN index to be used
+PG_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(\"donations_campaign\".\"title\", '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(\"donations_campaign\".\"description\", '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(\"donations_campaign\".\"story\", '')), 'C')"
+)
+
+# Relative weight of title, description and story hits for bm25
+FTS_WEIGHTS = (10.0, 4.0, 1.0)
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def backend(conn=None):
+    vendor = (conn or connection).vendor
+    if vendor in ('postgresql', 'sqlite'):
+        return vendor
+    return None
+
+
+def _terms(query, limit=8):
+    return TERM_RE.findall(query.lower())[:limit]
+
+
+def _fts_match(terms):
+    """Quote every term so user input can never be read as FTS5 syntax."""
+    return ' '.join(f'"{term}"' for term in terms)
+
+
+def search_campaigns(query, category=None, status='active', limit=20):
+    """Campaigns matching ``query``, best match first."""
+    terms = _terms(query)
+    if not terms:
+        return []
+
+    campaigns = Campaign.objects.with_progress()
+    if status:
+        campaigns = campaigns.filter(status=status)
+    if category:
+        campaigns = campaigns.filter(category__iexact=category)
+
+    vendor = backend()
+    if vendor == 'postgresql':
+        tsquery = "websearch_to_tsquery('english', %s)"
+        return list(
+            campaigns.filter(RawSQL(f'{PG_VECTOR} @@ {tsquery}', [query], output_field=BooleanField()))
+            .annotate(rank=RawSQL(f'ts_rank_cd({PG_VECTOR}, {tsquery})', [query], output_field=FloatField()))
+            .order_by('-rank', '-created_at')[:limit]
+        )
+    if vendor == 'sqlite':
+        return _fts_lookup(campaigns, _fts_match(terms), limit)
+
+    condition = Q()
+    for term in terms:
+        condition &= Q(title__icontains=term) | Q(description__icontains=term) | Q(story__icontains=term)
+    return list(campaigns.filter(condition)[:limit])
+
+
+def _fts_lookup(campaigns, match, limit):
+    """Rank the FTS5 hits among ``campaigns``, then load the best ``limit`` of them."""
+    # The queryset's filters (status, category) become a subquery, so the LIMIT applies after them
+    candidates, params = campaigns.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT campaign_id FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND campaign_id IN ({candidates}) '
+            f'ORDER BY bm25({FTS_TABLE}, 0, %s, %s, %s) LIMIT %s',
+            [match, *params, *FTS_WEIGHTS, limit],
+        )
+        ranked = [uuid.UUID(row[0]) for row in cursor.fetchall()]
+    found = campaigns.in_bulk(ranked)
+    return [found[pk] for pk in ranked if pk in found]
+
+
+def index_campaign(campaign):
+    """Upsert one campaign's row in the FTS5 table."""
+    if backend() != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE campaign_id = %s', [campaign.pk.hex])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (campaign_id, title, description, story) VALUES (%s, %s, %s, %s)',
+            [campaign.pk.hex, campaign.title, campaign.description, campaign.story],
+        )
+
+
+def remove_campaign(campaign_id):
+    if backend() != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE campaign_id = %s', [campaign_id.hex])
+
+
+def rebuild_index():
+    """Refill the FTS5 table from the campaign table. Returns the rows indexed."""
+    if backend() != 'sqlite':
+        return Campaign.objects.count()
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (campaign_id, title, description, story) '
+            'SELECT id, title, description, story FROM donations_campaign'
+        )
+        return cursor.rowcount
@@ -4,25 +4,17 @@ from .models import Campaign, Donation
 
 class CampaignSerializer(serializers.ModelSerializer):
     creator_name = serializers.CharField(source='creator.get_full_name', read_only=True)
+    # Read from the ``with_progress()`` annotations when present
     progress_percentage = serializers.SerializerMethodField()
-    days_remaining = serializers.SerializerMethodField()
+    days_remaining = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Campaign
         fields = '__all__'
-        read_only_fields = ['collected_amount', 'view_count', 'share_count', 'donor_count', 'created_at', 'updated_at']
+        read_only_fields = ['collected_amount', 'view_count', 'share_count', 'donor_count', 'trending_score', 'created_at', 'updated_at']
     
     def get_progress_percentage(self, obj):
-        if obj.goal_amount > 0:
-            return round((obj.collected_amount / obj.goal_amount) * 100, 1)
-        return 0
-    
-    def get_days_remaining(self, obj):
-        from django.utils import timezone
-        if obj.end_date:
-            remaining = obj.end_date - timezone.now().date()
-            return max(0, remaining.days)
-        return None
+        return round(float(obj.progress_percentage), 1)
 
 
 class DonationSerializer(serializers.ModelSerializer):
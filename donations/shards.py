@@ -0,0 +1,181 @@
+"""
+Sharded paid-donation counters for very busy campaigns.
+
+Each paid donation normally updates its campaign row (``collected_amount``,
+``donor_count``, ``trending_score``) and its ``CampaignStats`` row inside the
+payment transaction. Concurrent checkouts for one campaign therefore queue
+on those two row locks. When a campaign has ``counter_shards`` set to N, its
+increments go to one of N ``CampaignCounterShard`` rows instead. The shard
+is picked from the donation id, which is random. That spreads payments
+evenly over the N rows, and keeps every counter of one payment on the same
+row, so a transaction never holds two shard locks of one campaign.
+
+``compact`` folds the shards back into the campaign and stats rows. The
+``compact_counter_shards`` task runs it every
+``COUNTER_SHARDS_COMPACT_INTERVAL`` seconds. In between, pages call
+``with_pending`` to add the shard sums to the folded values. The trending
+list is ordered by the folded score only.
+"""
+import threading
+import time
+
+from django.db import transaction
+from django.db.models import F, Max, Q, Sum, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Campaign, CampaignCounterShard, CampaignStats
+
+# Writers re-read a campaign's shard count at most this often (seconds)
+FLAG_TTL = 5.0
+MAX_FLAGS = 10000
+
+# Shard rows holding increments that have not been folded yet
+PENDING = (
+    ~Q(collected_amount=0) | Q(donor_count__gt=0) | ~Q(trending_score=0) | Q(donation_count__gt=0)
+)
+
+_flags = {}  # campaign id -> (shard count, monotonic time read)
+_flags_lock = threading.Lock()
+
+
+def counter_shards(campaign_ids):
+    """``{campaign_id: shard count}`` for the sharded campaigns among ``campaign_ids``."""
+    now = time.monotonic()
+    sharded, missing = {}, []
+    with _flags_lock:
+        for campaign_id in campaign_ids:
+            entry = _flags.get(campaign_id)
+            if entry is None or now - entry[1] > FLAG_TTL:
+                missing.append(campaign_id)
+            elif entry[0]:
+                sharded[campaign_id] = entry[0]
+    if missing:
+        found = dict(Campaign.objects.filter(pk__in=missing).values_list('pk', 'counter_shards'))
+        with _flags_lock:
+            if len(_flags) > MAX_FLAGS:
+                _flags.clear()
+            for campaign_id in missing:
+                shards = found.get(campaign_id, 0)
+                _flags[campaign_id] = (shards, now)
+                if shards:
+                    sharded[campaign_id] = shards
+    return sharded
+
+
+def forget(campaign_id):
+    """Drop this process's copy of a campaign's shard count."""
+    with _flags_lock:
+        _flags.pop(campaign_id, None)
+
+
+def shards_for(donations):
+    """``{campaign_id: shard}`` for the sharded campaigns among ``donations``."""
+    sharded = counter_shards({donation.campaign_id for donation in donations})
+    chosen = {}
+    for donation in donations:
+        shards = sharded.get(donation.campaign_id)
+        if shards and donation.campaign_id not in chosen:
+            chosen[donation.campaign_id] = donation.pk.int % shards
+    return chosen
+
+
+def add(campaign_id, shard, **deltas):
+    """Add ``deltas`` (field name -> increment) to one shard of a campaign.
+
+    ``largest_donation`` keeps the maximum and ``last_donation_at`` is
+    overwritten. The shard row is created on first use.
+    """
+    updates = {}
+    for field, value in deltas.items():
+        if field == 'largest_donation':
+            updates[field] = Greatest(F(field), Value(value))
+        elif field == 'last_donation_at':
+            updates[field] = value
+        else:
+            updates[field] = F(field) + value
+    rows = CampaignCounterShard.objects.filter(campaign_id=campaign_id, shard=shard)
+    if not rows.update(**updates):
+        CampaignCounterShard.objects.bulk_create(
+            [CampaignCounterShard(campaign_id=campaign_id, shard=shard)], ignore_conflicts=True
+        )
+        rows.update(**updates)
+
+
+def pending_totals(campaign_ids):
+    """Unfolded shard sums, ``{campaign_id: {...}}``, of the campaigns that have any."""
+    rows = (
+        CampaignCounterShard.objects.filter(PENDING, campaign_id__in=campaign_ids)
+        .values('campaign_id')
+        .annotate(
+            amount=Sum('collected_amount'),
+            donors=Sum('donor_count'),
+            score=Sum('trending_score'),
+            donations=Sum('donation_count'),
+            largest=Max('largest_donation'),
+            last=Max('last_donation_at'),
+        )
+    )
+    return {row.pop('campaign_id'): row for row in rows}
+
+
+def with_pending(campaigns):
+    """Add the pending shard sums to the counters of the sharded ``campaigns``.
+
+    The instances are for display only: saving one afterwards would write
+    the pending amounts into the row, and compacting would count them twice.
+    """
+    sharded = {campaign.pk: campaign for campaign in campaigns if campaign.counter_shards}
+    if not sharded:
+        return campaigns
+    for campaign_id, pending in pending_totals(list(sharded)).items():
+        campaign = sharded[campaign_id]
+        campaign.collected_amount += pending['amount']
+        campaign.donor_count += pending['donors']
+        campaign.trending_score += pending['score']
+        stats = getattr(campaign, 'stats', None) if Campaign.stats.is_cached(campaign) else None
+        if stats is not None:
+            stats.donation_count += pending['donations']
+            stats.total_amount += pending['amount']
+    return campaigns
+
+
+def compact(campaign_ids=None):
+    """Fold pending shard increments into their campaigns. Returns the number of campaigns folded."""
+    pending = CampaignCounterShard.objects.filter(PENDING)
+    if campaign_ids is not None:
+        pending = pending.filter(campaign_id__in=campaign_ids)
+
+    folded = 0
+    for campaign_id in list(pending.order_by().values_list('campaign_id', flat=True).distinct()):
+        # One short transaction per campaign: writers wait for at most one fold
+        with transaction.atomic():
+            rows = list(
+                CampaignCounterShard.objects.select_for_update()
+                .filter(PENDING, campaign_id=campaign_id).order_by('shard')
+            )
+            if not rows:
+                continue
+            amount = sum(row.collected_amount for row in rows)
+            donations = sum(row.donation_count for row in rows)
+            CampaignCounterShard.objects.filter(pk__in=[row.pk for row in rows]).update(
+                collected_amount=0, donor_count=0, trending_score=0.0,
+                donation_count=0, largest_donation=0, last_donation_at=None,
+            )
+            Campaign.objects.filter(pk=campaign_id).update(
+                collected_amount=F('collected_amount') + amount,
+                donor_count=F('donor_count') + sum(row.donor_count for row in rows),
+                trending_score=F('trending_score') + sum(row.trending_score for row in rows),
+            )
+            if donations:
+                last_donation_at = max(row.last_donation_at for row in rows if row.last_donation_at)
+                CampaignStats.objects.bulk_create([CampaignStats(campaign_id=campaign_id)], ignore_conflicts=True)
+                CampaignStats.objects.filter(campaign_id=campaign_id).update(
+                    donation_count=F('donation_count') + donations,
+                    total_amount=F('total_amount') + amount,
+                    largest_donation=Greatest(F('largest_donation'), Value(max(row.largest_donation for row in rows))),
+                    last_donation_at=last_donation_at,
+                    updated_at=timezone.now(),
+                )
+        folded += 1
+    return folded
@@ -1,15 +1,111 @@
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from django.apps import apps
-from .models import Donation
+import logging
+from collections import defaultdict
+from decimal import Decimal
 
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.db.models.signals import pre_save
+from django.dispatch import Signal, receiver
 
-@receiver(post_save, sender=Donation)
-def update_campaign_amount(sender, instance, created, **kwargs):
-    """Update campaign collected amount when a donation is paid"""
-    if created and instance.status == 'paid':
-        campaign = instance.campaign
-        campaign.update_current_amount()
-        campaign.save()
+from givegrip import pagecache
+from .models import Campaign
 
+logger = logging.getLogger(__name__)
 
+# Sent by ``donations.ledger`` inside the recording transaction with
+# ``donations``: the list of donations that were newly counted as paid.
+# Each donation is delivered exactly once, so receivers can maintain
+# counters incrementally.
+donations_paid = Signal()
+
+
+@receiver(donations_paid)
+def update_donation_counters(sender, donations, **kwargs):
+    """Count first-time donors, fold the donations into the stats snapshots
+    and the trending scores."""
+    from .counters import record_new_donors
+    from .stats import record_paid_stats
+    from .trending import record_donations
+    new_pairs = record_new_donors(donations)
+    record_paid_stats(donations, new_pairs)
+    # A ranking hiccup must never fail the payment that triggered it
+    try:
+        with transaction.atomic():
+            record_donations(donations)
+    except Exception:
+        logger.exception(f"Could not add {len(donations)} donation(s) to the trending scores")
+
+
+@receiver(donations_paid)
+def publish_live_totals(sender, donations, **kwargs):
+    """Push the new totals to open campaign pages once the payment commits."""
+    from .live import publish_campaign_totals
+    amounts = defaultdict(Decimal)
+    for donation in donations:
+        amounts[donation.campaign_id] += Decimal(donation.amount)
+    transaction.on_commit(lambda: publish_campaign_totals(amounts))
+
+
+@receiver(donations_paid)
+def invalidate_pages_on_payment(sender, donations, **kwargs):
+    """Cached pages showing these campaigns have stale totals."""
+    campaign_ids = {donation.campaign_id for donation in donations}
+    pagecache.invalidate_on_commit(*[pagecache.campaign_tag(campaign_id) for campaign_id in campaign_ids])
+
+
+@receiver(donations_paid)
+def retire_donor_aggregates(sender, donations, **kwargs):
+    """The donors' cached dashboard totals are stale."""
+    from .aggregates import donor_tag
+    pagecache.invalidate_on_commit(*{donor_tag(donation.donor_id) for donation in donations})
+
+
+@receiver(pre_save, sender=Campaign)
+def remember_campaign_status(sender, instance, **kwargs):
+    if instance._state.adding:
+        instance._previous_status = None
+    else:
+        instance._previous_status = (
+            Campaign.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Campaign)
+def invalidate_campaign_pages(sender, instance, created, **kwargs):
+    """Purge the cached pages that show this campaign.
+
+    List pages only learn about a campaign once it is on them, so one that
+    has just become active also purges every list. One that stops being
+    active purges them too, as cached neighbours and recommendations
+    (``donations.aggregates``) only hold active campaigns.
+    """
+    tags = [pagecache.campaign_tag(instance.pk)]
+    if (instance.status == 'active') != (getattr(instance, '_previous_status', None) == 'active'):
+        tags.append(pagecache.CAMPAIGN_LIST_TAG)
+    pagecache.invalidate_on_commit(*tags)
+
+
+@receiver(post_save, sender=Campaign)
+def reload_counter_shards(sender, instance, **kwargs):
+    """Writers in this process pick up a changed ``counter_shards`` at once."""
+    from .shards import forget
+    forget(instance.pk)
+
+
+@receiver(post_save, sender=Campaign)
+def index_campaign_for_search(sender, instance, **kwargs):
+    """Keep the full-text and autocomplete indexes in step with campaign edits."""
+    from .autocomplete import title_index
+    from .search import index_campaign
+    index_campaign(instance)
+    transaction.on_commit(lambda: title_index.update(instance))
+
+
+@receiver(post_delete, sender=Campaign)
+def remove_campaign_from_search(sender, instance, **kwargs):
+    from .autocomplete import title_index
+    from .search import remove_campaign
+    remove_campaign(instance.pk)
+    campaign_id = instance.pk
+    transaction.on_commit(lambda: title_index.remove(campaign_id))
+    pagecache.invalidate_on_commit(pagecache.campaign_tag(campaign_id))
@@ -0,0 +1,151 @@
+"""
+"Similar campaigns" recommendations.
+
+``compute_similarities`` scores every pair of active campaigns as a
+weighted sum of three cosine similarities, each computed with sparse matrix
+products over all campaigns at once:
+
+* text: TF-IDF of title and description (title words counted twice),
+* category: same category or not,
+* co-donation: overlap of the donors who paid to both campaigns.
+
+The top ``SIMILAR_CAMPAIGNS_K`` neighbours of each campaign replace the
+contents of ``CampaignSimilarity``, so the detail page reads them with one
+indexed query. Rows are scored in blocks to bound memory on large
+catalogues.
+"""
+import numpy as np
+from scipy import sparse
+
+from django.conf import settings
+from django.db import transaction
+
+from .autocomplete import normalize
+from .models import Campaign, CampaignSimilarity, Donation
+
+STOP_WORDS = frozenset(
+    'a about an and are as at be by for from has have help in is it its of on or our that the this to '
+    'was we were will with you your'.split()
+)
+
+# Dense block of the similarity matrix scored at a time (floats)
+BLOCK_CELLS = 4_000_000
+
+
+def _tokens(title, description):
+    words = normalize(title) * 2 + normalize(description)
+    return [word for word in words if len(word) > 1 and word not in STOP_WORDS]
+
+
+def _l2_normalize(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags(1.0 / norms) @ matrix
+
+
+def tfidf_matrix(documents):
+    """Row-normalized TF-IDF matrix (campaigns x terms) for token lists."""
+    vocabulary = {}
+    rows, cols, counts = [], [], []
+    for row, tokens in enumerate(documents):
+        for token in tokens:
+            rows.append(row)
+            cols.append(vocabulary.setdefault(token, len(vocabulary)))
+            counts.append(1.0)
+    shape = (len(documents), max(len(vocabulary), 1))
+    # Duplicate (row, col) entries are summed into term counts
+    tf = sparse.csr_matrix((counts, (rows, cols)), shape=shape)
+    tf.data = 1.0 + np.log(tf.data)
+
+    df = np.bincount(tf.indices, minlength=shape[1])
+    idf = np.log((1.0 + shape[0]) / (1.0 + df)) + 1.0
+    return _l2_normalize(tf @ sparse.diags(idf))
+
+
+def category_matrix(categories):
+    """One-hot rows; the product of two rows is 1 for a shared category."""
+    index = {}
+    rows, cols = [], []
+    for row, category in enumerate(categories):
+        category = (category or '').strip().lower()
+        if category:
+            rows.append(row)
+            cols.append(index.setdefault(category, len(index)))
+    return sparse.csr_matrix(
+        (np.ones(len(rows)), (rows, cols)), shape=(len(categories), max(len(index), 1))
+    )
+
+
+def donor_matrix(campaign_ids):
+    """Row-normalized campaigns x donors incidence matrix of paid donations."""
+    position = {campaign_id: i for i, campaign_id in enumerate(campaign_ids)}
+    donors = {}
+    rows, cols = [], []
+    pairs = (
+        Donation.objects.filter(status='paid', campaign__status='active')
+        .order_by().values_list('campaign_id', 'donor_id').distinct()
+    )
+    for campaign_id, donor_id in pairs.iterator():
+        if campaign_id not in position:
+            continue
+        rows.append(position[campaign_id])
+        cols.append(donors.setdefault(donor_id, len(donors)))
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows)), (rows, cols)), shape=(len(campaign_ids), max(len(donors), 1))
+    )
+    return _l2_normalize(matrix)
+
+
+def top_k_similar(text, category, donors, k, weights):
+    """Yield ``(row, [(neighbour_row, score), ...])`` for every campaign."""
+    count = text.shape[0]
+    text_t, category_t, donors_t = text.T.tocsc(), category.T.tocsc(), donors.T.tocsc()
+    block = max(1, BLOCK_CELLS // max(count, 1))
+
+    for start in range(0, count, block):
+        stop = min(start + block, count)
+        scores = (
+            weights['text'] * (text[start:stop] @ text_t)
+            + weights['category'] * (category[start:stop] @ category_t)
+            + weights['co_donation'] * (donors[start:stop] @ donors_t)
+        ).toarray()
+        # A campaign is not its own neighbour
+        scores[np.arange(stop - start), np.arange(start, stop)] = 0.0
+
+        kth = min(k, count - 1)
+        if kth <= 0:
+            return
+        candidates = np.argpartition(-scores, kth - 1, axis=1)[:, :kth]
+        for offset, row_candidates in enumerate(candidates):
+            row_scores = scores[offset, row_candidates]
+            order = np.argsort(-row_scores)
+            yield start + offset, [
+                (int(row_candidates[i]), float(row_scores[i])) for i in order if row_scores[i] > 0
+            ]
+
+
+def compute_similarities(k=None, weights=None):
+    """Recompute and store the neighbours of every active campaign. Returns rows written."""
+    k = k or settings.SIMILAR_CAMPAIGNS_K
+    weights = weights or settings.SIMILAR_CAMPAIGNS_WEIGHTS
+
+    campaigns = list(
+        Campaign.objects.filter(status='active').order_by('pk')
+        .values_list('pk', 'title', 'description', 'category')
+    )
+    ids = [row[0] for row in campaigns]
+    entries = []
+    if len(ids) > 1:
+        text = tfidf_matrix([_tokens(title, description) for _pk, title, description, _category in campaigns])
+        category = category_matrix([row[3] for row in campaigns])
+        donors = donor_matrix(ids)
+        for row, neighbours in top_k_similar(text.tocsr(), category, donors.tocsr(), k, weights):
+            entries.extend(
+                CampaignSimilarity(campaign_id=ids[row], similar_id=ids[other], rank=rank, score=score)
+                for rank, (other, score) in enumerate(neighbours)
+            )
+
+    with transaction.atomic():
+        CampaignSimilarity.objects.all().delete()
+        CampaignSimilarity.objects.bulk_create(entries, batch_size=2000)
+    return len(entries)
@@ -0,0 +1,134 @@
+"""
+Per-donor and per-campaign donation snapshots.
+
+``DonorStats`` and ``CampaignStats`` are updated incrementally from the
+``donations_paid`` signal, so dashboards read one row instead of scanning a
+donor's whole history. ``rebuild_stats`` recomputes them from scratch in
+place: it locks the existing rows and sets each from a subquery over the
+paid donations, so an increment that commits meanwhile either waits for
+the rebuild and is added on top, or is already counted by it. Increments
+still pending in a sharded campaign's shards are left out of its snapshot,
+since folding them adds them again.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from . import shards
+from .models import CampaignCounterShard, CampaignStats, Donation, DonorStats
+
+
+def record_paid_stats(donations, new_pairs=()):
+    """Fold newly paid donations into the snapshots.
+
+    ``new_pairs`` are the (campaign, donor) pairs seen for the first time,
+    as returned by ``counters.record_new_donors``.
+    """
+    if not donations:
+        return
+
+    now = timezone.now()
+    per_donor = defaultdict(lambda: {'count': 0, 'amount': Decimal('0.00'), 'campaigns': 0})
+    per_campaign = defaultdict(lambda: {'count': 0, 'amount': Decimal('0.00'), 'largest': Decimal('0.00')})
+    for donation in donations:
+        amount = Decimal(donation.amount)
+        donor = per_donor[donation.donor_id]
+        donor['count'] += 1
+        donor['amount'] += amount
+        campaign = per_campaign[donation.campaign_id]
+        campaign['count'] += 1
+        campaign['amount'] += amount
+        campaign['largest'] = max(campaign['largest'], amount)
+    for _campaign_id, donor_id in new_pairs:
+        per_donor[donor_id]['campaigns'] += 1
+
+    # Sharded campaigns bump a shard instead; its collected_amount becomes total_amount
+    sharded = shards.shards_for(donations)
+    with transaction.atomic():
+        for campaign_id, shard in sharded.items():
+            delta = per_campaign.pop(campaign_id)
+            shards.add(
+                campaign_id, shard,
+                donation_count=delta['count'], largest_donation=delta['largest'], last_donation_at=now,
+            )
+        DonorStats.objects.bulk_create(
+            [DonorStats(donor_id=donor_id) for donor_id in per_donor], ignore_conflicts=True
+        )
+        CampaignStats.objects.bulk_create(
+            [CampaignStats(campaign_id=campaign_id) for campaign_id in per_campaign], ignore_conflicts=True
+        )
+        for donor_id, delta in per_donor.items():
+            DonorStats.objects.filter(donor_id=donor_id).update(
+                donation_count=F('donation_count') + delta['count'],
+                total_amount=F('total_amount') + delta['amount'],
+                campaigns_supported=F('campaigns_supported') + delta['campaigns'],
+                last_donation_at=now,
+                updated_at=now,
+            )
+        for campaign_id, delta in per_campaign.items():
+            CampaignStats.objects.filter(campaign_id=campaign_id).update(
+                donation_count=F('donation_count') + delta['count'],
+                total_amount=F('total_amount') + delta['amount'],
+                largest_donation=Greatest(F('largest_donation'), Value(delta['largest'])),
+                last_donation_at=now,
+                updated_at=now,
+            )
+
+
+def _aggregate(queryset, group, aggregate, default=None):
+    """A subquery for ``aggregate`` over the rows of ``queryset`` in the outer row's ``group``."""
+    value = Subquery(
+        queryset.filter(**{group: OuterRef(group)}).values(group).annotate(value=aggregate).values('value')
+    )
+    if default is None:
+        return value
+    return Coalesce(value, default)
+
+
+def rebuild_stats():
+    """Recompute every snapshot from paid donations. Returns (donors, campaigns)."""
+    shards.compact()
+    paid = Donation.objects.filter(status='paid').order_by()
+    pending = CampaignCounterShard.objects.order_by()
+    now = timezone.now()
+    zero = Value(Decimal('0.00'), output_field=DecimalField())
+
+    with transaction.atomic():
+        DonorStats.objects.bulk_create(
+            [DonorStats(donor_id=pk) for pk in paid.values_list('donor_id', flat=True).distinct()],
+            ignore_conflicts=True,
+        )
+        CampaignStats.objects.bulk_create(
+            [CampaignStats(campaign_id=pk) for pk in paid.values_list('campaign_id', flat=True).distinct()],
+            ignore_conflicts=True,
+        )
+        # Increments of these rows wait for the rebuild from here on
+        list(DonorStats.objects.select_for_update().values_list('pk', flat=True))
+        list(CampaignStats.objects.select_for_update().values_list('pk', flat=True))
+
+        donors = DonorStats.objects.update(
+            donation_count=_aggregate(paid, 'donor_id', Count('id'), Value(0)),
+            total_amount=_aggregate(paid, 'donor_id', Sum('amount'), zero),
+            campaigns_supported=_aggregate(paid, 'donor_id', Count('campaign_id', distinct=True), Value(0)),
+            last_donation_at=_aggregate(paid, 'donor_id', Max('updated_at')),
+            updated_at=now,
+        )
+        campaigns = CampaignStats.objects.update(
+            donation_count=(
+                _aggregate(paid, 'campaign_id', Count('id'), Value(0))
+                - _aggregate(pending, 'campaign_id', Sum('donation_count'), Value(0))
+            ),
+            total_amount=(
+                _aggregate(paid, 'campaign_id', Sum('amount'), zero)
+                - _aggregate(pending, 'campaign_id', Sum('collected_amount'), zero)
+            ),
+            largest_donation=_aggregate(paid, 'campaign_id', Max('amount'), zero),
+            last_donation_at=_aggregate(paid, 'campaign_id', Max('updated_at')),
+            updated_at=now,
+        )
+
+    return donors, campaigns
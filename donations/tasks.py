@@ -0,0 +1,43 @@
+"""
+Celery tasks for the donations application.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from givegrip.celery import app
+from . import idempotency, shards
+from .recommendations import rebuild_recommendations, refresh_recommendations
+from .similarity import compute_similarities
+
+
+@app.task(ignore_result=True)
+def compact_counter_shards():
+    """Fold sharded campaign counters back into their campaigns."""
+    return shards.compact()
+
+
+@app.task(ignore_result=True)
+def purge_idempotency_keys():
+    """Drop stored donate responses whose idempotency keys have expired."""
+    return idempotency.purge_expired()
+
+
+@app.task(ignore_result=True)
+def refresh_similar_campaigns():
+    """Recompute the "similar campaigns" table."""
+    return compute_similarities()
+
+
+@app.task(ignore_result=True)
+def refresh_donor_recommendations():
+    """Rescore donors who gave recently; the window overlaps the previous run."""
+    since = timezone.now() - timedelta(minutes=settings.DONOR_RECOMMENDATIONS_REFRESH_MINUTES)
+    return refresh_recommendations(since)
+
+
+@app.task(ignore_result=True)
+def rebuild_donor_recommendations():
+    """Rescore every donor."""
+    return rebuild_recommendations()
@@ -0,0 +1,872 @@
+import asyncio
+import importlib
+import json
+import math
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from django.apps import apps
+from accounts.models import User
+from donations.models import (
+    Campaign, CampaignCounterShard, CampaignSimilarity, CampaignStats, Donation, DonationLedgerEntry,
+    DonorRecommendation, DonorStats, IdempotencyKey, TrendingLandmark,
+)
+from donations import aggregates, idempotency, live, shards, trending
+from donations.ledger import reconcile_campaign_totals, record_paid_donation
+from donations.recommendations import rebuild_recommendations, refresh_recommendations
+from donations.similarity import compute_similarities
+from donations.stats import rebuild_stats
+from donations.autocomplete import TitleIndex, title_index
+from donations.counters import campaign_counters
+from donations.search import search_campaigns
+from givegrip.pagination import KeysetPaginator
+from pages.tests import reset_cms_cache
+from payments.gateway import gateway
+from payments.models import RazorpayOrder
+
+
+@override_settings(CAMPAIGN_VIEW_TRACKING=False, PAGE_CACHE_ENABLED=False)
+class CampaignDetailQueryTests(TestCase):
+    """The campaign page must not issue a query per donation."""
+
+    def setUp(self):
+        reset_cms_cache()
+        self.creator = User.objects.create_user(username='creator', email='creator@example.com', password='pass12345')
+        now = timezone.now()
+        self.campaign = Campaign.objects.create(
+            title='Clean water', description='Wells for the village', goal_amount=Decimal('1000.00'),
+            creator=self.creator, status='active', start_date=now, end_date=now + timedelta(days=30),
+        )
+        self.url = reverse('main_campaigns:campaign_detail', kwargs={'pk': self.campaign.pk})
+
+    def add_donations(self, count):
+        start = Donation.objects.count()
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(start, start + count):
+                donor = User.objects.create_user(username=f'donor{i}', email=f'donor{i}@example.com', password='pass12345')
+                Donation.objects.create(campaign=self.campaign, donor=donor, amount=Decimal('10.00'), status='paid')
+
+    def test_query_count_is_constant(self):
+        # Campaign with its creator and stats, recent donations with their
+        # donors, similar campaigns
+        self.add_donations(1)
+        with self.assertNumQueries(3):
+            self.client.get(self.url)
+        self.add_donations(10)
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+        self.assertEqual(response.context['donation_count'], 11)
+        self.assertEqual(len(response.context['recent_donations']), 5)
+        # Nothing changed: only the campaign itself is read
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+
+        def slow(owner):
+            calls.append(owner.pk)
+            time.sleep(0.2)
+            return {'owner': owner.pk}
+
+        for function, compute, owner in [
+            (aggregates.campaign_aggregates, '_campaign_aggregates', self.campaign),
+            (aggregates.donor_aggregates, '_donor_aggregates', self.creator),
+        ]:
+            calls.clear()
+            barrier = threading.Barrier(10)
+            results = []
+
+            def reader():
+                barrier.wait()
+                results.append(function(owner))
+
+            with self.subTest(compute), mock.patch.object(aggregates, compute, side_effect=slow):
+                threads = [threading.Thread(target=reader) for _ in range(10)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                self.assertEqual(calls, [owner.pk])
+                self.assertEqual(results, [{'owner': owner.pk}] * 10)
+
+
+class KeysetPaginationTests(TestCase):
+    """Cursor pages cover every row exactly once, in both directions."""
+
+    def setUp(self):
+        reset_cms_cache()
+        now = timezone.now()
+        for i in range(25):
+            Campaign.objects.create(
+                title=f'Campaign {i}', description='Test', goal_amount=Decimal('100.00'),
+                status='active', start_date=now, end_date=now + timedelta(days=30),
+            )
+        # Ties on created_at must be broken by id
+        Campaign.objects.filter(title__in=['Campaign 3', 'Campaign 4', 'Campaign 5']).update(created_at=now)
+        self.expected = list(Campaign.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+
+    def test_walk_forwards_and_back(self):
+        paginator = KeysetPaginator(Campaign.objects.all(), 10)
+        pages = [paginator.get_page()]
+        while pages[-1].has_next():
+            pages.append(paginator.get_page(pages[-1].next_cursor))
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual([c.pk for page in pages for c in page], self.expected)
+        self.assertFalse(pages[0].has_previous())
+
+        back = paginator.get_page(pages[-1].previous_cursor)
+        self.assertEqual([c.pk for c in back], [c.pk for c in pages[1]])
+        self.assertTrue(back.has_next())
+
+    def test_campaign_list_view(self):
+        response = self.client.get(reverse('main_campaigns:campaign_list'))
+        cursor = response.context['page_obj'].next_cursor
+        # A later page is one query, like the first
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('main_campaigns:campaign_list'), {'cursor': cursor})
+        self.assertEqual([c.pk for c in response.context['page_obj']], self.expected[12:24])
+
+        response = self.client.get(reverse('main_campaigns:campaign_list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 200)
+
+
+class CampaignSearchTests(TestCase):
+    """Full-text search ranks title hits first and follows campaign edits."""
+
+    def setUp(self):
+        reset_cms_cache()
+        now = timezone.now()
+
+        def make(title, description, story='', category='', status='active'):
+            return Campaign.objects.create(
+                title=title, description=description, story=story, category=category, status=status,
+                goal_amount=Decimal('100.00'), start_date=now, end_date=now + timedelta(days=30),
+            )
+
+        title_index.clear()
+        self.in_story = make('Village fund', 'Helping families', story='A new water pump', category='Community')
+        self.in_title = make('Clean water wells', 'Drilling wells', category='Environment')
+        self.draft = make('Water for schools', 'Draft campaign', status='draft')
+
+    def test_ranking_and_filters(self):
+        self.assertEqual(search_campaigns('water'), [self.in_title, self.in_story])
+        self.assertEqual(search_campaigns('water', category='community'), [self.in_story])
+        self.assertEqual(search_campaigns('water', status='draft'), [self.draft])
+        self.assertEqual(search_campaigns('water"*('), [self.in_title, self.in_story])
+
+    def test_limit_applies_after_filters(self):
+        now = timezone.now()
+        for i in range(10):
+            Campaign.objects.create(
+                title=f'Water water {i}', description='Water', status='draft',
+                goal_amount=Decimal('100.00'), start_date=now, end_date=now + timedelta(days=30),
+            )
+        # The drafts outrank every active match
+        self.assertEqual(search_campaigns('water', status='draft', limit=1)[0].status, 'draft')
+        self.assertEqual(search_campaigns('water', limit=2), [self.in_title, self.in_story])
+
+    def test_autocomplete_and_sync(self):
+        url = reverse('main_campaigns:campaign_autocomplete')
+        response = self.client.get(url, {'q': 'wel'})
+        self.assertEqual([r['title'] for r in response.json()['results']], ['Clean water wells'])
+        # Single letters match too much to be useful
+        self.assertEqual(self.client.get(url, {'q': ' w '}).json()['results'], [])
+
+        self.in_title.title = 'Clean springs'
+        self.in_title.description = 'Protecting springs'
+        self.in_title.save()
+        self.in_story.delete()
+        self.assertEqual(search_campaigns('water'), [])
+
+        response = self.client.get(reverse('main_campaigns:campaign_list'), {'q': 'springs'})
+        self.assertEqual(list(response.context['campaigns']), [self.in_title])
+
+    def test_in_memory_index(self):
+        Campaign.objects.filter(pk=self.in_story.pk).update(collected_amount=Decimal('50.00'))
+        title_index.build()
+        self.assertEqual([r['title'] for r in title_index.lookup('wat')], ['Clean water wells'])
+        with self.assertNumQueries(0):
+            self.assertEqual([r['title'] for r in title_index.lookup('CLEAN wat')], ['Clean water wells'])
+
+        # Saves in this process are applied once they commit
+        self.in_story.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.in_story.title = 'Village water fund'
+            self.in_story.save()
+        self.assertEqual([r['title'] for r in title_index.lookup('wat')], ['Village water fund', 'Clean water wells'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.in_title.status = 'paused'
+            self.in_title.save()
+        self.assertEqual([r['title'] for r in title_index.lookup('wat')], ['Village water fund'])
+
+        # Edits made by other workers arrive through refresh()
+        self.draft.status = 'active'
+        self.draft.save()
+        title_index.refresh()
+        self.assertEqual(len(title_index.lookup('wat')), 2)
+
+
+    def test_one_thread_rebuilds_while_others_use_the_old_index(self):
+        title_index.build()
+        title_index._built_at -= 10 ** 6
+        load = TitleIndex._load
+        during = []
+
+        def slow_load(index):
+            # Another request arrives in the middle of the rebuild
+            worker = threading.Thread(target=lambda: during.append(title_index.lookup('wat')))
+            worker.start()
+            worker.join(5)
+            load(index)
+
+        with mock.patch.object(TitleIndex, '_load', autospec=True, side_effect=slow_load) as loads:
+            self.assertEqual(len(title_index.lookup('wat')), 1)
+        self.assertEqual(loads.call_count, 1)
+        self.assertEqual([r['title'] for r in during[0]], ['Clean water wells'])
+
+class TrendingTests(TestCase):
+    """Recent activity outranks older activity of the same size."""
+
+    def setUp(self):
+        reset_cms_cache()
+        self.donor = User.objects.create_user(username='donor', email='donor@example.com', password='pass12345')
+        now = timezone.now()
+        self.old, self.new, self.quiet = [
+            Campaign.objects.create(
+                title=title, description='Test', goal_amount=Decimal('100.00'),
+                status='active', start_date=now, end_date=now + timedelta(days=30),
+            )
+            for title in ('Old', 'New', 'Quiet')
+        ]
+        # Scores relative to a recent landmark, whatever the date
+        trending.rebase_scores(now)
+        self.addCleanup(trending.forget_landmark)
+
+    def test_decayed_ordering(self):
+        now = timezone.now()
+        donation = Donation(campaign=self.old, donor=self.donor, amount=Decimal('100.00'))
+        trending.record_donations([donation], at=now - timedelta(days=3))
+        donation = Donation(campaign=self.new, donor=self.donor, amount=Decimal('100.00'))
+        trending.record_donations([donation], at=now)
+        self.assertEqual(list(trending.trending_campaigns()), [self.new, self.old])
+
+        # Three half-lives later the old donation is worth an eighth
+        self.old.refresh_from_db()
+        self.new.refresh_from_db()
+        self.assertAlmostEqual(trending.current_score(self.old, now) / trending.current_score(self.new, now), 1 / 8)
+
+    @override_settings(TRENDING_HALF_LIFE_HOURS=6, TRENDING_LANDMARK='2020-01-01T00:00:00+00:00')
+    def test_landmark_moves_forward_instead_of_overflowing(self):
+        TrendingLandmark.objects.all().delete()
+        trending.forget_landmark()
+        now = timezone.now()
+        # Thousands of half-lives after the landmark: exp() would overflow
+        with self.captureOnCommitCallbacks(execute=True):
+            Donation.objects.create(campaign=self.quiet, donor=self.donor, amount=Decimal('10.00'), status='paid')
+        self.assertLess(now - TrendingLandmark.objects.get().landmark, timedelta(minutes=1))
+        self.assertLess(trending.decay_factor(now), math.exp(trending.MAX_EXPONENT))
+        # The donation that moved the landmark is scored after the rescale, not wiped by it
+        self.quiet.refresh_from_db()
+        self.assertAlmostEqual(self.quiet.trending_score, trending.donation_weight(Decimal('10.00')), places=3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            trending.record_donations([Donation(campaign=self.old, amount=Decimal('100.00'))], at=now - timedelta(hours=18))
+            trending.record_donations([Donation(campaign=self.new, amount=Decimal('100.00'))], at=now)
+        self.old.refresh_from_db()
+        self.new.refresh_from_db()
+        self.assertAlmostEqual(trending.current_score(self.old, now) / trending.current_score(self.new, now), 1 / 8)
+
+    def test_rebase_keeps_relative_scores(self):
+        now = timezone.now()
+        trending.record_donations([Donation(campaign=self.old, amount=Decimal('100.00'))], at=now - timedelta(days=1))
+        trending.record_donations([Donation(campaign=self.new, amount=Decimal('100.00'))], at=now)
+        trending.rebase_scores(now + timedelta(days=1))
+        self.assertEqual(TrendingLandmark.objects.get().landmark, now + timedelta(days=1))
+        self.old.refresh_from_db()
+        self.new.refresh_from_db()
+        self.assertAlmostEqual(self.old.trending_score / self.new.trending_score, 1 / 2)
+
+    def test_scoring_failure_does_not_block_payment(self):
+        with mock.patch('donations.trending.record_donations', side_effect=OverflowError('math range error')):
+            donation = Donation.objects.create(
+                campaign=self.old, donor=self.donor, amount=Decimal('10.00'), status='paid'
+            )
+        self.assertEqual(Donation.objects.get(pk=donation.pk).status, 'paid')
+        self.old.refresh_from_db()
+        self.assertEqual((self.old.collected_amount, self.old.trending_score), (Decimal('10.00'), 0.0))
+
+    def test_paid_donations_and_shares_count(self):
+        Donation.objects.create(campaign=self.old, donor=self.donor, amount=Decimal('10.00'), status='paid')
+        for i in range(30):
+            self.client.post(reverse('main_campaigns:share_campaign', kwargs={'pk': self.new.pk}), REMOTE_ADDR=f'10.0.0.{i}')
+        campaign_counters.flush()
+
+        response = self.client.get(reverse('main_campaigns:trending'))
+        self.assertEqual(list(response.context['campaigns']), [self.new, self.old])
+
+class CampaignCounterTests(TestCase):
+    """Views and shares are buffered and counted once per visitor."""
+
+    def setUp(self):
+        reset_cms_cache()
+        creator = User.objects.create_user(username='creator', email='creator@example.com', password='pass12345')
+        now = timezone.now()
+        self.new = Campaign.objects.create(
+            title='New', description='Test', goal_amount=Decimal('100.00'), creator=creator,
+            status='active', start_date=now, end_date=now + timedelta(days=30),
+        )
+
+    def test_repeated_shares_count_once(self):
+        url = reverse('main_campaigns:share_campaign', kwargs={'pk': self.new.pk})
+        for _ in range(5):
+            self.assertEqual(self.client.post(url).status_code, 200)
+        self.client.post(url, REMOTE_ADDR='10.0.0.1')
+        campaign_counters.flush()
+
+        self.new.refresh_from_db()
+        self.assertEqual(self.new.share_count, 2)
+
+    @override_settings(TRUSTED_PROXY_COUNT=1)
+    def test_visitors_behind_proxy_are_told_apart(self):
+        url = reverse('main_campaigns:share_campaign', kwargs={'pk': self.new.pk})
+        # Every request reaches the app from the proxy; the client address is the last hop it appends
+        for forwarded in ['203.0.113.7', '198.51.100.2, 203.0.113.7', '203.0.113.8']:
+            self.client.post(url, REMOTE_ADDR='10.1.0.1', HTTP_X_FORWARDED_FOR=forwarded)
+        campaign_counters.flush()
+
+        self.new.refresh_from_db()
+        self.assertEqual(self.new.share_count, 2)
+
+    def test_share_requires_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        url = reverse('main_campaigns:share_campaign', kwargs={'pk': self.new.pk})
+        self.assertEqual(client.post(url).status_code, 403)
+
+        # The GET hands out the cookie the POST needs
+        token = client.get(url).cookies['csrftoken'].value
+        self.assertEqual(client.post(url, HTTP_X_CSRFTOKEN=token).status_code, 200)
+        campaign_counters.flush()
+        self.new.refresh_from_db()
+        self.assertEqual(self.new.share_count, 1)
+
+
+    @override_settings(CAMPAIGN_VIEW_TRACKING=True, PAGE_CACHE_ENABLED=True)
+    def test_views_served_from_page_cache_are_counted(self):
+        url = reverse('main_campaigns:campaign_detail', kwargs={'pk': self.new.pk})
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.1')['X-Page-Cache'], 'miss')
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.2')['X-Page-Cache'], 'hit')
+        campaign_counters.flush()
+
+        self.new.refresh_from_db()
+        self.assertEqual(self.new.view_count, 2)
+
+
+class SimilarCampaignsTests(TestCase):
+    """Neighbours come from shared words, category and donors."""
+
+    def setUp(self):
+        reset_cms_cache()
+        creator = User.objects.create_user(username='creator', email='creator@example.com', password='pass12345')
+        now = timezone.now()
+
+        def campaign(title, description, category):
+            return Campaign.objects.create(
+                title=title, description=description, category=category, goal_amount=Decimal('100.00'),
+                creator=creator, status='active', start_date=now, end_date=now + timedelta(days=30),
+            )
+
+        self.wells = campaign('Clean water wells', 'Drill water wells for the village', 'water')
+        self.pumps = campaign('Water pumps', 'Repair broken water pumps', 'water')
+        self.school = campaign('School books', 'Textbooks for the school library', 'education')
+        self.library = campaign('Library shelves', 'Shelves for the school library', 'education')
+        self.clinic = campaign('Rural clinic', 'Medicine for a rural clinic', 'health')
+
+    def neighbours(self, campaign):
+        return [entry.similar for entry in CampaignSimilarity.objects.filter(campaign=campaign)]
+
+    def test_text_and_category_neighbours(self):
+        compute_similarities(k=2)
+        self.assertEqual(self.neighbours(self.wells)[0], self.pumps)
+        self.assertEqual(self.neighbours(self.school)[0], self.library)
+        self.assertNotIn(self.wells, self.neighbours(self.wells))
+        # Nothing in common with anything: no neighbours at all
+        self.assertEqual(self.neighbours(self.clinic), [])
+
+    def test_co_donation_links_unrelated_campaigns(self):
+        for i in range(3):
+            donor = User.objects.create_user(username=f'donor{i}', email=f'donor{i}@example.com', password='pass12345')
+            for campaign in (self.clinic, self.school):
+                Donation.objects.create(campaign=campaign, donor=donor, amount=Decimal('5.00'), status='paid')
+        compute_similarities(k=2)
+        self.assertEqual(self.neighbours(self.clinic), [self.school])
+
+    def test_detail_page_shows_active_neighbours(self):
+        compute_similarities()
+        self.pumps.refresh_from_db()
+        self.pumps.status = 'paused'
+        self.pumps.save()
+        response = self.client.get(reverse('main_campaigns:campaign_detail', kwargs={'pk': self.wells.pk}))
+        self.assertNotIn(self.pumps, response.context['similar_campaigns'])
+        response = self.client.get(reverse('main_campaigns:campaign_detail', kwargs={'pk': self.school.pk}))
+        self.assertEqual(response.context['similar_campaigns'][0], self.library)
+
+
+class DonorRecommendationTests(TestCase):
+    """Donors are pointed at what their co-donors supported."""
+
+    def setUp(self):
+        reset_cms_cache()
+        now = timezone.now()
+        self.campaigns = [
+            Campaign.objects.create(
+                title=f'Campaign {i}', description='Test', goal_amount=Decimal('100.00'),
+                status='active', start_date=now, end_date=now + timedelta(days=30),
+            )
+            for i in range(4)
+        ]
+        self.alice, self.bob, self.carol = [
+            User.objects.create_user(username=name, email=f'{name}@example.com', password='pass12345')
+            for name in ('alice', 'bob', 'carol')
+        ]
+        self.give(self.alice, 0, 1)
+        self.give(self.bob, 0, 1, 2)
+        self.give(self.carol, 3)
+
+    def give(self, donor, *indexes):
+        for i in indexes:
+            Donation.objects.create(campaign=self.campaigns[i], donor=donor, amount=Decimal('5.00'), status='paid')
+
+    def recommended(self, donor):
+        return [entry.campaign for entry in DonorRecommendation.objects.filter(donor=donor)]
+
+    def test_rebuild(self):
+        self.assertEqual(rebuild_recommendations(), (3, 1))
+        self.assertEqual(self.recommended(self.alice), [self.campaigns[2]])
+        self.assertEqual(self.recommended(self.bob), [])
+        # No co-donors, nothing to recommend
+        self.assertEqual(self.recommended(self.carol), [])
+
+    def test_refresh_only_rescores_recent_donors(self):
+        rebuild_recommendations()
+        since = timezone.now()
+        self.give(self.carol, 0)
+        self.assertEqual(refresh_recommendations(since), (1, 2))
+        self.assertEqual(set(self.recommended(self.carol)), {self.campaigns[1], self.campaigns[2]})
+        # Alice's list was left as it was, although Campaign 3 now qualifies
+        self.assertEqual(self.recommended(self.alice), [self.campaigns[2]])
+
+    def test_dashboard_hides_inactive_campaigns(self):
+        rebuild_recommendations()
+        self.client.force_login(self.alice)
+        response = self.client.get(reverse('pages:dashboard'))
+        self.assertEqual(response.context['recommended_campaigns'], [self.campaigns[2]])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.campaigns[2].status = 'completed'
+            self.campaigns[2].save()
+        response = self.client.get(reverse('pages:dashboard'))
+        self.assertEqual(response.context['recommended_campaigns'], [])
+
+
+class CampaignProgressTests(TestCase):
+    """``with_progress()`` agrees with the per-instance properties."""
+
+    def setUp(self):
+        now = timezone.now()
+        self.campaigns = [
+            Campaign.objects.create(
+                title=f'Campaign {i}', description='Test', goal_amount=goal, collected_amount=collected,
+                status='active', start_date=now - timedelta(days=5), end_date=now + timedelta(days=days, hours=5),
+            )
+            for i, (goal, collected, days) in enumerate([
+                (Decimal('300.00'), Decimal('100.00'), 10),
+                (Decimal('50.00'), Decimal('80.00'), 0),
+                (Decimal('1000.50'), Decimal('12.25'), -3),
+            ])
+        ]
+
+    def test_annotations_match_properties(self):
+        annotated = Campaign.objects.with_progress().in_bulk([campaign.pk for campaign in self.campaigns])
+        for campaign in self.campaigns:
+            plain = Campaign.objects.get(pk=campaign.pk)
+            row = annotated[campaign.pk]
+            self.assertAlmostEqual(float(row.progress_percentage), float(plain.progress_percentage), places=6)
+            self.assertEqual(row.days_remaining, plain.days_remaining)
+        self.assertEqual([annotated[c.pk].days_remaining for c in self.campaigns], [10, 0, 0])
+
+    def test_progress_follows_refresh(self):
+        campaign = Campaign.objects.with_progress().get(pk=self.campaigns[0].pk)
+        self.assertAlmostEqual(float(campaign.progress_percentage), 100 / 3, places=6)
+        Campaign.objects.filter(pk=campaign.pk).update(collected_amount=F('collected_amount') + 50)
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.progress_percentage, 50)
+
+    def test_admin_changelist_sorts_by_progress(self):
+        admin = User.objects.create_superuser(username='admin', email='admin@example.com', password='pass12345')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('admin:donations_campaign_changelist'), {'o': '-9'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [campaign.pk for campaign in response.context['cl'].result_list],
+            [self.campaigns[1].pk, self.campaigns[0].pk, self.campaigns[2].pk],
+        )
+
+
+@override_settings(LIVE_UPDATES_BROKER='donations.live.LocalBroker')
+class LiveTotalsTests(TestCase):
+    """Paid donations reach open campaign streams."""
+
+    def setUp(self):
+        live._broker = None
+        self.donor = User.objects.create_user(username='donor', email='donor@example.com', password='pass12345')
+        now = timezone.now()
+        self.campaign = Campaign.objects.create(
+            title='Clean water', description='Test', goal_amount=Decimal('100.00'),
+            status='active', start_date=now, end_date=now + timedelta(days=30),
+        )
+
+    def tearDown(self):
+        live._broker = None
+
+    def pay(self, amount):
+        with self.captureOnCommitCallbacks(execute=True):
+            donation = Donation.objects.create(campaign=self.campaign, donor=self.donor, amount=amount, status='paid')
+            record_paid_donation(donation)
+
+    async def read_event(self, stream):
+        chunk = await asyncio.wait_for(stream.__anext__(), 1)
+        chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+        return json.loads(chunk.split('data: ', 1)[1])
+
+    async def test_stream_pushes_paid_totals(self):
+        url = reverse('main_campaigns:campaign_events', kwargs={'pk': self.campaign.pk})
+        response = await self.async_client.get(url)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = response.streaming_content
+        self.assertEqual((await self.read_event(stream))['donor_count'], 0)
+
+        await sync_to_async(self.pay)(Decimal('25.00'))
+        event = await self.read_event(stream)
+        self.assertEqual(Decimal(event['collected_amount']), Decimal('25.00'))
+        self.assertEqual(event['donor_count'], 1)
+        self.assertEqual(event['amount_added'], '25.00')
+        self.assertEqual(event['progress_percentage'], 25.0)
+
+
+    def test_sync_worker_sends_snapshot_and_polls(self):
+        url = reverse('main_campaigns:campaign_events', kwargs={'pk': self.campaign.pk})
+        content = b''.join(self.client.get(url).streaming_content).decode()
+        self.assertTrue(content.startswith('retry: 15000'))
+        self.assertIn('"donor_count": 0', content)
+
+    @override_settings(LIVE_UPDATES_STREAM_TIMEOUT=0)
+    async def test_expired_stream_unsubscribes(self):
+        url = reverse('main_campaigns:campaign_events', kwargs={'pk': self.campaign.pk})
+        stream = (await self.async_client.get(url)).streaming_content
+        await self.read_event(stream)
+        self.assertEqual(live.broker().subscriber_count(), 1)
+        # The stream ends and the browser reconnects
+        with self.assertRaises(StopAsyncIteration):
+            await stream.__anext__()
+        self.assertEqual(live.broker().subscriber_count(), 0)
+
+    async def test_one_loop_serves_many_subscribers(self):
+        broker = live.LocalBroker()
+        channel = live.campaign_channel(self.campaign.pk)
+        subscriptions = [broker.subscribe(channel) for _ in range(10000)]
+        # Published from another thread, as a sync view or task would
+        await asyncio.to_thread(broker.publish, channel, {'donor_count': 1})
+        messages = await asyncio.gather(*[subscription.get(timeout=5) for subscription in subscriptions])
+        self.assertEqual(messages, [{'donor_count': 1}] * 10000)
+        for subscription in subscriptions:
+            subscription.close()
+        self.assertEqual(broker.subscriber_count(), 0)
+
+
+@override_settings(CAMPAIGN_VIEW_TRACKING=False, PAGE_CACHE_ENABLED=False)
+class LedgerBackfillTests(TestCase):
+    """Totals from before the ledger survive a reconcile."""
+
+    def setUp(self):
+        donor = User.objects.create_user(username='donor', email='donor@example.com', password='pass12345')
+        now = timezone.now()
+
+        def campaign(title, collected):
+            return Campaign.objects.create(
+                title=title, description='Test', goal_amount=Decimal('1000.00'), status='active',
+                start_date=now, end_date=now + timedelta(days=30), collected_amount=collected,
+            )
+
+        # Paid before the ledger existed: donations without entries, totals already counted
+        self.donated = campaign('Donated', Decimal('0.00'))
+        for amount in ['50.00', '25.00']:
+            Donation.objects.create(campaign=self.donated, donor=donor, amount=Decimal(amount), status='paid')
+        DonationLedgerEntry.objects.all().delete()
+        Campaign.objects.filter(pk=self.donated.pk).update(collected_amount=Decimal('75.00'))
+        # Entered by hand, with no donations behind it
+        self.offline = campaign('Offline', Decimal('500.00'))
+
+    def test_reconcile_after_backfill_keeps_totals(self):
+        migration = importlib.import_module('donations.migrations.0015_backfill_ledger')
+        migration.backfill_ledger(apps, None)
+        self.assertEqual(DonationLedgerEntry.objects.filter(campaign=self.donated).count(), 2)
+
+        self.assertEqual(reconcile_campaign_totals(), [])
+        totals = dict(Campaign.objects.values_list('pk', 'collected_amount'))
+        self.assertEqual(totals, {self.donated.pk: Decimal('75.00'), self.offline.pk: Decimal('500.00')})
+
+    def test_reconcile_fixes_drift_against_ledger(self):
+        migration = importlib.import_module('donations.migrations.0015_backfill_ledger')
+        migration.backfill_ledger(apps, None)
+        Campaign.objects.filter(pk=self.donated.pk).update(collected_amount=Decimal('60.00'))
+
+        self.assertEqual(reconcile_campaign_totals(), [(self.donated.pk, Decimal('60.00'), Decimal('75.00'))])
+        self.donated.refresh_from_db()
+        self.assertEqual(self.donated.collected_amount, Decimal('75.00'))
+
+
+class DonationStatsTests(TestCase):
+    """Snapshots follow paid donations, and a rebuild agrees with them."""
+
+    def setUp(self):
+        self.donors = [
+            User.objects.create_user(username=f'donor{i}', email=f'donor{i}@example.com', password='pass12345')
+            for i in range(2)
+        ]
+        now = timezone.now()
+        self.campaigns = [
+            Campaign.objects.create(
+                title=f'Campaign {i}', description='Test', goal_amount=Decimal('1000.00'), status='active',
+                start_date=now, end_date=now + timedelta(days=30), counter_shards=counter_shards,
+            )
+            for i, counter_shards in enumerate([0, 4])
+        ]
+        for donor, campaign, amount in [(0, 0, '10.00'), (0, 1, '30.00'), (1, 0, '5.00'), (0, 0, '2.50')]:
+            Donation.objects.create(
+                campaign=self.campaigns[campaign], donor=self.donors[donor], amount=Decimal(amount), status='paid',
+            )
+        Donation.objects.create(campaign=self.campaigns[0], donor=self.donors[1], amount=Decimal('99.00'))
+
+    def snapshots(self):
+        donors = {
+            row.donor_id: (row.donation_count, row.total_amount, row.campaigns_supported)
+            for row in DonorStats.objects.all()
+        }
+        campaigns = {
+            row.campaign_id: (row.donation_count, row.total_amount, row.largest_donation)
+            for row in CampaignStats.objects.all()
+        }
+        return donors, campaigns
+
+    def expected(self):
+        return (
+            {self.donors[0].pk: (3, Decimal('42.50'), 2), self.donors[1].pk: (1, Decimal('5.00'), 1)},
+            {self.campaigns[0].pk: (3, Decimal('17.50'), Decimal('10.00')),
+             self.campaigns[1].pk: (1, Decimal('30.00'), Decimal('30.00'))},
+        )
+
+    def test_paid_donations_are_counted_incrementally(self):
+        shards.compact()
+        self.assertEqual(self.snapshots(), self.expected())
+
+    def test_rebuild_fixes_drift_in_place(self):
+        shards.compact()
+        DonorStats.objects.filter(donor=self.donors[0]).update(donation_count=7, total_amount=Decimal('1.00'))
+        CampaignStats.objects.filter(campaign=self.campaigns[1]).delete()
+        stranger = User.objects.create_user(username='stranger', email='stranger@example.com', password='pass12345')
+        DonorStats.objects.create(donor=stranger, donation_count=4, total_amount=Decimal('8.00'))
+
+        self.assertEqual(rebuild_stats(), (3, 2))
+        donors, campaigns = self.snapshots()
+        self.assertEqual(donors.pop(stranger.pk), (0, Decimal('0.00'), 0))
+        self.assertEqual((donors, campaigns), self.expected())
+
+    def test_rebuild_leaves_pending_shards_to_the_fold(self):
+        # Shards that gain increments after the rebuild compacted them
+        with mock.patch('donations.stats.shards.compact'):
+            rebuild_stats()
+        shards.compact()
+        self.assertEqual(self.snapshots(), self.expected())
+
+    def test_backfill_migration(self):
+        shards.compact()
+        DonorStats.objects.all().delete()
+        CampaignStats.objects.all().delete()
+        migration = importlib.import_module('donations.migrations.0017_backfill_stats')
+        migration.backfill_stats(apps, None)
+        self.assertEqual(self.snapshots(), self.expected())
+
+
+class ShardedCounterTests(TestCase):
+    """Sharded campaigns count donations in shard rows until they are compacted."""
+
+    def setUp(self):
+        self.creator = User.objects.create_user(username='creator', email='creator@example.com', password='pass12345')
+        self.donors = [
+            User.objects.create_user(username=f'donor{i}', email=f'donor{i}@example.com', password='pass12345')
+            for i in range(3)
+        ]
+        now = timezone.now()
+        self.campaign = Campaign.objects.create(
+            title='Viral appeal', description='Test', goal_amount=Decimal('100.00'), creator=self.creator,
+            status='active', start_date=now, end_date=now + timedelta(days=30), counter_shards=4,
+        )
+
+    def pay(self, donor, amount):
+        Donation.objects.create(campaign=self.campaign, donor=donor, amount=Decimal(amount), status='paid')
+
+    def test_donations_go_to_shards_and_fold_back(self):
+        for donor, amount in [(self.donors[0], '10.00'), (self.donors[1], '20.00'), (self.donors[0], '5.00')]:
+            self.pay(donor, amount)
+
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.collected_amount, Decimal('0.00'))
+        self.assertEqual(self.campaign.donor_count, 0)
+        self.assertEqual(self.campaign.trending_score, 0.0)
+        self.assertFalse(CampaignStats.objects.filter(campaign=self.campaign).exists())
+
+        # Readers see the pending amounts
+        shards.with_pending([self.campaign])
+        self.assertEqual(self.campaign.collected_amount, Decimal('35.00'))
+        self.assertEqual(self.campaign.donor_count, 2)
+        self.assertEqual(self.campaign.progress_percentage, Decimal('35'))
+        self.assertEqual(live.campaign_totals([self.campaign.pk])[self.campaign.pk]['collected_amount'], '35.00')
+        response = self.client.get(reverse('main_campaigns:campaign_detail', kwargs={'pk': self.campaign.pk}))
+        self.assertEqual(response.context['campaign'].collected_amount, Decimal('35.00'))
+
+        self.assertEqual(shards.compact(), 1)
+        self.campaign = Campaign.objects.get(pk=self.campaign.pk)
+        self.assertEqual(self.campaign.collected_amount, Decimal('35.00'))
+        self.assertEqual(self.campaign.donor_count, 2)
+        self.assertGreater(self.campaign.trending_score, 0.0)
+        stats = CampaignStats.objects.get(campaign=self.campaign)
+        self.assertEqual((stats.donation_count, stats.total_amount, stats.largest_donation), (3, Decimal('35.00'), Decimal('20.00')))
+        self.assertFalse(CampaignCounterShard.objects.filter(shards.PENDING).exists())
+        self.assertEqual(shards.compact(), 0)
+        self.assertEqual(reconcile_campaign_totals(), [])
+
+    def test_reconcile_folds_pending_shards_first(self):
+        self.pay(self.donors[0], '12.00')
+        self.assertEqual(reconcile_campaign_totals(), [])
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.collected_amount, Decimal('12.00'))
+
+    def test_unsharded_campaign_updates_its_row(self):
+        self.campaign.counter_shards = 0
+        self.campaign.save()
+        self.pay(self.donors[2], '8.00')
+        self.campaign.refresh_from_db()
+        self.assertEqual((self.campaign.collected_amount, self.campaign.donor_count), (Decimal('8.00'), 1))
+        self.assertFalse(CampaignCounterShard.objects.exists())
+
+
+class IdempotentDonateTests(TestCase):
+    """Repeated donate submissions with one key create one donation and order."""
+
+    def setUp(self):
+        reset_cms_cache()
+        self.donor = User.objects.create_user(username='donor', email='donor@example.com', password='pass12345')
+        self.client.force_login(self.donor)
+        now = timezone.now()
+        self.campaign = Campaign.objects.create(
+            title='Flood relief', description='Test', goal_amount=Decimal('1000.00'),
+            status='active', start_date=now, end_date=now + timedelta(days=30),
+        )
+        self.url = reverse('main_campaigns:donate', kwargs={'campaign_id': self.campaign.pk})
+
+    def donate(self, amount='100', key='key-1'):
+        return self.client.post(self.url, {'amount': amount, 'idempotency_key': key})
+
+    def test_retry_replays_first_response(self):
+        first = self.donate()
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('idempotency_key', self.client.get(self.url).content.decode())
+        second = self.donate()
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(Donation.objects.count(), 1)
+        self.assertEqual(RazorpayOrder.objects.count(), 1)
+
+        # From the database once the cache has forgotten it
+        cache.clear()
+        self.assertEqual(self.donate().content, first.content)
+        self.assertEqual(Donation.objects.count(), 1)
+
+    def test_key_reused_for_another_request(self):
+        self.donate()
+        self.assertEqual(self.donate(amount='250').status_code, 422)
+        self.assertEqual(Donation.objects.count(), 1)
+
+    def test_requests_without_key_or_with_new_keys_are_separate(self):
+        self.client.post(self.url, {'amount': '100'})
+        self.donate(key='key-2')
+        self.assertEqual(Donation.objects.count(), 2)
+
+    @override_settings(IDEMPOTENCY_WAIT_TIMEOUT=0.2)
+    def test_duplicate_of_request_in_flight(self):
+        request = RequestFactory().post(self.url, {'amount': '100'})
+        request.user = self.donor
+        scope = idempotency._scope(request, 'key-1')
+        cache.add(f'{idempotency._cache_key(scope)}:lock', 1)
+        self.assertEqual(self.donate().status_code, 409)
+
+        # The first request finishes while the duplicate waits
+        first = {
+            'fingerprint': idempotency._fingerprint(request),
+            'status': 200, 'content_type': 'text/html', 'content': b'order page',
+        }
+        threading.Timer(0.05, cache.set, args=(idempotency._cache_key(scope), first)).start()
+        with override_settings(IDEMPOTENCY_WAIT_TIMEOUT=2):
+            self.assertEqual(self.donate().content, b'order page')
+        self.assertFalse(Donation.objects.exists())
+
+    def test_gateway_is_called_outside_a_transaction(self):
+        depth = len(connection.atomic_blocks)
+        seen = []
+        create_order = gateway().create_order
+
+        def spy(*args, **kwargs):
+            seen.append(len(connection.atomic_blocks))
+            return create_order(*args, **kwargs)
+
+        with mock.patch.object(gateway(), 'create_order', side_effect=spy):
+            self.assertEqual(self.donate().status_code, 200)
+        self.assertEqual(seen, [depth])
+        self.assertEqual(IdempotencyKey.objects.get().response_status, 200)
+
+    def test_race_lost_to_another_worker(self):
+        request = RequestFactory().post(self.url, {'amount': '100'})
+        request.user = self.donor
+        scope = idempotency._scope(request, 'key-1')
+        create_order = gateway().create_order
+
+        def winner_commits_meanwhile(*args, **kwargs):
+            # A worker that does not share our cache stores its response while we wait on the gateway
+            IdempotencyKey.objects.create(
+                key=scope, fingerprint=idempotency._fingerprint(request), response_status=200,
+                response_content_type='text/html', response_body=b'order page', expires_at=timezone.now() + timedelta(days=1),
+            )
+            return create_order(*args, **kwargs)
+
+        with mock.patch.object(gateway(), 'create_order', side_effect=winner_commits_meanwhile):
+            response = self.donate()
+        self.assertEqual(response.content, b'order page')
+        self.assertFalse(Donation.objects.exists())
+        self.assertFalse(RazorpayOrder.objects.exists())
+
+    def test_expired_keys_are_purged(self):
+        self.donate()
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        self.assertEqual(idempotency.purge_expired(), 1)
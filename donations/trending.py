@@ -0,0 +1,201 @@
+"""
+Trending campaigns.
+
+``Campaign.trending_score`` is an exponentially time-decayed sum of paid
+donations, views and shares, kept with forward decay: an event at time
+``t`` adds ``weight * exp((t - L) / tau)`` where ``L`` is the fixed
+``TRENDING_LANDMARK``. Older events never need rewriting, every increment
+is a plain ``F()`` addition, and ordering by the stored column is the same
+as ordering by the decayed score at any moment, so the top-N is a single
+read of the ``(status, trending_score)`` index.
+
+Scores grow by ``e`` every ``tau`` seconds, so the landmark has to move
+forward before they leave float range. It lives in the ``TrendingLandmark``
+row, starting at ``TRENDING_LANDMARK``. Once an event's exponent passes
+``MAX_EXPONENT``, the landmark is moved to the event's time and every stored
+score rescaled to it, under the row lock and before the event is scored, so
+the event is added on the same scale as everything already stored. Other
+processes notice the move when their own exponent passes the bound (and
+find the landmark already moved once they get the lock), or after
+``LANDMARK_TTL`` seconds at the latest.
+"""
+import math
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta, timezone as dt_timezone
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import shards
+from .models import Campaign, CampaignCounterShard, Donation, TrendingLandmark
+
+# e**300 is about 1.9e130: far enough from the float limit (about e**709)
+# that sums of any number of events stay finite
+MAX_EXPONENT = 300.0
+# Seconds a process keeps its copy of the landmark
+LANDMARK_TTL = 60.0
+
+_landmark = None  # (landmark, monotonic time read)
+_landmark_lock = threading.Lock()
+
+
+@lru_cache(maxsize=4)
+def _parse_landmark(value):
+    landmark = parse_datetime(value)
+    if landmark is None:
+        raise ValueError(f'Invalid TRENDING_LANDMARK {value!r}')
+    if timezone.is_naive(landmark):
+        landmark = timezone.make_aware(landmark, dt_timezone.utc)
+    return landmark
+
+
+def landmark(refresh=False):
+    """The current landmark, from this process's copy unless ``refresh`` or expired."""
+    global _landmark
+    cached = _landmark
+    if refresh or cached is None or time.monotonic() - cached[1] > LANDMARK_TTL:
+        row, _ = TrendingLandmark.objects.get_or_create(
+            pk=1, defaults={'landmark': _parse_landmark(settings.TRENDING_LANDMARK)},
+        )
+        cached = (row.landmark, time.monotonic())
+        with _landmark_lock:
+            _landmark = cached
+    return cached[0]
+
+
+def forget_landmark():
+    global _landmark
+    with _landmark_lock:
+        _landmark = None
+
+
+def tau():
+    """Mean lifetime in seconds for the configured half-life."""
+    return settings.TRENDING_HALF_LIFE_HOURS * 3600 / math.log(2)
+
+
+def _exponent(at, refresh=False):
+    return (at - landmark(refresh)).total_seconds() / tau()
+
+
+def decay_factor(at=None):
+    """Multiplier for an event at ``at`` relative to the landmark.
+
+    Past ``MAX_EXPONENT`` the landmark is first moved forward to ``at``.
+    """
+    at = at or timezone.now()
+    exponent = _exponent(at)
+    if exponent > MAX_EXPONENT:
+        # Another process may have moved it already
+        exponent = _exponent(at, refresh=True)
+    if exponent > MAX_EXPONENT:
+        _advance_landmark(at)
+        exponent = _exponent(at, refresh=True)
+    return math.exp(exponent)
+
+
+def _advance_landmark(at):
+    with transaction.atomic():
+        row = TrendingLandmark.objects.select_for_update().get(pk=1)
+        # Whoever held the lock before may have moved it far enough
+        if (at - row.landmark).total_seconds() / tau() > MAX_EXPONENT:
+            _rescale(row, at)
+    forget_landmark()
+
+
+def donation_weight(amount):
+    # Larger gifts count for more, but a single huge gift cannot swamp
+    # a campaign with many small supporters
+    return settings.TRENDING_WEIGHTS['donation'] * math.log10(10 + float(amount))
+
+
+def counter_score(deltas, at=None):
+    """Score increment for buffered view/share counts (see ``counters.CounterBuffer``)."""
+    weights = settings.TRENDING_WEIGHTS
+    raw = deltas.get('view_count', 0) * weights['view'] + deltas.get('share_count', 0) * weights['share']
+    return raw * decay_factor(at)
+
+
+def record_donations(donations, at=None):
+    """Add newly paid donations to their campaigns' scores."""
+    factor = decay_factor(at)
+    per_campaign = defaultdict(float)
+    for donation in donations:
+        per_campaign[donation.campaign_id] += donation_weight(donation.amount) * factor
+    sharded = shards.shards_for(donations)
+    for campaign_id, score in per_campaign.items():
+        if campaign_id in sharded:
+            shards.add(campaign_id, sharded[campaign_id], trending_score=score)
+        else:
+            Campaign.objects.filter(pk=campaign_id).update(trending_score=F('trending_score') + score)
+
+
+def current_score(campaign, at=None):
+    """The decayed score as of ``at``, comparable across time."""
+    return campaign.trending_score / decay_factor(at)
+
+
+def trending_campaigns(limit=12):
+    return (
+        Campaign.objects.with_progress()
+        .filter(status='active', trending_score__gt=0).order_by('-trending_score')[:limit]
+    )
+
+
+def rebuild_scores(window_half_lives=10):
+    """Recompute scores from paid donations in the recent window.
+
+    Views and shares are only kept as running totals, so a rebuild scores
+    donations alone; live traffic fills the rest back in.
+    """
+    shards.compact()
+    # Scores are rebuilt relative to a fresh landmark, so no factor exceeds 1
+    now = timezone.now()
+    since = now - timedelta(hours=settings.TRENDING_HALF_LIFE_HOURS * window_half_lives)
+    scores = defaultdict(float)
+    paid = Donation.objects.filter(status='paid', updated_at__gte=since).order_by()
+    for campaign_id, amount, paid_at in paid.values_list('campaign_id', 'amount', 'updated_at').iterator():
+        scores[campaign_id] += donation_weight(amount) * math.exp((paid_at - now).total_seconds() / tau())
+
+    landmark(refresh=True)
+    with transaction.atomic():
+        row = TrendingLandmark.objects.select_for_update().get(pk=1)
+        row.landmark = now
+        row.save()
+        CampaignCounterShard.objects.exclude(trending_score=0).update(trending_score=0.0)
+        Campaign.objects.exclude(pk__in=list(scores)).update(trending_score=0.0)
+        for campaign_id, score in scores.items():
+            Campaign.objects.filter(pk=campaign_id).update(trending_score=score)
+    forget_landmark()
+    return len(scores)
+
+
+def rebase_scores(new_landmark):
+    """Move the landmark to ``new_landmark`` and rescale stored scores to it.
+
+    Campaign and shard scores are rescaled in the same transaction as the
+    landmark row, which is locked meanwhile. Returns the number of campaigns
+    rescaled.
+    """
+    landmark(refresh=True)
+    with transaction.atomic():
+        row = TrendingLandmark.objects.select_for_update().get(pk=1)
+        count = _rescale(row, new_landmark)
+    forget_landmark()
+    return count
+
+
+def _rescale(row, new_landmark):
+    # Far enough apart, the factor underflows to zero: old scores are worthless
+    factor = math.exp(-(new_landmark - row.landmark).total_seconds() / tau())
+    CampaignCounterShard.objects.exclude(trending_score=0).update(trending_score=F('trending_score') * factor)
+    count = Campaign.objects.filter(trending_score__gt=0).update(trending_score=F('trending_score') * factor)
+    row.landmark = new_landmark
+    row.save()
+    return count
@@ -5,8 +5,12 @@ app_name = 'main_campaigns'
 
 urlpatterns = [
     path('', views.campaign_list, name='campaign_list'),
+    path('trending/', views.trending, name='trending'),
+    path('search/autocomplete/', views.campaign_autocomplete, name='campaign_autocomplete'),
     path('<uuid:pk>/', views.campaign_detail, name='campaign_detail'),
     path('<uuid:campaign_id>/donate/', views.donate, name='donate'),
+    path('<uuid:pk>/share/', views.share_campaign, name='share_campaign'),
+    path('<uuid:pk>/events/', views.campaign_events, name='campaign_events'),
     path('create/', views.create_campaign, name='create_campaign'),
     path('edit/<uuid:pk>/', views.edit_campaign, name='edit_campaign'),
 ]
@@ -1,38 +1,171 @@
+import json
+import logging
+import time
+import uuid
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.core.paginator import Paginator
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.csrf import ensure_csrf_cookie
+from django.views.decorators.http import require_http_methods
+from givegrip.pagecache import CAMPAIGN_LIST_TAG, add_tags, cache_public_page, campaign_tag
+from givegrip.pagination import KeysetPaginator
 from .models import Campaign, Donation
+from .aggregates import campaign_aggregates
+from .counters import track_campaign_share, track_campaign_view
+from .autocomplete import title_index
+from .idempotency import Duplicate, claim, idempotent
+from . import live
+from .search import search_campaigns
+from .shards import with_pending
+from .trending import trending_campaigns
+from pages import cms_cache
+from payments.gateway import GatewayError, gateway
 
+logger = logging.getLogger(__name__)
+
+@cache_public_page(CAMPAIGN_LIST_TAG)
 def campaign_list(request):
-    """List all active campaigns."""
-    campaigns = Campaign.objects.filter(status='active').order_by('-created_at')
+    """List all active campaigns, or search them when ``q`` is given."""
+    query = request.GET.get('q', '').strip()
+    category = request.GET.get('category', '').strip()
     
-    # Pagination
-    paginator = Paginator(campaigns, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    if query:
+        # Ranked full-text results; the best matches fit on one page
+        campaigns = search_campaigns(query, category=category or None, limit=48)
+        page_obj = None
+    else:
+        campaigns = Campaign.objects.with_progress().filter(status='active')
+        if category:
+            campaigns = campaigns.filter(category__iexact=category)
+        
+        # Keyset pagination: every page is an index range scan, no COUNT/OFFSET
+        paginator = KeysetPaginator(campaigns, 12)
+        page_obj = paginator.get_page(request.GET.get('cursor'))
+        campaigns = page_obj
+    with_pending(campaigns)
+    add_tags(request, *[campaign_tag(campaign.pk) for campaign in campaigns])
     
     context = {
-        'campaigns': page_obj,
+        'campaigns': campaigns,
         'page_obj': page_obj,
+        'query': query,
+        'category': category,
+    }
+    return render(request, 'campaign_list.html', context)
+
+@cache_public_page(CAMPAIGN_LIST_TAG)
+def trending(request):
+    """Campaigns with the most recent activity."""
+    campaigns = with_pending(list(trending_campaigns(limit=24)))
+    add_tags(request, *[campaign_tag(campaign.pk) for campaign in campaigns])
+    context = {
+        'campaigns': campaigns,
+        'page_obj': None,
+        'heading': 'Trending Campaigns',
+        'subheading': 'Causes people are rallying behind right now',
     }
     return render(request, 'campaign_list.html', context)
 
+def campaign_autocomplete(request):
+    """Prefix suggestions for the campaign search box."""
+    query = request.GET.get('q', '').strip()
+    # Same threshold as the search box script
+    if len(query) < 2:
+        return JsonResponse({'results': []})
+    # Served from the in-process prefix index, not the database
+    results = title_index.lookup(query)
+    for result in results:
+        result['url'] = reverse('main_campaigns:campaign_detail', kwargs={'pk': result['id']})
+    return JsonResponse({'results': results})
+
 def campaign_detail(request, pk):
     """Show campaign details."""
-    campaign = get_object_or_404(Campaign, pk=pk)
+    response = _campaign_detail_page(request, pk)
+    # Outside the page cache, so views served from it are counted too
+    track_campaign_view(request, pk)
+    return response
+
+@cache_public_page(lambda request, pk: campaign_tag(pk))
+def _campaign_detail_page(request, pk):
+    campaign = get_object_or_404(Campaign.objects.with_progress().select_related('creator', 'stats'), pk=pk)
+    with_pending([campaign])
     
-    # Get recent donations
-    recent_donations = campaign.donations.filter(status='paid').order_by('-created_at')[:5]
+    # Recent donations, neighbours and counts, recomputed by one request at a time
+    aggregates = campaign_aggregates(campaign)
+    add_tags(request, *[campaign_tag(similar.pk) for similar in aggregates['similar_campaigns']])
     
     context = {
         'campaign': campaign,
-        'recent_donations': recent_donations,
+        **aggregates,
     }
     return render(request, 'campaign_detail.html', context)
 
+def _sse(message):
+    return f'data: {json.dumps(message)}\n\n'
+
+async def campaign_events(request, pk):
+    """Stream a campaign's live totals as Server-Sent Events."""
+    totals = (await sync_to_async(live.campaign_totals)([pk])).get(pk)
+    if totals is None:
+        raise Http404('Campaign not found')
+    
+    if not isinstance(request, ASGIRequest):
+        # A sync worker cannot hold the stream open: send the current totals
+        # and let the browser reconnect, which turns into polling
+        response = StreamingHttpResponse(
+            iter([f'retry: {settings.LIVE_UPDATES_HEARTBEAT * 1000}\n', _sse(totals)]),
+            content_type='text/event-stream',
+        )
+        response['Cache-Control'] = 'no-cache'
+        return response
+    
+    subscription = live.broker().subscribe(live.campaign_channel(pk))
+    
+    async def stream():
+        # The stream ends after LIVE_UPDATES_STREAM_TIMEOUT seconds and the
+        # browser reconnects, so connections left by vanished clients expire
+        deadline = time.monotonic() + settings.LIVE_UPDATES_STREAM_TIMEOUT
+        try:
+            yield 'retry: 3000\n' + _sse(totals)
+            while time.monotonic() < deadline:
+                message = await subscription.get(timeout=settings.LIVE_UPDATES_HEARTBEAT)
+                yield _sse(message) if message is not None else ': keep-alive\n\n'
+        finally:
+            subscription.close()
+    
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@ensure_csrf_cookie
+@require_http_methods(['GET', 'POST'])
+def share_campaign(request, pk):
+    """Record a campaign share, once per visitor and campaign.
+
+    A GET only sets the CSRF cookie the POST needs: campaign pages served
+    from the page cache never set one.
+    """
+    if not Campaign.objects.filter(pk=pk).exists():
+        return JsonResponse({'success': False, 'error': 'Campaign not found'}, status=404)
+    if request.method == 'GET':
+        return JsonResponse({'success': True})
+    
+    track_campaign_share(request, pk)
+    return JsonResponse({'success': True})
+
 @login_required
+@idempotent
 def donate(request, campaign_id):
     """Donate to a campaign."""
     campaign = get_object_or_404(Campaign, pk=campaign_id)
@@ -42,54 +175,85 @@ def donate(request, campaign_id):
         message = request.POST.get('message', '')
         is_anonymous = request.POST.get('is_anonymous') == 'on'
         
-        if amount and float(amount) > 0:
+        try:
+            amount = Decimal(amount)
+            if not amount.is_finite() or amount <= 0:
+                amount = None
+        except (TypeError, ArithmeticError):
+            amount = None
+        site_settings = cms_cache.site_settings()
+        
+        if amount is None:
+            messages.error(request, 'Please enter a valid amount.')
+        elif not site_settings.min_donation_amount <= amount <= site_settings.max_donation_amount:
+            messages.error(
+                request,
+                f'Donations must be between {site_settings.currency_symbol}{site_settings.min_donation_amount} '
+                f'and {site_settings.currency_symbol}{site_settings.max_donation_amount}.'
+            )
+        else:
             try:
-                # Create donation with pending status
-                donation = Donation.objects.create(
-                    campaign=campaign,
-                    donor=request.user,
-                    amount=amount,
-                    donor_message=message,
-                    is_anonymous=is_anonymous,
-                    currency=campaign.currency,
-                    status='pending'
-                )
-                
-                # Create test order for development
-                import uuid
-                
-                # Generate test order ID
-                test_order_id = f"order_test_{uuid.uuid4().hex[:16]}"
+                # The gateway call happens before anything is written, outside
+                # any transaction, so nothing is held open while waiting on the network
+                donation_id = uuid.uuid4()
+                try:
+                    order = gateway().create_order(
+                        amount, campaign.currency, receipt=str(donation_id),
+                        notes={'campaign': str(campaign.pk)},
+                    )
+                except GatewayError:
+                    logger.exception('Could not create a gateway order for campaign %s', campaign.pk)
+                    messages.error(request, 'The payment gateway is unavailable right now. Please try again.')
+                    # Not a 200, so a retry with the same idempotency key runs again
+                    return render(request, 'donate.html', {
+                        'campaign': campaign,
+                        'idempotency_key': request.POST.get('idempotency_key') or uuid.uuid4().hex,
+                    }, status=503)
                 
-                # Save order to database
+                # The donation (pending), its order and the idempotency key are written together
                 from payments.models import RazorpayOrder
-                order_record = RazorpayOrder.objects.create(
-                    donation=donation,
-                    razorpay_order_id=test_order_id,
-                    amount=amount,
-                    currency=campaign.currency,
-                    status='created'
-                )
+                with transaction.atomic():
+                    donation = Donation.objects.create(
+                        id=donation_id,
+                        campaign=campaign,
+                        donor=request.user,
+                        amount=amount,
+                        donor_message=message,
+                        is_anonymous=is_anonymous,
+                        currency=campaign.currency,
+                        status='pending'
+                    )
+                    RazorpayOrder.objects.create(
+                        donation=donation,
+                        razorpay_order_id=order['id'],
+                        amount=amount,
+                        currency=campaign.currency,
+                        status='created'
+                    )
+                    claim(request)
                 
                 # Redirect to payment gateway
                 context = {
-                    'order_id': test_order_id,
-                    'amount': int(float(amount) * 100),  # Convert to paise for display
+                    'order_id': order['id'],
+                    'amount': order['amount'],  # In paise
                     'currency': campaign.currency,
-                    'key_id': 'test_key',  # Placeholder for testing
+                    'key_id': settings.RAZORPAY_KEY_ID,
+                    'test_payment': order.get('test_payment'),
                     'donation': donation,
                     'campaign': campaign
                 }
                 
                 return render(request, 'payment_gateway.html', context)
                 
+            except (Duplicate, ImproperlyConfigured):
+                raise
             except Exception as e:
                 messages.error(request, f'Error processing donation: {str(e)}')
-        else:
-            messages.error(request, 'Please enter a valid amount.')
     
     context = {
         'campaign': campaign,
+        # A fresh key per form, so a double submit or retry replays the first response
+        'idempotency_key': uuid.uuid4().hex,
     }
     return render(request, 'donate.html', context)
 
@@ -1 +1,7 @@
 # Give Grip Django Project
+
+# Make sure the Celery app is loaded when Django starts so that
+# tasks declared with @app.task use it.
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
@@ -0,0 +1,155 @@
+"""
+Full-page cache for anonymous visitors.
+
+Views wrapped in ``cache_public_page`` are stored per path and query string
+together with the versions of the tags they depend on: every page carries
+``SITE_TAG``, campaign pages carry ``campaign_tag(pk)`` for each campaign
+they show, and list pages carry ``CAMPAIGN_LIST_TAG``. ``invalidate`` bumps
+a tag's version, which turns exactly the pages recorded with it stale;
+nothing is deleted or scanned.
+
+A stale page is served as it is while a single request, holding the
+``givegrip.singleflight`` lock, renders the fresh copy, so invalidating a
+busy page costs one render rather than one per visitor. Pages are also refreshed after
+``PAGE_CACHE_TIMEOUT`` seconds and dropped after
+``PAGE_CACHE_STALE_TIMEOUT`` seconds.
+"""
+import hashlib
+import time
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+
+from . import singleflight
+
+SITE_TAG = 'site'
+CAMPAIGN_LIST_TAG = 'campaign-list'
+
+
+def campaign_tag(campaign_id):
+    return f'campaign:{campaign_id}'
+
+
+def _tag_key(tag):
+    return f'pagecache:tag:{tag}'
+
+
+def tag_versions(tags):
+    """Current version of each tag, creating the missing ones."""
+    keys = {tag: _tag_key(tag) for tag in tags}
+    found = cache.get_many(keys.values())
+    versions = {}
+    for tag, key in keys.items():
+        if key not in found:
+            cache.add(key, uuid.uuid4().hex, None)
+            found[key] = cache.get(key)
+        versions[tag] = found[key]
+    return versions
+
+
+def invalidate(*tags):
+    """Make every page recorded with one of ``tags`` stale."""
+    cache.set_many({_tag_key(tag): uuid.uuid4().hex for tag in tags}, None)
+
+
+def invalidate_on_commit(*tags):
+    transaction.on_commit(lambda: invalidate(*tags))
+
+
+def add_tags(request, *tags):
+    """Record that the page being rendered for ``request`` shows ``tags``."""
+    versions = getattr(request, '_page_cache_tags', None)
+    if versions is not None:
+        versions.update(tag_versions([tag for tag in tags if tag not in versions]))
+
+
+def _cacheable_request(request):
+    if not settings.PAGE_CACHE_ENABLED or request.method not in ('GET', 'HEAD'):
+        return False
+    if request.user.is_authenticated:
+        return False
+    # A page rendered with a flash message must not be shown to others
+    return not len(get_messages(request))
+
+
+def _cacheable_response(request, response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+        and 'private' not in response.get('Cache-Control', '')
+    )
+
+
+def _page_key(request):
+    digest = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'pagecache:page:{digest}'
+
+
+def _is_fresh(entry):
+    if time.time() >= entry['fresh_until']:
+        return False
+    return tag_versions(entry['tags']) == entry['tags']
+
+
+def _response(entry, state):
+    response = HttpResponse(entry['content'], content_type=entry['content_type'])
+    response['X-Page-Cache'] = state
+    return response
+
+
+def _render(view, request, key, tags, args, kwargs):
+    """Run the view and store its response under ``key`` if it can be shared."""
+    request._page_cache_tags = tag_versions(tags)
+    response = view(request, *args, **kwargs)
+    if hasattr(response, 'render') and callable(response.render):
+        response = response.render()
+    if _cacheable_response(request, response):
+        entry = {
+            'content': response.content,
+            'content_type': response['Content-Type'],
+            'tags': request._page_cache_tags,
+            'fresh_until': time.time() + settings.PAGE_CACHE_TIMEOUT,
+        }
+        cache.set(key, entry, settings.PAGE_CACHE_STALE_TIMEOUT)
+        response['X-Page-Cache'] = 'miss'
+    return response
+
+
+def cache_public_page(*tags):
+    """Serve the view from the page cache for anonymous visitors.
+
+    ``tags`` are strings or callables taking the view's arguments; views
+    add the tags of the objects they show with ``add_tags``.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not _cacheable_request(request):
+                return view(request, *args, **kwargs)
+
+            page_tags = [SITE_TAG] + [tag(request, *args, **kwargs) if callable(tag) else tag for tag in tags]
+            key = _page_key(request)
+            entry = cache.get(key)
+            if entry is not None and _is_fresh(entry):
+                return _response(entry, 'hit')
+
+            with singleflight.leader(key, settings.PAGE_CACHE_LOCK_TIMEOUT) as leading:
+                if leading:
+                    return _render(view, request, key, page_tags, args, kwargs)
+
+            # Someone else is rendering: serve the stale copy, or wait for theirs
+            if entry is not None:
+                return _response(entry, 'stale')
+            entry = singleflight.wait_for(key)
+            if entry is not None:
+                return _response(entry, 'hit')
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
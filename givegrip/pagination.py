@@ -0,0 +1,169 @@
+"""
+Keyset (cursor) pagination shared by the HTML views and the API.
+
+Pages are read with ``WHERE (created_at, id) < (cursor) ORDER BY created_at
+DESC, id DESC LIMIT n + 1`` instead of ``COUNT(*)`` plus ``OFFSET``, so the
+hundredth page costs the same as the first and a page never loads more than
+``per_page + 1`` rows. Cursors are opaque URL-safe strings encoding the
+position of the first or last row of the current page.
+"""
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.pagination import BasePagination
+from rest_framework.settings import api_settings
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_cursor(position, reverse=False):
+    payload = json.dumps({'p': position, 'r': int(reverse)}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return ``(position, reverse)``, or ``(None, False)`` for a missing or mangled cursor."""
+    if not cursor:
+        return None, False
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        position, reverse = payload['p'], bool(payload['r'])
+    except (TypeError, ValueError, KeyError):
+        return None, False
+    if not isinstance(position, list):
+        return None, False
+    return position, reverse
+
+
+class KeysetPage:
+    """One page of results, iterable like a ``django.core.paginator.Page``."""
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """Paginate a queryset newest first on ``fields`` (by default ``created_at`` then ``id``).
+
+    The fields together must be unique, and an index on them (after any
+    equality filters) is what makes every page a short index range scan.
+    """
+
+    def __init__(self, queryset, per_page, fields=('created_at', 'id')):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.fields = tuple(fields)
+
+    def get_page(self, cursor=None):
+        position, reverse = decode_cursor(cursor)
+        if position is not None and len(position) != len(self.fields):
+            position, reverse = None, False
+
+        queryset = self.queryset
+        if position is not None:
+            try:
+                queryset = queryset.filter(self._after(position, reverse))
+            except (ValidationError, ValueError, TypeError):
+                # Values that do not fit the fields: start from the top
+                queryset, position, reverse = self.queryset, None, False
+        ordering = [field if reverse else f'-{field}' for field in self.fields]
+        rows = list(queryset.order_by(*ordering)[:self.per_page + 1])
+
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+
+        # Going forwards there is a previous page whenever we started from a
+        # cursor; going backwards there is always a next page.
+        if reverse:
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, position is not None
+
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = encode_cursor(self._position(rows[-1]))
+        if rows and has_previous:
+            previous_cursor = encode_cursor(self._position(rows[0]), reverse=True)
+        return KeysetPage(rows, next_cursor, previous_cursor)
+
+    def _position(self, obj):
+        values = []
+        for field in self.fields:
+            value = getattr(obj, field)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else str(value))
+        return values
+
+    def _after(self, position, reverse):
+        """Rows strictly past ``position`` in the direction of travel."""
+        lookup = 'gt' if reverse else 'lt'
+        condition = Q()
+        for i, field in enumerate(self.fields):
+            equal = {self.fields[j]: position[j] for j in range(i)}
+            condition |= Q(**equal, **{f'{field}__{lookup}': position[i]})
+        return condition
+
+
+class KeysetPagination(BasePagination):
+    """DRF pagination class backed by ``KeysetPaginator``."""
+
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    fields = ('created_at', 'id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        paginator = KeysetPaginator(queryset, self.page_size, fields=self.fields)
+        self.page = paginator.get_page(request.query_params.get(self.cursor_query_param))
+        return list(self.page)
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        return self._link(self.page.next_cursor)
+
+    def get_previous_link(self):
+        return self._link(self.page.previous_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -5,6 +5,7 @@ Django settings for Give Grip project.
 import os
 from pathlib import Path
 from decouple import config
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -212,6 +213,39 @@ PAYPAL_MODE = config('PAYPAL_MODE', default='sandbox')
 
 RAZORPAY_KEY_ID = config('RAZORPAY_KEY_ID', default='')
 RAZORPAY_KEY_SECRET = config('RAZORPAY_KEY_SECRET', default='')
+# Set on the webhook in the Razorpay dashboard; unsigned webhooks are rejected
+RAZORPAY_WEBHOOK_SECRET = config('RAZORPAY_WEBHOOK_SECRET', default='')
+
+# Payment gateway client (see payments.gateway). Without Razorpay keys, orders
+# are made up in-process; `run_gateway_stub` serves a local stand-in for the
+# Razorpay API to point PAYMENT_GATEWAY_API_URL at.
+PAYMENT_GATEWAY = config(
+    'PAYMENT_GATEWAY',
+    default='payments.gateway.RazorpayGateway' if RAZORPAY_KEY_ID else 'payments.gateway.LocalGateway',
+)
+# LocalGateway marks its own simulated payments as genuine, so it only runs where this is set
+PAYMENT_LOCAL_GATEWAY = config('PAYMENT_LOCAL_GATEWAY', default=DEBUG, cast=bool)
+PAYMENT_GATEWAY_API_URL = config('PAYMENT_GATEWAY_API_URL', default='https://api.razorpay.com/v1')
+PAYMENT_GATEWAY_CONNECT_TIMEOUT = config('PAYMENT_GATEWAY_CONNECT_TIMEOUT', default=3.05, cast=float)
+PAYMENT_GATEWAY_READ_TIMEOUT = config('PAYMENT_GATEWAY_READ_TIMEOUT', default=10.0, cast=float)
+PAYMENT_GATEWAY_RETRIES = 3
+PAYMENT_GATEWAY_BACKOFF = 0.3
+PAYMENT_GATEWAY_POOL_SIZE = config('PAYMENT_GATEWAY_POOL_SIZE', default=20, cast=int)
+
+# Stale order sweeper (see payments.sweeper): orders still open
+# PAYMENT_SWEEP_MIN_AGE seconds after checkout are checked with the gateway,
+# and closed once PAYMENT_ORDER_EXPIRY seconds old if nothing was captured.
+# Each run reads at most PAYMENT_SWEEP_MAX_ORDERS orders and resumes from a
+# checkpoint; PAYMENT_SWEEP_CONCURRENCY should not exceed the pool size.
+PAYMENT_SWEEP_MIN_AGE = 15 * 60
+PAYMENT_ORDER_EXPIRY = 24 * 60 * 60
+PAYMENT_SWEEP_BATCH_SIZE = config('PAYMENT_SWEEP_BATCH_SIZE', default=100, cast=int)
+PAYMENT_SWEEP_MAX_ORDERS = config('PAYMENT_SWEEP_MAX_ORDERS', default=5000, cast=int)
+PAYMENT_SWEEP_CONCURRENCY = config('PAYMENT_SWEEP_CONCURRENCY', default=8, cast=int)
+
+# Sharded campaign counters (see donations.shards) are folded back into
+# their campaigns this often (seconds)
+COUNTER_SHARDS_COMPACT_INTERVAL = config('COUNTER_SHARDS_COMPACT_INTERVAL', default=10, cast=float)
 
 # Celery Configuration
 CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='redis://localhost:6379/0')
@@ -220,6 +254,146 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+# Queued by the single givegrip-beat service in render.yaml, run by givegrip-worker
+CELERY_BEAT_SCHEDULE = {
+    # Safety net for webhooks whose processing task could not be queued
+    'process-payment-webhooks': {
+        'task': 'payments.tasks.process_payment_webhooks',
+        'schedule': 60.0,
+    },
+    'sweep-stale-orders': {
+        'task': 'payments.tasks.sweep_stale_orders',
+        'schedule': 5 * 60.0,
+    },
+    'compact-counter-shards': {
+        'task': 'donations.tasks.compact_counter_shards',
+        'schedule': COUNTER_SHARDS_COMPACT_INTERVAL,
+    },
+    'purge-idempotency-keys': {
+        'task': 'donations.tasks.purge_idempotency_keys',
+        'schedule': 60 * 60.0,
+    },
+    'refresh-similar-campaigns': {
+        'task': 'donations.tasks.refresh_similar_campaigns',
+        'schedule': 6 * 60 * 60.0,
+    },
+    'refresh-donor-recommendations': {
+        'task': 'donations.tasks.refresh_donor_recommendations',
+        'schedule': 15 * 60.0,
+    },
+    'rebuild-donor-recommendations': {
+        'task': 'donations.tasks.rebuild_donor_recommendations',
+        'schedule': 24 * 60 * 60.0,
+    },
+}
+
+# Payment webhooks
+# 'celery' hands stored events to a worker, as render.yaml deploys it. Without a
+# worker, 'inline' applies one batch in-process once the webhook request commits
+# and leaves the rest to the following webhooks.
+PAYMENTS_WEBHOOK_WORKER = config('PAYMENTS_WEBHOOK_WORKER', default='inline')
+PAYMENTS_WEBHOOK_BATCH_SIZE = config('PAYMENTS_WEBHOOK_BATCH_SIZE', default=500, cast=int)
+
+# Idempotency keys on the donate form (see donations.idempotency): responses
+# are replayed from the cache for IDEMPOTENCY_CACHE_TIMEOUT seconds and from
+# the database for IDEMPOTENCY_KEY_TTL seconds; a duplicate of a request still
+# in flight waits up to IDEMPOTENCY_WAIT_TIMEOUT seconds for its response.
+IDEMPOTENCY_CACHE_TIMEOUT = 10 * 60
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+IDEMPOTENCY_LOCK_TIMEOUT = 60
+IDEMPOTENCY_WAIT_TIMEOUT = 10.0
+
+# Cache
+# Use a shared Redis cache in production so every worker sees the same keys;
+# local development falls back to a per-process memory cache.
+CACHE_URL = config('CACHE_URL', default='')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Full-page cache for anonymous visitors (see givegrip.pagecache): pages are
+# re-rendered after PAGE_CACHE_TIMEOUT seconds or when their tags are
+# invalidated, and stale copies are served for up to PAGE_CACHE_STALE_TIMEOUT
+# seconds while one request renders the new one.
+PAGE_CACHE_ENABLED = config('PAGE_CACHE_ENABLED', default=True, cast=bool)
+PAGE_CACHE_TIMEOUT = config('PAGE_CACHE_TIMEOUT', default=300, cast=int)
+PAGE_CACHE_STALE_TIMEOUT = config('PAGE_CACHE_STALE_TIMEOUT', default=3600, cast=int)
+PAGE_CACHE_LOCK_TIMEOUT = 30
+# Campaign detail and dashboard aggregates (see donations.aggregates) are
+# retired with the pages showing them, and recomputed after this many seconds
+AGGREGATE_CACHE_TIMEOUT = config('AGGREGATE_CACHE_TIMEOUT', default=300, cast=int)
+
+# Live campaign totals over Server-Sent Events (see donations.live). Redis
+# carries them between workers when configured; otherwise they stay in process.
+LIVE_UPDATES_REDIS_URL = config('LIVE_UPDATES_REDIS_URL', default=CACHE_URL)
+LIVE_UPDATES_BROKER = config(
+    'LIVE_UPDATES_BROKER',
+    default='donations.live.RedisBroker' if LIVE_UPDATES_REDIS_URL else 'donations.live.LocalBroker',
+)
+LIVE_UPDATES_HEARTBEAT = 15
+LIVE_UPDATES_STREAM_TIMEOUT = 300
+
+# Page cache purges, single-flight locks, idempotency keys, view dedup and live
+# totals only reach the other worker processes through Redis
+WEB_CONCURRENCY = config('WEB_CONCURRENCY', default=1, cast=int)
+if WEB_CONCURRENCY > 1 and (not CACHE_URL or LIVE_UPDATES_BROKER == 'donations.live.LocalBroker'):
+    raise ImproperlyConfigured(
+        f'WEB_CONCURRENCY={WEB_CONCURRENCY} needs CACHE_URL and a shared LIVE_UPDATES_BROKER: '
+        'the memory cache and LocalBroker are private to each worker process'
+    )
+
+# Campaign counters
+# View and share increments are buffered per process and written in one
+# batched UPDATE every CAMPAIGN_COUNTER_FLUSH_INTERVAL seconds, or as soon as
+# CAMPAIGN_COUNTER_MAX_PENDING increments are waiting.
+CAMPAIGN_COUNTER_FLUSH_INTERVAL = config('CAMPAIGN_COUNTER_FLUSH_INTERVAL', default=10, cast=float)
+CAMPAIGN_COUNTER_MAX_PENDING = config('CAMPAIGN_COUNTER_MAX_PENDING', default=1000, cast=int)
+CAMPAIGN_VIEW_TRACKING = config('CAMPAIGN_VIEW_TRACKING', default=True, cast=bool)
+# Repeat views of a campaign by the same visitor within this many seconds count once
+CAMPAIGN_VIEW_DEDUP_WINDOW = config('CAMPAIGN_VIEW_DEDUP_WINDOW', default=1800, cast=int)
+# ... and repeat shares within this many seconds
+CAMPAIGN_SHARE_DEDUP_WINDOW = config('CAMPAIGN_SHARE_DEDUP_WINDOW', default=24 * 60 * 60, cast=int)
+# Anonymous visitors are told apart by client address, taken from X-Forwarded-For
+# when the app runs behind this many reverse proxies (1 on Render), else REMOTE_ADDR
+TRUSTED_PROXY_COUNT = config('TRUSTED_PROXY_COUNT', default=0, cast=int)
+
+# Trending campaigns: activity halves in weight every TRENDING_HALF_LIFE_HOURS.
+# Scores are stored relative to a landmark that starts at TRENDING_LANDMARK and
+# moves forward by itself (see donations.trending) before they leave float range.
+TRENDING_HALF_LIFE_HOURS = config('TRENDING_HALF_LIFE_HOURS', default=24, cast=float)
+TRENDING_LANDMARK = config('TRENDING_LANDMARK', default='2026-01-01T00:00:00+00:00')
+TRENDING_WEIGHTS = {'donation': 10.0, 'share': 2.0, 'view': 0.1}
+
+# "Similar campaigns" on the detail page: neighbours kept per campaign and the
+# weight of each signal in the combined score
+SIMILAR_CAMPAIGNS_K = config('SIMILAR_CAMPAIGNS_K', default=6, cast=int)
+SIMILAR_CAMPAIGNS_WEIGHTS = {'text': 0.5, 'category': 0.2, 'co_donation': 0.3}
+
+# "Donors like you also supported" on the dashboard: campaigns kept per donor,
+# and how far back the periodic refresh looks for recently active donors
+DONOR_RECOMMENDATIONS_N = config('DONOR_RECOMMENDATIONS_N', default=6, cast=int)
+DONOR_RECOMMENDATIONS_REFRESH_MINUTES = 30
+
+# In-process campaign autocomplete index: poll for edits made by other
+# workers every REFRESH seconds, rebuild (dropping deletions, refreshing
+# ranking amounts) every REBUILD seconds
+CAMPAIGN_AUTOCOMPLETE_REFRESH_INTERVAL = config('CAMPAIGN_AUTOCOMPLETE_REFRESH_INTERVAL', default=30, cast=float)
+CAMPAIGN_AUTOCOMPLETE_REBUILD_INTERVAL = config('CAMPAIGN_AUTOCOMPLETE_REBUILD_INTERVAL', default=3600, cast=float)
+
+# Cached CMS content is invalidated on save; the timeout only bounds memory
+CMS_CACHE_TIMEOUT = config('CMS_CACHE_TIMEOUT', default=60 * 60 * 6, cast=int)
+# Workers re-check the shared SiteSettings version at most this often (seconds)
+SITE_SETTINGS_LOCAL_TTL = config('SITE_SETTINGS_LOCAL_TTL', default=1.0, cast=float)
 
 # Crispy Forms
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
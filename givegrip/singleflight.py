@@ -0,0 +1,107 @@
+"""
+Single-flight recomputation of cached values.
+
+``get_or_compute`` keeps each value in the cache together with how long it
+took to compute and when it expires. Three things keep a hot key from
+turning into a burst of identical recomputations:
+
+* Early recomputation: a reader may refresh the value before it expires,
+  with a probability that rises as expiry nears and with the cost of the
+  computation (the "XFetch" rule ``now - delta * beta * log(rand) >= expiry``),
+  so usually one request refreshes it while everyone else still hits.
+* A lock key in the cache: only the request that adds it recomputes.
+* Stale fallback: while the lock is held, other readers get the previous
+  value, which is kept for ``stale_timeout`` seconds past expiry. With no
+  previous value they wait briefly for the lock holder's result.
+
+The lock and the wait are also available on their own, as ``leader`` and
+``wait_for``, for caches that decide freshness differently (the page cache).
+"""
+import math
+import random
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from django.core.cache import cache
+
+_Entry = namedtuple('_Entry', 'value delta expires')
+
+# How long readers without a stale value wait for the lock holder
+WAIT_TIMEOUT = 2.0
+WAIT_POLL = 0.05
+
+
+def _lock_key(key):
+    return f'{key}:lock'
+
+
+@contextmanager
+def leader(key, lock_timeout=30):
+    """True in the one request holding ``key``'s recompute lock, False in the others."""
+    lock = _lock_key(key)
+    acquired = cache.add(lock, 1, lock_timeout)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            cache.delete(lock)
+
+
+def wait_for(key, accept=lambda value: value is not None, timeout=None):
+    """Poll ``key`` until its value passes ``accept``; None after ``timeout`` (``WAIT_TIMEOUT``) seconds."""
+    deadline = time.monotonic() + (WAIT_TIMEOUT if timeout is None else timeout)
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_POLL)
+        value = cache.get(key)
+        if accept(value):
+            return value
+    return None
+
+
+def _should_recompute(entry, beta, now):
+    if beta <= 0:
+        return now >= entry.expires
+    # 1 - random() is in (0, 1], so the logarithm is finite and <= 0
+    return now - entry.delta * beta * math.log(1.0 - random.random()) >= entry.expires
+
+
+def _store(key, compute, timeout, stale_timeout):
+    started = time.time()
+    value = compute()
+    finished = time.time()
+    if timeout is None:
+        entry, hard_timeout = _Entry(value, finished - started, math.inf), None
+    else:
+        entry, hard_timeout = _Entry(value, finished - started, finished + timeout), timeout + stale_timeout
+    cache.set(key, entry, hard_timeout)
+    return value
+
+
+def get_or_compute(key, compute, timeout, stale_timeout=None, beta=1.0, lock_timeout=30):
+    """Return the cached value of ``key``, recomputing it at most once at a time.
+
+    ``timeout`` is how long a value is fresh (``None`` for ever) and
+    ``stale_timeout`` how much longer it may be served while being
+    recomputed (default: ``timeout``). ``beta`` > 1 favours earlier
+    recomputation, 0 disables it.
+    """
+    if stale_timeout is None:
+        stale_timeout = timeout or 0
+    entry = cache.get(key)
+    if not isinstance(entry, _Entry):
+        entry = None
+    if entry is not None and not _should_recompute(entry, beta, time.time()):
+        return entry.value
+
+    with leader(key, lock_timeout) as leading:
+        if leading:
+            return _store(key, compute, timeout, stale_timeout)
+
+    if entry is not None:
+        return entry.value
+    entry = wait_for(key, lambda value: isinstance(value, _Entry))
+    if entry is not None:
+        return entry.value
+    # The lock holder is slow or gone: compute for this request only
+    return compute()
@@ -0,0 +1,158 @@
+"""
+Compare-and-set status transitions.
+
+Models with a ``status`` field declare ``STATUS_TRANSITIONS``, mapping each
+target status to the statuses it may be reached from. ``transition`` moves
+rows with a single conditional statement:
+
+    UPDATE ... SET status = %s WHERE ... AND status IN (<allowed>) RETURNING *
+
+Only rows that were still in an allowed state are moved, and exactly those
+rows come back as instances. Callers run side effects (ledger, counters,
+notifications) for the returned rows only, so a webhook and a browser
+redirect reporting the same payment cannot both act on it, and a paid
+donation can never turn into a failed one. Nothing is read before the write.
+
+``StatusTransitionMixin`` routes status changes made through ``save()``
+through the same path, so the admin and code that edits a loaded instance
+follow the rules too.
+"""
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.db import connections, router, transaction
+from django.db.models.sql import UpdateQuery
+from django.utils import timezone
+
+
+def can_transition(model, from_status, to_status):
+    return from_status in model.STATUS_TRANSITIONS.get(to_status, ())
+
+
+def _supports_update_returning(connection):
+    # MariaDB returns columns from INSERT but not from UPDATE
+    return connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_columns_from_insert
+
+
+def _update_returning(queryset, values):
+    """Run ``queryset.update(**values)`` and return the updated rows as instances."""
+    model = queryset.model
+    connection = connections[queryset.db]
+    query = queryset.query.chain(UpdateQuery)
+    query.add_update_values(values)
+    query.annotations = {}
+    try:
+        sql, params = query.get_compiler(queryset.db).as_sql()
+    except EmptyResultSet:
+        return []
+    if not sql:
+        return []
+
+    fields = model._meta.concrete_fields
+    returning = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    with connection.cursor() as cursor:
+        cursor.execute(f'{sql} RETURNING {returning}', params)
+        rows = cursor.fetchall()
+
+    columns = [field.get_col(model._meta.db_table) for field in fields]
+    converters = [
+        connection.ops.get_db_converters(column) + column.get_db_converters(connection) for column in columns
+    ]
+    instances = []
+    for row in rows:
+        values = []
+        for value, column, column_converters in zip(row, columns, converters):
+            for converter in column_converters:
+                value = converter(value, column, connection)
+            values.append(value)
+        instances.append(model.from_db(queryset.db, [field.attname for field in fields], values))
+    return instances
+
+
+def _update_locked(queryset, values):
+    """Fallback for databases without ``UPDATE ... RETURNING``."""
+    with transaction.atomic(using=queryset.db):
+        pks = list(queryset.select_for_update().values_list('pk', flat=True))
+        if not pks:
+            return []
+        queryset.model._base_manager.using(queryset.db).filter(pk__in=pks).update(**values)
+        return list(queryset.model._base_manager.using(queryset.db).filter(pk__in=pks))
+
+
+def transition(queryset, to_status, **values):
+    """Move the rows of ``queryset`` that may reach ``to_status`` there.
+
+    ``values`` are written in the same statement and may be expressions.
+    Returns the moved rows; rows in any other state are left untouched.
+    """
+    model = queryset.model
+    allowed = model.STATUS_TRANSITIONS.get(to_status)
+    if not allowed:
+        return []
+    values = {'status': to_status, **values}
+    if any(field.name == 'updated_at' for field in model._meta.concrete_fields):
+        values.setdefault('updated_at', timezone.now())
+
+    queryset = queryset.filter(status__in=allowed)
+    if _supports_update_returning(connections[queryset.db]):
+        return _update_returning(queryset, values)
+    return _update_locked(queryset, values)
+
+
+class StatusTransitionMixin:
+    """Keeps ``save()`` from moving ``status`` outside ``STATUS_TRANSITIONS``.
+
+    New rows are inserted as they are. For existing rows every other field
+    is saved normally, with the caller's ``update_fields``, but the status
+    column is never written by the ``UPDATE``, so a stale instance cannot
+    undo a transition made elsewhere. A changed status goes through
+    ``transition``; if the row could not move (another worker got there
+    first, or the change is not allowed), the instance is given the stored
+    status instead. ``status_changed`` tells whether the last save moved it.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
+    def clean(self):
+        super().clean()
+        previous = getattr(self, '_loaded_status', None)
+        if (
+            not self._state.adding and previous is not None and self.status != previous
+            and not can_transition(type(self), previous, self.status)
+        ):
+            raise ValidationError({'status': f'Cannot change the status from {previous} to {self.status}.'})
+
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        if self._state.adding or force_insert:
+            super().save(force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields)
+            self._loaded_status = self.status
+            self.status_changed = True
+            return
+
+        self.status_changed = False
+        moving = (
+            (update_fields is None or 'status' in update_fields)
+            and self.status != getattr(self, '_loaded_status', None)
+        )
+        if not moving:
+            super().save(force_update=force_update, using=using, update_fields=update_fields)
+            return
+
+        if update_fields is not None:
+            update_fields = [name for name in update_fields if name != 'status']
+        using = using or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            if update_fields is None or update_fields:
+                super().save(force_update=force_update, using=using, update_fields=update_fields)
+            if transition(type(self)._base_manager.using(using).filter(pk=self.pk), self.status):
+                self.status_changed = True
+            else:
+                self.refresh_from_db(using=using, fields=['status'])
+            self._loaded_status = self.status
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        # The status column of an existing row only ever changes through transition()
+        values = [value for value in values if value[0].name != 'status']
+        return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
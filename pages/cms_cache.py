@@ -0,0 +1,129 @@
+"""
+Cached CMS content for the pages application.
+
+Each content type (site settings, statistics, features, testimonials, FAQs
+and banners) is kept in the Django cache as one blob under a key that
+includes a per-type version. Saving or deleting a row of the underlying
+model bumps that version (see ``pages.signals``), so readers never see a
+stale blob and a warm cache serves every page without a CMS query.
+
+``site_settings()`` additionally keeps the ``SiteSettings`` singleton in
+process memory. Workers only re-check its shared version every
+``SITE_SETTINGS_LOCAL_TTL`` seconds, so flags read on every request cost a
+function call, and an admin save reaches every worker within that window.
+"""
+import logging
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from givegrip import singleflight
+from .models import SiteSettings, Statistics, Feature, Testimonial, FAQ, Banner
+
+logger = logging.getLogger(__name__)
+
+
+def _load_statistics():
+    return list(Statistics.objects.filter(is_active=True, show_on_homepage=True).order_by('order')[:4])
+
+
+def _load_features():
+    return list(Feature.objects.filter(is_active=True, show_on_homepage=True).order_by('order')[:6])
+
+
+def _load_testimonials():
+    return list(Testimonial.objects.filter(is_active=True, is_featured=True).order_by('order')[:3])
+
+
+def _load_faqs():
+    return list(FAQ.objects.filter(is_active=True).order_by('order')[:6])
+
+
+def _load_banners():
+    # Every banner that has not ended yet; the start date is checked on read
+    # so scheduled banners appear without waiting for an invalidation.
+    return list(Banner.objects.filter(is_active=True, end_date__gte=timezone.now()).order_by('-created_at'))
+
+
+# Content type -> (model, loader)
+CONTENT_TYPES = {
+    'site_settings': (SiteSettings, SiteSettings.get_settings),
+    'statistics': (Statistics, _load_statistics),
+    'features': (Feature, _load_features),
+    'testimonials': (Testimonial, _load_testimonials),
+    'faqs': (FAQ, _load_faqs),
+    'banners': (Banner, _load_banners),
+}
+
+CACHED_MODELS = {model for model, _loader in CONTENT_TYPES.values()}
+
+
+def _version_key(name):
+    return f'cms:version:{name}'
+
+
+def _current_version(name):
+    version = cache.get(_version_key(name))
+    if version is None:
+        cache.add(_version_key(name), uuid.uuid4().hex, None)
+        version = cache.get(_version_key(name))
+    return version
+
+
+def get_content(name):
+    """Return the cached value of a CMS content type, loading it on a miss."""
+    return _get_version(name, _current_version(name))
+
+
+def _get_version(name, version):
+    _model, loader = CONTENT_TYPES[name]
+    # Single flight: one request reloads an expiring blob, the rest keep
+    # reading the previous copy
+    return singleflight.get_or_compute(f'cms:{name}:{version}', loader, settings.CMS_CACHE_TIMEOUT)
+
+
+# (settings, shared version, monotonic time of the last version check),
+# replaced as a whole so readers never see a half-updated entry
+_local_site_settings = (None, None, 0.0)
+
+
+def site_settings():
+    """The ``SiteSettings`` singleton, served from process memory."""
+    global _local_site_settings
+    value, version, checked_at = _local_site_settings
+    now = time.monotonic()
+    if value is not None and now - checked_at < settings.SITE_SETTINGS_LOCAL_TTL:
+        return value
+
+    current = _current_version('site_settings')
+    if value is None or current != version:
+        value = _get_version('site_settings', current)
+    _local_site_settings = (value, current, now)
+    return value
+
+
+def active_banners(limit=5):
+    """Banners running right now, newest first."""
+    now = timezone.now()
+    return [banner for banner in get_content('banners') if banner.start_date <= now <= banner.end_date][:limit]
+
+
+def invalidate(*names):
+    """Bump the version of the given content types, or of all of them."""
+    global _local_site_settings
+    names = names or tuple(CONTENT_TYPES)
+    for name in names:
+        cache.set(_version_key(name), uuid.uuid4().hex, None)
+    if 'site_settings' in names:
+        _local_site_settings = (None, None, 0.0)
+
+
+def invalidate_model(model):
+    """Invalidate every content type built from ``model`` once the transaction commits."""
+    names = [name for name, (content_model, _loader) in CONTENT_TYPES.items() if content_model is model]
+    if names:
+        transaction.on_commit(lambda: invalidate(*names))
@@ -1,65 +1,42 @@
-from .models import SiteSettings, Statistics, Feature, Testimonial, FAQ, Banner
+import logging
+
+from django.utils.functional import SimpleLazyObject
+
+from . import cms_cache
+
+logger = logging.getLogger(__name__)
+
+
+def _resolve(request, name, default, loader):
+    """Load a CMS value once per request, however many templates render."""
+    memo = request.__dict__.setdefault('_cms_content', {})
+    if name not in memo:
+        try:
+            memo[name] = loader()
+        except Exception as e:
+            # CMS tables may not exist yet (fresh install, partial migrations)
+            logger.warning(f"{name} not available: {e}")
+            memo[name] = default
+    return memo[name]
+
+
+def _lazy(request, name, default, loader=None):
+    """A proxy that only loads ``name`` when a template touches it."""
+    loader = loader or (lambda: cms_cache.get_content(name))
+    return SimpleLazyObject(lambda: _resolve(request, name, default, loader))
 
 
 def cms_settings(request):
-    """Add CMS settings and dynamic content to all templates."""
-    
-    # Initialize default values
-    settings = None
-    statistics = []
-    features = []
-    testimonials = []
-    faqs = []
-    banners = []
-    
-    # Try to get CMS data, but handle gracefully if tables don't exist
-    try:
-        # Get site settings
-        settings = SiteSettings.get_settings()
-    except Exception as e:
-        print(f"Site settings not available: {e}")
-    
-    # Get active statistics for homepage
-    try:
-        statistics = Statistics.objects.filter(is_active=True, show_on_homepage=True).order_by('order')[:4]
-    except Exception as e:
-        print(f"Statistics not available: {e}")
-    
-    # Get active features for homepage
-    try:
-        features = Feature.objects.filter(is_active=True, show_on_homepage=True).order_by('order')[:6]
-    except Exception as e:
-        print(f"Features not available: {e}")
-    
-    # Get featured testimonials
-    try:
-        testimonials = Testimonial.objects.filter(is_active=True, is_featured=True).order_by('order')[:3]
-    except Exception as e:
-        print(f"Testimonials not available: {e}")
-    
-    # Get active FAQs
-    try:
-        faqs = FAQ.objects.filter(is_active=True).order_by('order')[:6]
-    except Exception as e:
-        print(f"FAQs not available: {e}")
-    
-    # Get active banners
-    try:
-        from django.utils import timezone
-        now = timezone.now()
-        banners = Banner.objects.filter(
-            is_active=True,
-            start_date__lte=now,
-            end_date__gte=now
-        ).order_by('-created_at')[:5]
-    except Exception as e:
-        print(f"Banners not available: {e}")
-    
+    """Add CMS settings and dynamic content to all templates.
+
+    Nothing is loaded here: each value is a lazy proxy, so pages that never
+    use the CMS content (JSON responses, admin, error pages) pay nothing.
+    """
     return {
-        'site_settings': settings,
-        'homepage_statistics': statistics,
-        'homepage_features': features,
-        'featured_testimonials': testimonials,
-        'homepage_faqs': faqs,
-        'active_banners': banners,
+        'site_settings': _lazy(request, 'site_settings', None, cms_cache.site_settings),
+        'homepage_statistics': _lazy(request, 'statistics', []),
+        'homepage_features': _lazy(request, 'features', []),
+        'featured_testimonials': _lazy(request, 'testimonials', []),
+        'homepage_faqs': _lazy(request, 'faqs', []),
+        'active_banners': _lazy(request, 'banners', [], cms_cache.active_banners),
     }
@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from pages import cms_cache
+from pages.context_processors import cms_settings
+
+PAGES = ['pages:about', 'pages:faq', 'pages:terms_of_service']
+
+
+def eager_cms_settings(request):
+    """Baseline: the context processor as it used to behave, loading every value up front."""
+    context = cms_settings(request)
+    for value in context.values():
+        bool(value)
+    return context
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure static page throughput with eager and lazy CMS context, rendering every request; '
+        'the "cached" rows are served from the page cache for comparison'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--cold', action='store_true',
+                            help='Invalidate the CMS cache before every request so content is always reloaded')
+
+    def handle(self, *args, **options):
+        client = Client(HTTP_HOST='localhost')
+        # The page cache would answer the eager and lazy runs without rendering anything
+        modes = [
+            ('eager', {'TEMPLATES': self.eager_templates(), 'PAGE_CACHE_ENABLED': False}),
+            ('lazy', {'PAGE_CACHE_ENABLED': False}),
+            ('cached', {'PAGE_CACHE_ENABLED': True}),
+        ]
+
+        for name in PAGES:
+            url = reverse(name)
+            for mode, overrides in modes:
+                with override_settings(**overrides):
+                    client.get(url)  # warm up templates and caches
+                    with CaptureQueriesContext(connection) as queries:
+                        client.get(url)
+                    rate = self.run(client, url, options['requests'], options['cold'])
+                self.stdout.write(
+                    f'{url:<22} {mode:<6} {rate:8.0f} requests/s  {len(queries)} queries/request (warm)'
+                )
+
+    def eager_templates(self):
+        from django.conf import settings
+        templates = [dict(backend) for backend in settings.TEMPLATES]
+        for backend in templates:
+            options = dict(backend.get('OPTIONS', {}))
+            options['context_processors'] = [
+                f'{__name__}.eager_cms_settings' if path == 'pages.context_processors.cms_settings' else path
+                for path in options.get('context_processors', [])
+            ]
+            backend['OPTIONS'] = options
+        return templates
+
+    def run(self, client, url, count, cold):
+        started = time.perf_counter()
+        for _ in range(count):
+            if cold:
+                cms_cache.invalidate()
+            client.get(url)
+        return count / (time.perf_counter() - started)
@@ -0,0 +1,20 @@
+"""
+Signal handlers for the pages application.
+
+Keep the cached CMS content in ``pages.cms_cache``, and the cached pages
+that render it, in step with the admin.
+"""
+from django.db.models.signals import post_delete, post_save
+
+from givegrip import pagecache
+from . import cms_cache
+
+
+def invalidate_cms_cache(sender, **kwargs):
+    cms_cache.invalidate_model(sender)
+    pagecache.invalidate_on_commit(pagecache.SITE_TAG)
+
+
+for model in cms_cache.CACHED_MODELS:
+    post_save.connect(invalidate_cms_cache, sender=model, dispatch_uid=f'cms-cache-save-{model.__name__}')
+    post_delete.connect(invalidate_cms_cache, sender=model, dispatch_uid=f'cms-cache-delete-{model.__name__}')
@@ -1,3 +1,236 @@
-from django.test import TestCase
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from donations.models import Campaign, Donation
+from donations.ledger import record_paid_donation
+from givegrip import pagecache, singleflight
+from pages import cms_cache
+from pages.context_processors import cms_settings
+from pages.models import FAQ, SiteSettings
+
+
+def reset_cms_cache():
+    cache.clear()
+    cms_cache.invalidate()
+    cms_cache.site_settings()
+
+
+@override_settings(PAGE_CACHE_ENABLED=False)
+class CMSCacheTests(TestCase):
+    """CMS content is served from the cache until the admin changes it."""
+
+    def setUp(self):
+        reset_cms_cache()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.faq = FAQ.objects.create(question='How do I donate?', answer='Pick a campaign.')
+
+    def test_warm_cache_skips_cms_queries(self):
+        self.client.get(reverse('pages:home'))
+        # Only the featured and trending campaigns are read from the database
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('pages:home'))
+        self.assertEqual(response.context['faqs'], [self.faq])
+
+    def test_save_invalidates(self):
+        self.client.get(reverse('pages:home'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.faq.question = 'How can I donate?'
+            self.faq.save()
+        response = self.client.get(reverse('pages:home'))
+        self.assertEqual(response.context['faqs'][0].question, 'How can I donate?')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.faq.delete()
+        response = self.client.get(reverse('pages:home'))
+        self.assertEqual(response.context['faqs'], [])
+
+    def test_context_is_lazy_and_memoised(self):
+        # Static pages never touch the CMS values, so nothing is loaded
+        with self.assertNumQueries(0):
+            self.client.get(reverse('pages:about'))
+
+        request = RequestFactory().get('/')
+        first, second = cms_settings(request), cms_settings(request)
+        with self.assertNumQueries(1):
+            self.assertEqual(list(first['homepage_faqs']), [self.faq])
+            self.assertEqual(list(second['homepage_faqs']), [self.faq])
+
+
+class SiteSettingsCacheTests(TestCase):
+    """The settings singleton is read from memory and follows admin saves."""
+
+    def setUp(self):
+        reset_cms_cache()
+
+    def test_reads_are_free(self):
+        with self.assertNumQueries(0):
+            for _ in range(10):
+                cms_cache.site_settings()
+
+    def test_saves_are_picked_up(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            site_settings = SiteSettings.get_settings()
+            site_settings.maintenance_mode = True
+            site_settings.save()
+        self.assertTrue(cms_cache.site_settings().maintenance_mode)
+
+
+@override_settings(CAMPAIGN_VIEW_TRACKING=False)
+class PageCacheTests(TestCase):
+    """Anonymous pages are cached and purged by the campaigns they show."""
+
+    def setUp(self):
+        reset_cms_cache()
+        self.creator = User.objects.create_user(username='creator', email='creator@example.com', password='pass12345')
+        now = timezone.now()
+        self.water, self.school = [
+            Campaign.objects.create(
+                title=title, description='Test', goal_amount=Decimal('100.00'), creator=self.creator,
+                status='active', start_date=now, end_date=now + timedelta(days=30),
+            )
+            for title in ('Clean water', 'School books')
+        ]
+
+    def url(self, campaign):
+        return reverse('main_campaigns:campaign_detail', kwargs={'pk': campaign.pk})
+
+    def test_second_visit_is_served_from_cache(self):
+        self.assertEqual(self.client.get(self.url(self.water))['X-Page-Cache'], 'miss')
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url(self.water))
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, 'Clean water')
+
+        self.client.force_login(self.creator)
+        self.assertFalse(self.client.get(self.url(self.water)).has_header('X-Page-Cache'))
+
+    def test_payment_purges_only_pages_showing_the_campaign(self):
+        list_url = reverse('main_campaigns:campaign_list')
+        for url in (self.url(self.water), self.url(self.school), list_url):
+            self.client.get(url)
+
+        donation = Donation.objects.create(campaign=self.water, donor=self.creator, amount=Decimal('25.00'))
+        with self.captureOnCommitCallbacks(execute=True):
+            donation.status = 'paid'
+            donation.save()
+            record_paid_donation(donation)
+
+        self.assertEqual(self.client.get(self.url(self.water))['X-Page-Cache'], 'miss')
+        self.assertEqual(self.client.get(list_url)['X-Page-Cache'], 'miss')
+        self.assertEqual(self.client.get(self.url(self.school))['X-Page-Cache'], 'hit')
+
+    def test_activated_campaign_purges_lists(self):
+        list_url = reverse('main_campaigns:campaign_list')
+        self.client.get(list_url)
+        now = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            draft = Campaign.objects.create(
+                title='Library shelves', description='Test', goal_amount=Decimal('100.00'),
+                status='draft', start_date=now, end_date=now + timedelta(days=30),
+            )
+        self.assertEqual(self.client.get(list_url)['X-Page-Cache'], 'hit')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            draft.status = 'active'
+            draft.save()
+        response = self.client.get(list_url)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Library shelves')
+
+    def test_stale_page_served_while_another_request_renders(self):
+        self.client.get(self.url(self.water))
+        pagecache.invalidate(pagecache.campaign_tag(self.water.pk))
+        response = self.client.get(self.url(self.water))
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+
+        pagecache.invalidate(pagecache.campaign_tag(self.water.pk))
+        lock = singleflight._lock_key(pagecache._page_key(response.wsgi_request))
+        cache.add(lock, 1)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url(self.water))
+        self.assertEqual(response['X-Page-Cache'], 'stale')
+
+    def test_cold_page_waits_for_the_request_rendering_it(self):
+        url = self.url(self.school)
+        key = pagecache._page_key(RequestFactory().get(url))
+        cache.add(singleflight._lock_key(key), 1)
+        rendered = {'content': b'rendered elsewhere', 'content_type': 'text/html', 'tags': {}, 'fresh_until': 0}
+        threading.Timer(0.05, cache.set, args=(key, rendered)).start()
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual((response['X-Page-Cache'], response.content), ('hit', b'rendered elsewhere'))
+
+        # The renderer never finishes: this request renders for itself
+        cache.delete(key)
+        with mock.patch.object(singleflight, 'WAIT_TIMEOUT', 0.1):
+            response = self.client.get(url)
+        self.assertNotIn('X-Page-Cache', response)
+        self.assertContains(response, 'School books')
+
+
+class SingleFlightTests(TestCase):
+    """Concurrent readers of an expired key trigger a single recompute."""
+
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def compute(self):
+        with self.lock:
+            self.calls += 1
+            value = self.calls
+        time.sleep(0.2)
+        return value
+
+    def get(self):
+        return singleflight.get_or_compute('singleflight:test', self.compute, timeout=60, beta=0)
+
+    def run_concurrently(self, count=20):
+        barrier = threading.Barrier(count)
+        results = []
+
+        def worker():
+            barrier.wait()
+            results.append(self.get())
+
+        threads = [threading.Thread(target=worker) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_one_recompute_per_key_per_expiry(self):
+        # Cold key: one computes, the rest wait for its result
+        self.assertEqual(self.run_concurrently(), [1] * 20)
+        self.assertEqual(self.calls, 1)
+
+        entry = cache.get('singleflight:test')
+        cache.set('singleflight:test', entry._replace(expires=time.time() - 1))
+        # Expired key: one recomputes, the rest are served the stale value
+        results = self.run_concurrently()
+        self.assertEqual(self.calls, 2)
+        self.assertIn(1, results)
+        self.assertIn(2, results)
+        self.assertEqual(self.get(), 2)
+
+    def test_early_recompute_scales_with_cost(self):
+        self.get()
+        entry = cache.get('singleflight:test')
+        with mock.patch('givegrip.singleflight.random.random', return_value=0.5):
+            # 0.2s to compute and 60s left: not yet
+            singleflight.get_or_compute('singleflight:test', self.compute, timeout=60)
+            self.assertEqual(self.calls, 1)
+            # Expensive and about to expire: refresh ahead of time
+            cache.set('singleflight:test', entry._replace(delta=10.0, expires=time.time() + 1))
+            self.assertEqual(singleflight.get_or_compute('singleflight:test', self.compute, timeout=60), 2)
@@ -3,45 +3,44 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.core.mail import send_mail
 from django.conf import settings
+from donations import trending
+from donations.aggregates import donor_aggregates
 from donations.models import Campaign
+from donations.shards import with_pending
+from givegrip.pagecache import CAMPAIGN_LIST_TAG, add_tags, cache_public_page, campaign_tag
+from pages import cms_cache
 from pages.models import ContactMessage
 
 # Create your views here.
+@cache_public_page(CAMPAIGN_LIST_TAG)
 def home(request):
     """Home page view."""
-    featured_campaigns = Campaign.objects.filter(
+    featured_campaigns = list(Campaign.objects.with_progress().filter(
         is_featured=True, 
         status='active'
-    )[:6]
+    )[:6])
+    trending_campaigns = list(trending.trending_campaigns(limit=3))
+    with_pending(featured_campaigns + trending_campaigns)
+    add_tags(request, *[campaign_tag(campaign.pk) for campaign in featured_campaigns + trending_campaigns])
     
-    # Initialize empty lists for CMS data
+    # CMS content comes from the cache; see pages.cms_cache
     statistics = []
     features = []
     testimonials = []
     faqs = []
     
-    # Try to get CMS data, but handle gracefully if tables don't exist
     try:
-        from pages.models import Statistics, Feature, Testimonial, FAQ
-        
-        # Get statistics for homepage
-        statistics = Statistics.objects.filter(is_active=True, show_on_homepage=True).order_by('order')[:4]
-        
-        # Get features for homepage
-        features = Feature.objects.filter(is_active=True, show_on_homepage=True).order_by('order')[:6]
-        
-        # Get featured testimonials
-        testimonials = Testimonial.objects.filter(is_active=True, is_featured=True).order_by('order')[:3]
-        
-        # Get FAQs for homepage
-        faqs = FAQ.objects.filter(is_active=True).order_by('order')[:6]
-        
+        statistics = cms_cache.get_content('statistics')
+        features = cms_cache.get_content('features')
+        testimonials = cms_cache.get_content('testimonials')
+        faqs = cms_cache.get_content('faqs')
     except Exception as e:
         # If CMS tables don't exist yet, just continue with empty data
         print(f"CMS data not available: {e}")
     
     context = {
         'featured_campaigns': featured_campaigns,
+        'trending_campaigns': trending_campaigns,
         'statistics': statistics,
         'features': features,
         'testimonials': testimonials,
@@ -49,6 +48,7 @@ def home(request):
     }
     return render(request, 'home.html', context)
 
+@cache_public_page()
 def about(request):
     """About page view."""
     return render(request, 'about.html')
@@ -101,18 +101,22 @@ def contact(request):
     
     return render(request, 'contact.html')
 
+@cache_public_page()
 def how_it_works(request):
     """How it works page view."""
     return render(request, 'how_it_works.html')
 
+@cache_public_page()
 def faq(request):
     """FAQ page view."""
     return render(request, 'faq.html')
 
+@cache_public_page()
 def privacy_policy(request):
     """Privacy policy page view."""
     return render(request, 'privacy_policy.html')
 
+@cache_public_page()
 def terms_of_service(request):
     """Terms of service page view."""
     return render(request, 'terms_of_service.html')
@@ -124,13 +128,8 @@ def help_center(request):
 @login_required
 def dashboard(request):
     """User dashboard view."""
-    # Get user's donations
-    donations = request.user.donations.all().order_by('-created_at')
-    
-    # Calculate donation statistics
-    total_donations = donations.count()
-    total_amount = sum(donation.amount for donation in donations if donation.status == 'paid')
-    campaigns_supported = donations.values('campaign').distinct().count()
+    # Get user's recent donations
+    donations = request.user.donations.select_related('campaign').order_by('-created_at')
     
     # Get user's campaigns
     campaigns = request.user.campaigns.all().order_by('-created_at')
@@ -138,11 +137,10 @@ def dashboard(request):
     
     context = {
         'donations': donations[:5],  # Show last 5 donations
-        'total_donations': total_donations,
-        'total_amount': total_amount,
-        'campaigns_supported': campaigns_supported,
         'campaigns': campaigns[:5],  # Show last 5 campaigns
         'campaigns_count': campaigns_count,
+        # Donation totals and recommendations, recomputed by one request at a time
+        **donor_aggregates(request.user),
     }
     
     return render(request, 'dashboard.html', context)
@@ -0,0 +1,229 @@
+"""
+Payment gateway clients.
+
+Views and tasks talk to the gateway through ``gateway()``, which returns
+the process-wide instance of the class named by ``PAYMENT_GATEWAY``:
+
+* ``RazorpayGateway`` calls the Razorpay REST API (or anything speaking it,
+  such as the stub in ``payments.stub_gateway``, via
+  ``PAYMENT_GATEWAY_API_URL``). All calls share one ``requests.Session``,
+  so connections are kept alive and pooled across requests. Each call has
+  connect and read timeouts. Connection failures are retried with
+  exponential backoff. Reads and 429/5xx answers are retried only for GETs,
+  so an order or refund is never submitted twice.
+* ``LocalGateway`` makes up order ids without any network call, which is
+  what development and the test suite use when no Razorpay keys are set.
+  Each order carries a simulated checkout payment, signed with a key
+  derived from ``SECRET_KEY``; only that signature verifies. It refuses to
+  start unless ``PAYMENT_LOCAL_GATEWAY`` is set, which it is by default only
+  with ``DEBUG``.
+
+Razorpay webhooks are checked with ``verify_webhook_signature`` before
+they are stored.
+
+Every call is timed; ``stats()`` returns the count, errors and total
+seconds per operation, so gateway latency shows up in benchmarks.
+"""
+import hashlib
+import hmac
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.crypto import salted_hmac
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class GatewayError(Exception):
+    """The gateway could not be reached or rejected the request."""
+
+
+def to_subunits(amount):
+    """Amount in paise (or cents), as the gateway expects it."""
+    return int((Decimal(amount) * 100).quantize(Decimal('1')))
+
+
+class Gateway:
+    """Order creation, payment lookup and refunds."""
+
+    def __init__(self):
+        self._stats_lock = threading.Lock()
+        self._stats = defaultdict(lambda: {'calls': 0, 'errors': 0, 'seconds': 0.0})
+
+    def create_order(self, amount, currency, receipt, notes=None):
+        """Create an order; returns the gateway's order, with its ``id``."""
+        raise NotImplementedError
+
+    def fetch_payment(self, payment_id):
+        raise NotImplementedError
+
+    def fetch_order_payments(self, order_id):
+        """The payments attempted against an order, oldest first."""
+        raise NotImplementedError
+
+    def refund(self, payment_id, amount=None):
+        """Refund a captured payment, in full unless ``amount`` is given."""
+        raise NotImplementedError
+
+    def verify_signature(self, order_id, payment_id, signature):
+        """Whether the checkout's payment signature is genuine."""
+        raise NotImplementedError
+
+    def stats(self):
+        with self._stats_lock:
+            return {operation: dict(values) for operation, values in self._stats.items()}
+
+    def _record(self, operation, started, failed):
+        with self._stats_lock:
+            entry = self._stats[operation]
+            entry['calls'] += 1
+            entry['errors'] += failed
+            entry['seconds'] += time.perf_counter() - started
+
+
+class RazorpayGateway(Gateway):
+    """Razorpay REST API over a pooled, retrying HTTP session."""
+
+    def __init__(self, url=None, key_id=None, key_secret=None, pool_size=None):
+        super().__init__()
+        self.url = (url or settings.PAYMENT_GATEWAY_API_URL).rstrip('/')
+        self.key_id = key_id if key_id is not None else settings.RAZORPAY_KEY_ID
+        self.key_secret = key_secret if key_secret is not None else settings.RAZORPAY_KEY_SECRET
+        self.timeout = (settings.PAYMENT_GATEWAY_CONNECT_TIMEOUT, settings.PAYMENT_GATEWAY_READ_TIMEOUT)
+        self.session = self._session(pool_size or settings.PAYMENT_GATEWAY_POOL_SIZE)
+
+    def _session(self, pool_size):
+        retry = Retry(
+            total=settings.PAYMENT_GATEWAY_RETRIES,
+            backoff_factor=settings.PAYMENT_GATEWAY_BACKOFF,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({'GET'}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, max_retries=retry,
+        )
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.auth = (self.key_id, self.key_secret)
+        return session
+
+    def _request(self, operation, method, path, **kwargs):
+        started = time.perf_counter()
+        failed = True
+        try:
+            response = self.session.request(method, f'{self.url}{path}', timeout=self.timeout, **kwargs)
+            if response.status_code >= 400:
+                raise GatewayError(f'{operation} failed with HTTP {response.status_code}: {response.text[:200]}')
+            failed = False
+            return response.json()
+        except requests.RequestException as e:
+            logger.warning('Payment gateway %s failed: %s', operation, e)
+            raise GatewayError(f'{operation} failed: {e}') from e
+        except ValueError as e:
+            raise GatewayError(f'{operation} returned invalid JSON') from e
+        finally:
+            self._record(operation, started, failed)
+
+    def create_order(self, amount, currency, receipt, notes=None):
+        payload = {'amount': to_subunits(amount), 'currency': currency, 'receipt': receipt, 'notes': notes or {}}
+        return self._request('create_order', 'POST', '/orders', json=payload)
+
+    def fetch_payment(self, payment_id):
+        return self._request('fetch_payment', 'GET', f'/payments/{payment_id}')
+
+    def fetch_order_payments(self, order_id):
+        return self._request('fetch_order_payments', 'GET', f'/orders/{order_id}/payments').get('items', [])
+
+    def refund(self, payment_id, amount=None):
+        payload = {} if amount is None else {'amount': to_subunits(amount)}
+        return self._request('refund', 'POST', f'/payments/{payment_id}/refund', json=payload)
+
+    def verify_signature(self, order_id, payment_id, signature):
+        expected = hmac.new(
+            self.key_secret.encode(), f'{order_id}|{payment_id}'.encode(), hashlib.sha256
+        ).hexdigest()
+        return hmac.compare_digest(expected, signature or '')
+
+
+class LocalGateway(Gateway):
+    """In-process stand-in for development and tests; accepts the payments it signed itself."""
+
+    def __init__(self):
+        if not settings.PAYMENT_LOCAL_GATEWAY:
+            raise ImproperlyConfigured(
+                'LocalGateway accepts made-up payments; set RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET '
+                '(or PAYMENT_LOCAL_GATEWAY=True outside production)'
+            )
+        super().__init__()
+
+    def sign(self, order_id, payment_id):
+        return salted_hmac('payments.LocalGateway', f'{order_id}|{payment_id}', algorithm='sha256').hexdigest()
+
+    def create_order(self, amount, currency, receipt, notes=None):
+        started = time.perf_counter()
+        order_id = f'order_test_{uuid.uuid4().hex[:16]}'
+        payment_id = f'pay_test_{uuid.uuid4().hex[:14]}'
+        order = {
+            'id': order_id,
+            'amount': to_subunits(amount),
+            'currency': currency,
+            'receipt': receipt,
+            'status': 'created',
+            # What the simulated checkout reports back once "paid"
+            'test_payment': {'id': payment_id, 'signature': self.sign(order_id, payment_id)},
+        }
+        self._record('create_order', started, False)
+        return order
+
+    def fetch_payment(self, payment_id):
+        return {'id': payment_id, 'status': 'captured'}
+
+    def fetch_order_payments(self, order_id):
+        # Checkouts report captures through the redirect; none are known here
+        return []
+
+    def refund(self, payment_id, amount=None):
+        return {'id': f'rfnd_test_{uuid.uuid4().hex[:14]}', 'payment_id': payment_id, 'status': 'processed'}
+
+    def verify_signature(self, order_id, payment_id, signature):
+        return hmac.compare_digest(self.sign(order_id, payment_id), signature or '')
+
+
+def verify_webhook_signature(body, signature, secret=None):
+    """Whether ``signature`` is the HMAC-SHA256 of the raw webhook ``body``.
+
+    Razorpay signs webhooks with the secret set on the webhook in its
+    dashboard (``RAZORPAY_WEBHOOK_SECRET``), not with the API key. Without a
+    secret nothing verifies.
+    """
+    secret = settings.RAZORPAY_WEBHOOK_SECRET if secret is None else secret
+    if not secret:
+        return False
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature or '')
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def gateway():
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = import_string(settings.PAYMENT_GATEWAY)()
+    return _gateway
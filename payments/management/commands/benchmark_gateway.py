@@ -0,0 +1,69 @@
+import statistics
+import threading
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from payments.gateway import GatewayError, RazorpayGateway
+from payments.stub_gateway import start_stub
+
+
+class Command(BaseCommand):
+    help = 'Measure order creation throughput and latency against the payment gateway API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Gateway API URL (a local stub is started otherwise)')
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--latency-ms', type=float, default=5.0, help='Latency of the local stub')
+
+    def handle(self, *args, **options):
+        stub = None
+        url = options['url']
+        if not url:
+            stub = start_stub(latency=options['latency_ms'] / 1000)
+            url = stub.url
+            self.stdout.write(f'Started stub gateway at {url}')
+        try:
+            for pooled in (False, True):
+                latencies, errors, elapsed = self.run(url, options['requests'], options['concurrency'], pooled)
+                label = 'pooled session  ' if pooled else 'new connections '
+                self.stdout.write(
+                    f'{label}: {len(latencies) / elapsed:7.0f} orders/s, '
+                    f'mean {statistics.mean(latencies) * 1000:6.1f} ms, '
+                    f'p95 {statistics.quantiles(latencies, n=20)[-1] * 1000:6.1f} ms, {errors} error(s)'
+                )
+        finally:
+            if stub is not None:
+                stub.shutdown()
+                stub.server_close()
+
+    def run(self, url, count, concurrency, pooled):
+        shared = RazorpayGateway(url=url, key_id='bench', key_secret='bench', pool_size=concurrency)
+        latencies, errors = [], []
+        lock = threading.Lock()
+
+        def work(calls):
+            for i in range(calls):
+                client = shared if pooled else RazorpayGateway(url=url, key_id='bench', key_secret='bench')
+                started = time.perf_counter()
+                try:
+                    client.create_order(Decimal('100.00'), 'INR', receipt=f'bench-{i}')
+                except GatewayError:
+                    with lock:
+                        errors.append(i)
+                    continue
+                finally:
+                    if not pooled:
+                        client.session.close()
+                with lock:
+                    latencies.append(time.perf_counter() - started)
+
+        threads = [threading.Thread(target=work, args=(count // concurrency,)) for _ in range(concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies, len(errors), time.perf_counter() - started
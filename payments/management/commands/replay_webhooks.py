@@ -0,0 +1,105 @@
+import json
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from donations.models import Campaign, Donation
+from payments.models import PaymentWebhook, RazorpayOrder
+from payments.webhooks import process_pending_webhooks
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the webhook processor by replaying a JSON-lines file of Razorpay events'
+
+    def add_arguments(self, parser):
+        parser.add_argument('event_file', nargs='?', help='JSON-lines file, one webhook body per line')
+        parser.add_argument('--synthesize', type=int, default=0,
+                            help='Generate this many orders with a captured event each instead of reading a file')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--keep', action='store_true', help='Commit the replayed data instead of rolling back')
+
+    def handle(self, *args, **options):
+        if not options['event_file'] and not options['synthesize']:
+            raise CommandError('Pass an event file or --synthesize N')
+
+        try:
+            with transaction.atomic():
+                events = self.load_events(options)
+                self.replay(events, options['batch_size'])
+                if not options['keep']:
+                    raise Rollback
+        except Rollback:
+            self.stdout.write('Rolled back replayed data (use --keep to commit it)')
+
+    def load_events(self, options):
+        if options['synthesize']:
+            return self.synthesize(options['synthesize'])
+
+        events = []
+        with open(options['event_file']) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    events.append(json.loads(line))
+        return events
+
+    def synthesize(self, count):
+        """Create a campaign with ``count`` pending orders and one captured event per order."""
+        donor, _ = User.objects.get_or_create(username='webhook_bench', defaults={'email': 'webhook_bench@example.com'})
+        now = timezone.now()
+        campaign = Campaign.objects.create(
+            title='Webhook benchmark', description='Benchmark campaign', goal_amount=Decimal('1000000.00'),
+            status='active', start_date=now, end_date=now + timedelta(days=30),
+        )
+        donations = Donation.objects.bulk_create([
+            Donation(campaign=campaign, donor=donor, amount=Decimal('100.00'), status='created')
+            for _ in range(count)
+        ])
+        orders = RazorpayOrder.objects.bulk_create([
+            RazorpayOrder(donation=d, razorpay_order_id=f'order_bench_{uuid.uuid4().hex[:16]}', amount=d.amount)
+            for d in donations
+        ])
+        return [
+            {
+                'event': 'payment.captured',
+                'payload': {'payment': {'entity': {'id': f'pay_bench_{i}', 'order_id': o.razorpay_order_id}}},
+            }
+            for i, o in enumerate(orders)
+        ]
+
+    def replay(self, events, batch_size):
+        webhooks = [
+            PaymentWebhook(
+                event_type=event.get('event', ''),
+                event_id=event.get('id') or f'bench_{uuid.uuid4().hex}',
+                payload=event,
+            )
+            for event in events
+        ]
+
+        started = time.perf_counter()
+        PaymentWebhook.objects.bulk_create(webhooks, batch_size=batch_size, ignore_conflicts=True)
+        ingested = time.perf_counter() - started
+
+        started = time.perf_counter()
+        handled = process_pending_webhooks(batch_size=batch_size)
+        processed = time.perf_counter() - started
+
+        failed = PaymentWebhook.objects.filter(pk__in=[w.pk for w in webhooks]).exclude(processing_error='').count()
+
+        self.stdout.write(f'Events:     {len(webhooks)}')
+        self.stdout.write(f'Ingest:     {ingested:.3f}s ({len(webhooks) / max(ingested, 1e-9):.0f} events/s)')
+        self.stdout.write(f'Process:    {processed:.3f}s ({handled / max(processed, 1e-9):.0f} events/s, batch size {batch_size})')
+        self.stdout.write(f'Errors:     {failed}')
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from payments.stub_gateway import StubGatewayServer
+
+
+class Command(BaseCommand):
+    help = 'Serve a local stand-in for the Razorpay API for tests and load tests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency-ms', type=float, default=0.0, help='Delay added to every request')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with a 503')
+        parser.add_argument('--verbose', action='store_true', help='Log every request')
+
+    def handle(self, *args, **options):
+        server = StubGatewayServer(
+            host=options['host'], port=options['port'], latency=options['latency_ms'] / 1000,
+            error_rate=options['error_rate'], verbose=options['verbose'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'✓ Stub gateway listening on {server.url}'))
+        self.stdout.write(
+            f'Use it with PAYMENT_GATEWAY=payments.gateway.RazorpayGateway PAYMENT_GATEWAY_API_URL={server.url}'
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from payments.models import SweepCheckpoint
+from payments.sweeper import sweep_stale_orders
+
+
+class Command(BaseCommand):
+    help = 'Settle open Razorpay orders with the gateway and expire abandoned donations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-orders', type=int, help='Orders to read in this run')
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument('--restart', action='store_true', help='Start every walk from the beginning')
+
+    def handle(self, *args, **options):
+        if options['restart']:
+            SweepCheckpoint.objects.update(position_created_at=None, position_id=None)
+
+        metrics = sweep_stale_orders(max_orders=options['max_orders'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Swept {metrics['orders_scanned']} open orders and {metrics['donations_scanned']} orphaned "
+            f"donations in {metrics['batches']} batches ({metrics['seconds']:.2f}s, "
+            f"{metrics['orders_per_second']:.0f} orders/s)"
+        ))
+        self.stdout.write(
+            f"  paid {metrics['paid']}, failed {metrics['failed']}, cancelled {metrics['cancelled']}, "
+            f"left open {metrics['left_open']}, donations expired {metrics['expired_donations']}"
+        )
+        self.stdout.write(
+            f"  gateway {metrics['gateway_seconds']:.2f}s ({metrics['gateway_errors']} errors), "
+            f"database {metrics['apply_seconds']:.2f}s, {metrics['completed_passes']} walk(s) finished a pass"
+        )
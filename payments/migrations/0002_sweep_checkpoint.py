@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SweepCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('position_created_at', models.DateTimeField(blank=True, null=True)),
+                ('position_id', models.UUIDField(blank=True, null=True)),
+                ('completed_passes', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Sweep Checkpoint',
+                'verbose_name_plural': 'Sweep Checkpoints',
+                'db_table': 'payments_sweep_checkpoint',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='razorpayorder',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='razorpay_order_status_idx'),
+        ),
+    ]
@@ -3,10 +3,12 @@ from django.contrib.auth import get_user_model
 from django.utils.translation import gettext_lazy as _
 import uuid
 
+from givegrip.transitions import StatusTransitionMixin
+
 User = get_user_model()
 
 
-class RazorpayOrder(models.Model):
+class RazorpayOrder(StatusTransitionMixin, models.Model):
     """Razorpay order model for tracking payment orders."""
     
     STATUS_CHOICES = [
@@ -17,6 +19,14 @@ class RazorpayOrder(models.Model):
         ('cancelled', 'Cancelled'),
     ]
     
+    # Target status -> statuses it may be reached from (see givegrip.transitions)
+    STATUS_TRANSITIONS = {
+        'attempted': ('created',),
+        'paid': ('created', 'attempted', 'failed', 'cancelled'),
+        'failed': ('created', 'attempted'),
+        'cancelled': ('created', 'attempted'),
+    }
+    
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     donation = models.OneToOneField('donations.Donation', on_delete=models.CASCADE, related_name='razorpay_order')
     
@@ -48,6 +58,10 @@ class RazorpayOrder(models.Model):
         verbose_name_plural = _('Razorpay Orders')
         db_table = 'payments_razorpay_order'
         ordering = ['-created_at']
+        indexes = [
+            # Keyset walk of open orders by the stale order sweeper
+            models.Index(fields=['status', 'created_at', 'id'], name='razorpay_order_status_idx'),
+        ]
     
     def __str__(self):
         return f"Order {self.razorpay_order_id} - {self.amount} {self.currency}"
@@ -92,3 +106,26 @@ class PaymentWebhook(models.Model):
         return f"Webhook {self.event_type} - {self.event_id}"
 
 
+
+
+class SweepCheckpoint(models.Model):
+    """Position of an incremental sweep, so each run resumes where the last one stopped."""
+    
+    id = models.BigAutoField(primary_key=True)
+    name = models.CharField(max_length=100, unique=True)
+    
+    # Last row handled, in (created_at, id) order; empty at the start of a pass
+    position_created_at = models.DateTimeField(null=True, blank=True)
+    position_id = models.UUIDField(null=True, blank=True)
+    completed_passes = models.PositiveIntegerField(default=0)
+    
+    # Timestamps
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = _('Sweep Checkpoint')
+        verbose_name_plural = _('Sweep Checkpoints')
+        db_table = 'payments_sweep_checkpoint'
+    
+    def __str__(self):
+        return f"Checkpoint {self.name}"
@@ -0,0 +1,121 @@
+"""
+Local stand-in for the Razorpay REST API, for tests and load tests.
+
+It answers the calls ``payments.gateway.RazorpayGateway`` makes (create
+order, fetch payment, list an order's payments, refund) with plausible
+bodies. An order's payments are whatever has been put in ``payments``
+for its id; there are none otherwise, as for an abandoned checkout. It can add a fixed
+latency to each request and fail a fraction of them with 503s. Point
+``PAYMENT_GATEWAY_API_URL`` at it and set ``PAYMENT_GATEWAY`` to the
+Razorpay client to run the whole donate flow without the real gateway.
+Connections are kept alive, like the real API's.
+"""
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ORDER_PAYMENTS_PATH = re.compile(r'^/v1/orders/(?P<order_id>[\w-]+)/payments$')
+PAYMENT_PATH = re.compile(r'^/v1/payments/(?P<payment_id>[\w-]+)(?P<refund>/refund)?$')
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out as separate writes; without this, delayed ACKs
+    # stall every response on a kept-alive connection by ~40 ms
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            return None
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, method):
+        with self.server.lock:
+            self.server.request_count += 1
+        payload = self._body() if method == 'POST' else {}
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self.server.error_rate and random.random() < self.server.error_rate:
+            return self._send(503, {'error': {'code': 'SERVER_ERROR', 'description': 'Stub failure'}})
+        if payload is None:
+            return self._send(400, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'Invalid JSON'}})
+
+        if method == 'POST' and self.path == '/v1/orders':
+            if not isinstance(payload.get('amount'), int) or payload['amount'] < 100:
+                return self._send(400, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'Invalid amount'}})
+            return self._send(200, {
+                'id': f'order_{uuid.uuid4().hex[:14]}', 'entity': 'order', 'amount': payload['amount'],
+                'amount_paid': 0, 'currency': payload.get('currency', 'INR'), 'receipt': payload.get('receipt'),
+                'status': 'created', 'notes': payload.get('notes', {}), 'created_at': int(time.time()),
+            })
+
+        match = ORDER_PAYMENTS_PATH.match(self.path)
+        if match and method == 'GET':
+            items = self.server.payments.get(match['order_id'], [])
+            return self._send(200, {'entity': 'collection', 'count': len(items), 'items': items})
+
+        match = PAYMENT_PATH.match(self.path)
+        if match and method == 'GET' and not match['refund']:
+            return self._send(200, {
+                'id': match['payment_id'], 'entity': 'payment', 'status': 'captured', 'captured': True,
+            })
+        if match and method == 'POST' and match['refund']:
+            return self._send(200, {
+                'id': f'rfnd_{uuid.uuid4().hex[:14]}', 'entity': 'refund', 'payment_id': match['payment_id'],
+                'amount': payload.get('amount'), 'status': 'processed',
+            })
+        return self._send(404, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'Not found'}})
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+
+class StubGatewayServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Load tests open many connections at once
+    request_queue_size = 128
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, error_rate=0.0, verbose=False):
+        super().__init__((host, port), StubHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.request_count = 0
+        # Razorpay order id -> list of payment entities
+        self.payments = {}
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+
+def start_stub(**kwargs):
+    """Serve a stub gateway from a background thread; stop it with ``shutdown()``."""
+    server = StubGatewayServer(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
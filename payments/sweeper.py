@@ -0,0 +1,246 @@
+"""
+Stale order sweeper.
+
+Checkouts that never come back (closed tabs, lost webhooks) leave their
+``RazorpayOrder`` in ``created``/``attempted`` and their donation pending.
+``sweep_stale_orders`` asks the gateway about those orders and settles them:
+
+* an order with a captured payment becomes paid, through the same
+  ``apply_payment_events`` path as webhooks, so the ledger sees it once;
+* one with only failed payments becomes failed, and one with no payments
+  at all is cancelled, once it is ``PAYMENT_ORDER_EXPIRY`` seconds old;
+  its donation follows;
+* orders with a payment still being authorised are left alone.
+
+Orders younger than ``PAYMENT_SWEEP_MIN_AGE`` seconds are still in checkout
+and are not looked at. Pending donations that never got an order are
+cancelled after ``PAYMENT_ORDER_EXPIRY`` seconds.
+
+Each status is walked in ``(created_at, id)`` order along the
+``(status, created_at, id)`` indexes, ``PAYMENT_SWEEP_BATCH_SIZE`` rows at a
+time. The position is kept in a ``SweepCheckpoint`` row, saved in the same
+transaction as the batch's transitions, so a run stops after
+``PAYMENT_SWEEP_MAX_ORDERS`` rows and the next one resumes where it
+stopped. A walk that reaches the end starts its next pass from the
+beginning. Settled rows leave the index range, so a pass only ever reads
+the orders that are still open. The gateway is queried for a whole batch
+at once, from ``PAYMENT_SWEEP_CONCURRENCY`` threads sharing the client's
+connection pool.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from donations.models import Donation
+from givegrip.transitions import transition
+from .gateway import GatewayError, gateway
+from .models import RazorpayOrder, SweepCheckpoint
+from .webhooks import apply_payment_events
+
+logger = logging.getLogger(__name__)
+
+OPEN_ORDER_STATUSES = ('created', 'attempted')
+OPEN_DONATION_STATUSES = ('created', 'pending')
+
+# Payment statuses that mean the money was taken
+CAPTURED = ('captured', 'refunded')
+
+
+def _next_batch(checkpoint, queryset, size):
+    """The next ``size`` rows of ``queryset`` after the checkpoint, in (created_at, id) order."""
+    if checkpoint.position_created_at is not None:
+        # The plain range bound lets the index seek straight to the checkpoint
+        queryset = queryset.filter(created_at__gte=checkpoint.position_created_at).filter(
+            Q(created_at__gt=checkpoint.position_created_at) | Q(id__gt=checkpoint.position_id)
+        )
+    return list(queryset.order_by('created_at', 'id')[:size])
+
+
+def _advance(checkpoint, rows, finished):
+    """Move the checkpoint past ``rows``, or back to the start once the pass is ``finished``."""
+    if finished:
+        checkpoint.position_created_at = None
+        checkpoint.position_id = None
+        checkpoint.completed_passes += 1
+    else:
+        checkpoint.position_created_at = rows[-1].created_at
+        checkpoint.position_id = rows[-1].pk
+    checkpoint.save()
+
+
+def decide(order, payments, expire_before):
+    """What to do with an open order given its gateway payments.
+
+    Returns ``(outcome, payment)``: ``'paid'``, ``'failed'`` or
+    ``'cancelled'``, or ``None`` to leave the order open for now.
+    """
+    captured = [payment for payment in payments if payment.get('status') in CAPTURED]
+    if captured:
+        return 'paid', captured[-1]
+    if any(payment.get('status') != 'failed' for payment in payments):
+        # Created or authorised: the payment may still complete
+        return None, None
+    if order.created_at > expire_before:
+        return None, None
+    if payments:
+        return 'failed', payments[-1]
+    return 'cancelled', None
+
+
+def _fetch_all(client, executor, orders):
+    """``{order_id: payments}`` for ``orders``, fetched concurrently; failed lookups are left out."""
+    def fetch(order_id):
+        try:
+            return order_id, client.fetch_order_payments(order_id)
+        except GatewayError as e:
+            logger.warning(f"Could not fetch payments of order {order_id}: {e}")
+            return order_id, None
+
+    results = executor.map(fetch, [order.razorpay_order_id for order in orders])
+    return {order_id: payments for order_id, payments in results if payments is not None}
+
+
+def _settle_orders(orders, payments_by_order, expire_before, metrics):
+    """Apply the sweep outcomes of one batch. The caller owns the transaction."""
+    events, abandoned = {}, []
+    for order in orders:
+        if order.razorpay_order_id not in payments_by_order:
+            continue
+        outcome, payment = decide(order, payments_by_order[order.razorpay_order_id], expire_before)
+        if outcome == 'paid':
+            events[order.razorpay_order_id] = [('payment.captured', payment)]
+        elif outcome == 'failed':
+            events[order.razorpay_order_id] = [('payment.failed', payment)]
+        elif outcome == 'cancelled':
+            abandoned.append(order.pk)
+        else:
+            metrics['left_open'] += 1
+        if outcome:
+            metrics[outcome] += 1
+
+    if events:
+        apply_payment_events(events)
+    if abandoned:
+        cancelled = transition(
+            RazorpayOrder.objects.filter(pk__in=abandoned), 'cancelled',
+            error_description='Abandoned at checkout',
+        )
+        metrics['expired_donations'] += len(
+            transition(Donation.objects.filter(pk__in=[order.donation_id for order in cancelled]), 'cancelled')
+        )
+
+
+def _sweep_order_batch(checkpoint, size, cutoff, expire_before, client, executor, metrics):
+    """Settle the next batch of one status's walk. Returns the rows read and whether the pass is finished."""
+    queryset = RazorpayOrder.objects.filter(status=checkpoint.status, created_at__lte=cutoff).only(
+        'id', 'razorpay_order_id', 'donation_id', 'created_at',
+    )
+    orders = _next_batch(checkpoint, queryset, size)
+    finished = len(orders) < size
+
+    started = time.perf_counter()
+    payments_by_order = _fetch_all(client, executor, orders) if orders else {}
+    metrics['gateway_seconds'] += time.perf_counter() - started
+    metrics['gateway_errors'] += len(orders) - len(payments_by_order)
+
+    started = time.perf_counter()
+    with transaction.atomic():
+        _settle_orders(orders, payments_by_order, expire_before, metrics)
+        _advance(checkpoint, orders, finished)
+    metrics['apply_seconds'] += time.perf_counter() - started
+
+    metrics['orders_scanned'] += len(orders)
+    metrics['batches'] += bool(orders)
+    metrics['completed_passes'] += finished
+    return len(orders), finished
+
+
+def _sweep_donation_batch(checkpoint, size, expire_before, metrics):
+    """Cancel the next batch of pending donations that never got an order."""
+    queryset = Donation.objects.filter(
+        status=checkpoint.status, created_at__lte=expire_before, razorpay_order__isnull=True,
+    ).only('id', 'created_at')
+    donations = _next_batch(checkpoint, queryset, size)
+    finished = len(donations) < size
+    with transaction.atomic():
+        if donations:
+            metrics['expired_donations'] += len(
+                transition(Donation.objects.filter(pk__in=[donation.pk for donation in donations]), 'cancelled')
+            )
+        _advance(checkpoint, donations, finished)
+    metrics['donations_scanned'] += len(donations)
+    metrics['batches'] += bool(donations)
+    metrics['completed_passes'] += finished
+    return len(donations), finished
+
+
+def _checkpoints(prefix, statuses):
+    checkpoints = []
+    for status in statuses:
+        checkpoint, _ = SweepCheckpoint.objects.get_or_create(name=f'{prefix}:{status}')
+        checkpoint.status = status
+        checkpoints.append(checkpoint)
+    return checkpoints
+
+
+def sweep_stale_orders(max_orders=None, batch_size=None, client=None):
+    """Settle open orders and abandoned donations, resuming from the checkpoints.
+
+    Reads at most ``max_orders`` orders (and as many orphaned donations) per
+    run. Returns the run's metrics: rows scanned, outcomes, gateway errors,
+    time spent waiting on the gateway and on the database, and throughput.
+    """
+    max_orders = max_orders or settings.PAYMENT_SWEEP_MAX_ORDERS
+    batch_size = batch_size or settings.PAYMENT_SWEEP_BATCH_SIZE
+    client = client or gateway()
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=settings.PAYMENT_SWEEP_MIN_AGE)
+    expire_before = now - timedelta(seconds=settings.PAYMENT_ORDER_EXPIRY)
+
+    metrics = {
+        'orders_scanned': 0, 'donations_scanned': 0, 'batches': 0, 'completed_passes': 0,
+        'paid': 0, 'failed': 0, 'cancelled': 0, 'left_open': 0, 'expired_donations': 0,
+        'gateway_errors': 0, 'gateway_seconds': 0.0, 'apply_seconds': 0.0,
+    }
+    started = time.perf_counter()
+
+    # The walks take turns, a batch at a time, so none starves the others of the budget
+    with ThreadPoolExecutor(max_workers=settings.PAYMENT_SWEEP_CONCURRENCY) as executor:
+        walks = _checkpoints('razorpay_orders', OPEN_ORDER_STATUSES)
+        budget = max_orders
+        while walks and budget > 0:
+            for checkpoint in list(walks):
+                read, finished = _sweep_order_batch(
+                    checkpoint, min(batch_size, budget), cutoff, expire_before, client, executor, metrics,
+                )
+                if finished:
+                    walks.remove(checkpoint)
+                budget -= read
+                if budget <= 0:
+                    break
+
+    walks = _checkpoints('donations', OPEN_DONATION_STATUSES)
+    budget = max_orders
+    while walks and budget > 0:
+        for checkpoint in list(walks):
+            read, finished = _sweep_donation_batch(checkpoint, min(batch_size, budget), expire_before, metrics)
+            if finished:
+                walks.remove(checkpoint)
+            budget -= read
+            if budget <= 0:
+                break
+
+    metrics['seconds'] = time.perf_counter() - started
+    metrics['orders_per_second'] = metrics['orders_scanned'] / metrics['seconds'] if metrics['seconds'] else 0.0
+    logger.info(
+        "Swept %(orders_scanned)d open orders (%(paid)d paid, %(failed)d failed, %(cancelled)d cancelled, "
+        "%(left_open)d left open, %(gateway_errors)d gateway errors) and expired %(expired_donations)d donations "
+        "in %(seconds).2fs (%(orders_per_second).0f orders/s)", metrics,
+    )
+    return metrics
@@ -0,0 +1,18 @@
+"""
+Celery tasks for the payments application.
+"""
+from givegrip.celery import app
+from . import sweeper
+from .webhooks import process_pending_webhooks
+
+
+@app.task(ignore_result=True)
+def process_payment_webhooks():
+    """Apply stored Razorpay webhooks that have not been processed yet."""
+    return process_pending_webhooks()
+
+
+@app.task(ignore_result=True)
+def sweep_stale_orders():
+    """Settle orders and donations abandoned at checkout, a chunk per run."""
+    return sweeper.sweep_stale_orders()
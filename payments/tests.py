@@ -0,0 +1,501 @@
+import hashlib
+import hmac
+import json
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db.models.signals import post_save
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from accounts.models import User
+from donations.models import Campaign, Donation
+from givegrip.transitions import transition
+from pages.tests import reset_cms_cache
+from payments import gateway as payment_gateway
+from payments.gateway import GatewayError, LocalGateway, RazorpayGateway
+from payments.models import PaymentWebhook, RazorpayOrder, SweepCheckpoint
+from payments.sweeper import sweep_stale_orders
+from payments.stub_gateway import start_stub
+from payments.webhooks import capture_payment, process_pending_webhooks
+
+
+@override_settings(RAZORPAY_WEBHOOK_SECRET='whsec')
+class WebhookTests(TestCase):
+    """Signed webhooks are stored once per event id and applied in batches."""
+
+    def setUp(self):
+        self.donor = User.objects.create_user(username='donor', email='donor@example.com', password='pass12345')
+        now = timezone.now()
+        self.campaign = Campaign.objects.create(
+            title='School roof', description='Test', goal_amount=Decimal('100.00'),
+            status='active', start_date=now, end_date=now + timedelta(days=30),
+        )
+        self.url = reverse('main_payment:razorpay_webhook')
+
+    def order(self, order_id, amount='10.00'):
+        donation = Donation.objects.create(
+            campaign=self.campaign, donor=self.donor, amount=Decimal(amount), status='pending'
+        )
+        return RazorpayOrder.objects.create(donation=donation, razorpay_order_id=order_id, amount=Decimal(amount))
+
+    def body(self, event, order_id, **payment):
+        return json.dumps({'event': event, 'payload': {'payment': {'entity': {'order_id': order_id, **payment}}}})
+
+    def post(self, body, event_id, signature=None):
+        if signature is None:
+            signature = hmac.new(b'whsec', body.encode(), hashlib.sha256).hexdigest()
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                self.url, body, content_type='application/json',
+                HTTP_X_RAZORPAY_EVENT_ID=event_id, HTTP_X_RAZORPAY_SIGNATURE=signature,
+            )
+
+    def collected(self):
+        self.campaign.refresh_from_db()
+        return self.campaign.collected_amount
+
+    def test_webhook_is_stored_and_applied(self):
+        order = self.order('order_1')
+        response = self.post(self.body('payment.captured', 'order_1', id='pay_1'), 'ev1')
+        self.assertEqual(response.status_code, 200)
+
+        webhook = PaymentWebhook.objects.get()
+        self.assertEqual((webhook.event_id, webhook.event_type), ('ev1', 'payment.captured'))
+        self.assertEqual(webhook.headers['X-Razorpay-Event-Id'], 'ev1')
+        self.assertTrue(webhook.processed)
+        self.assertEqual(webhook.processing_error, '')
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.razorpay_payment_id), ('paid', 'pay_1'))
+        self.assertEqual(self.collected(), Decimal('10.00'))
+
+    def test_duplicate_event_id_is_dropped(self):
+        self.order('order_1')
+        body = self.body('payment.captured', 'order_1', id='pay_1')
+        self.assertEqual(self.post(body, 'ev1').status_code, 200)
+        self.assertEqual(self.post(body, 'ev1').status_code, 200)
+        self.assertEqual(PaymentWebhook.objects.count(), 1)
+        self.assertEqual(self.collected(), Decimal('10.00'))
+
+    def test_invalid_payload_is_rejected(self):
+        self.assertEqual(self.post('not json', 'ev1').status_code, 400)
+        self.assertEqual(self.post('[1, 2]', 'ev2').status_code, 400)
+        self.assertFalse(PaymentWebhook.objects.exists())
+
+    def test_unsigned_webhook_is_rejected(self):
+        self.order('order_1')
+        body = self.body('payment.captured', 'order_1', id='pay_1')
+        self.assertEqual(self.post(body, 'ev1', signature='forged').status_code, 400)
+        self.assertEqual(self.post(body, 'ev2', signature='').status_code, 400)
+        with override_settings(RAZORPAY_WEBHOOK_SECRET=''):
+            # Without a secret nothing verifies, not even an HMAC under the empty key
+            empty_key = hmac.new(b'', body.encode(), hashlib.sha256).hexdigest()
+            self.assertEqual(self.post(body, 'ev3', signature=empty_key).status_code, 400)
+        self.assertFalse(PaymentWebhook.objects.exists())
+        self.assertEqual(self.collected(), Decimal('0.00'))
+
+    @override_settings(PAYMENTS_WEBHOOK_BATCH_SIZE=2)
+    def test_inline_processing_takes_one_batch(self):
+        for i in range(5):
+            PaymentWebhook.objects.create(event_type='order.paid', event_id=f'old{i}', payload={})
+        with mock.patch('payments.webhooks.process_webhook_batch', side_effect=RuntimeError('boom')) as batch:
+            with mock.patch('payments.webhooks._process_individually', side_effect=RuntimeError('boom')):
+                response = self.post(self.body('order.paid', 'order_1'), 'ev1')
+        # A failure is logged, not turned into an error response, and the backlog is not drained
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(batch.call_count, 1)
+        self.assertEqual(PaymentWebhook.objects.filter(processed=False).count(), 6)
+
+        self.post(self.body('order.paid', 'order_1'), 'ev2')
+        self.assertEqual(PaymentWebhook.objects.filter(processed=False).count(), 5)
+
+    @override_settings(PAYMENTS_WEBHOOK_WORKER='celery')
+    def test_stored_events_wait_for_the_worker(self):
+        self.order('order_1')
+        with mock.patch('payments.tasks.process_payment_webhooks.delay') as delay:
+            self.post(self.body('payment.captured', 'order_1', id='pay_1'), 'ev1')
+        delay.assert_called_once_with()
+        self.assertFalse(PaymentWebhook.objects.get().processed)
+        self.assertEqual(process_pending_webhooks(), 1)
+        self.assertEqual(self.collected(), Decimal('10.00'))
+
+    def test_batch_processing(self):
+        paid, failed, retried = self.order('order_1'), self.order('order_2'), self.order('order_3', '5.00')
+        for event_id, event, order_id, payment in [
+            ('e1', 'payment.captured', 'order_1', {'id': 'pay_1'}),
+            ('e2', 'payment.failed', 'order_2', {'id': 'pay_2', 'error_code': 'BAD_REQUEST_ERROR'}),
+            ('e3', 'payment.failed', 'order_3', {'id': 'pay_3'}),
+            ('e4', 'payment.captured', 'order_3', {'id': 'pay_4'}),
+            ('e5', 'payment.captured', 'order_missing', {'id': 'pay_5'}),
+            ('e6', 'order.paid', 'order_1', {}),
+        ]:
+            PaymentWebhook.objects.create(
+                event_type=event, event_id=event_id, payload=json.loads(self.body(event, order_id, **payment)),
+            )
+
+        self.assertEqual(process_pending_webhooks(batch_size=4), 6)
+        self.assertFalse(PaymentWebhook.objects.filter(processed=False).exists())
+        self.assertEqual(PaymentWebhook.objects.get(event_id='e5').processing_error, 'Unknown order order_missing')
+        self.assertEqual(
+            [RazorpayOrder.objects.get(pk=order.pk).status for order in (paid, failed, retried)],
+            ['paid', 'failed', 'paid'],
+        )
+        self.assertEqual(RazorpayOrder.objects.get(pk=failed.pk).error_code, 'BAD_REQUEST_ERROR')
+        self.assertEqual(Donation.objects.get(pk=retried.donation_id).razorpay_payment_id, 'pay_4')
+        self.assertEqual(self.collected(), Decimal('15.00'))
+        # Nothing left to do
+        self.assertEqual(process_pending_webhooks(), 0)
+
+
+class StatusTransitionTests(TestCase):
+    """Donation and order statuses only move along their allowed transitions."""
+
+    def setUp(self):
+        self.donor = User.objects.create_user(username='donor', email='donor@example.com', password='pass12345')
+        now = timezone.now()
+        self.campaign = Campaign.objects.create(
+            title='School roof', description='Test', goal_amount=Decimal('100.00'),
+            status='active', start_date=now, end_date=now + timedelta(days=30),
+        )
+        self.donation = Donation.objects.create(
+            campaign=self.campaign, donor=self.donor, amount=Decimal('10.00'), status='pending'
+        )
+        self.order = RazorpayOrder.objects.create(
+            donation=self.donation, razorpay_order_id='order_1', amount=Decimal('10.00')
+        )
+
+    def webhook(self, event_id, event, **payment):
+        PaymentWebhook.objects.create(
+            event_type=event, event_id=event_id,
+            payload={'event': event, 'payload': {'payment': {'entity': {'order_id': 'order_1', **payment}}}},
+        )
+
+    def collected(self):
+        self.campaign.refresh_from_db()
+        return self.campaign.collected_amount
+
+    def test_pending_is_a_declared_status(self):
+        self.donation.full_clean()
+        self.assertEqual(self.donation.get_status_display(), 'Pending')
+        for sources in Donation.STATUS_TRANSITIONS.values():
+            self.assertLessEqual(set(sources), {value for value, _ in Donation.STATUS_CHOICES})
+
+    def test_transition_moves_each_row_once(self):
+        paid = transition(Donation.objects.filter(pk=self.donation.pk), 'paid', razorpay_payment_id='pay_1')
+        self.assertEqual([(d.pk, d.status, d.amount) for d in paid], [(self.donation.pk, 'paid', Decimal('10.00'))])
+        self.assertEqual(transition(Donation.objects.filter(pk=self.donation.pk), 'paid'), [])
+        self.assertEqual(transition(Donation.objects.filter(pk=self.donation.pk), 'failed'), [])
+        self.donation.refresh_from_db()
+        self.assertEqual((self.donation.status, self.donation.razorpay_payment_id), ('paid', 'pay_1'))
+
+    def test_redirect_and_webhook_count_a_payment_once(self):
+        self.assertTrue(capture_payment('order_1', 'pay_1'))
+        self.webhook('e1', 'payment.captured', id='pay_1')
+        self.webhook('e2', 'payment.failed', id='pay_2', error_code='BAD_REQUEST_ERROR')
+        self.assertEqual(process_pending_webhooks(), 2)
+        self.assertEqual(self.collected(), Decimal('10.00'))
+        self.order.refresh_from_db()
+        self.donation.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.error_code), ('paid', ''))
+        self.assertEqual(self.donation.status, 'paid')
+        self.assertFalse(capture_payment('order_missing', 'pay_3'))
+
+    def test_failure_then_capture_ends_paid(self):
+        self.webhook('e1', 'payment.failed', id='pay_1', error_code='BAD_REQUEST_ERROR')
+        process_pending_webhooks()
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.error_code), ('failed', 'BAD_REQUEST_ERROR'))
+        self.webhook('e2', 'payment.captured', id='pay_2')
+        process_pending_webhooks()
+        self.donation.refresh_from_db()
+        self.assertEqual((self.donation.status, self.donation.razorpay_payment_id), ('paid', 'pay_2'))
+        self.assertEqual(self.collected(), Decimal('10.00'))
+
+    def test_save_cannot_undo_a_payment(self):
+        stale = Donation.objects.get(pk=self.donation.pk)
+        capture_payment('order_1', 'pay_1')
+
+        # A stale copy saved later does not write its status back
+        stale.donor_message = 'Good luck!'
+        stale.save()
+        self.donation.refresh_from_db()
+        self.assertEqual((self.donation.status, self.donation.donor_message), ('paid', 'Good luck!'))
+
+        # Nor can it move the donation on; it is given the stored status
+        stale.status = 'failed'
+        stale.save()
+        self.assertEqual(stale.status, 'paid')
+        self.assertFalse(stale.status_changed)
+        self.assertEqual(self.collected(), Decimal('10.00'))
+
+        # The admin form rejects the change up front
+        stale.status = 'failed'
+        with self.assertRaises(ValidationError):
+            stale.full_clean()
+
+    def test_save_without_status_change_is_a_plain_save(self):
+        saves = []
+
+        def receiver(sender, instance, update_fields, **kwargs):
+            saves.append(update_fields)
+
+        post_save.connect(receiver, sender=Donation)
+        self.addCleanup(post_save.disconnect, receiver, sender=Donation)
+
+        donation = Donation.objects.get(pk=self.donation.pk)
+        donation.donor_message = 'Good luck!'
+        donation.is_anonymous = True
+        donation.save()
+        donation.amount = Decimal('20.00')
+        donation.save(update_fields=['amount'])
+        self.assertEqual(saves, [None, frozenset({'amount'})])
+        self.donation.refresh_from_db()
+        self.assertEqual(
+            (self.donation.donor_message, self.donation.is_anonymous, self.donation.amount, self.donation.status),
+            ('Good luck!', True, Decimal('20.00'), 'pending'),
+        )
+
+
+@override_settings(PAYMENT_GATEWAY_BACKOFF=0)
+class PaymentGatewayTests(TestCase):
+    """The Razorpay client against the local stub server, and the views using it."""
+
+    def setUp(self):
+        reset_cms_cache()
+        self.stub = start_stub()
+        self.addCleanup(self.stub.server_close)
+        self.addCleanup(self.stub.shutdown)
+        self.client_gateway = RazorpayGateway(url=self.stub.url, key_id='key', key_secret='secret')
+        self.addCleanup(self.client_gateway.session.close)
+        patcher = mock.patch.object(payment_gateway, '_gateway', self.client_gateway)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.donor = User.objects.create_user(username='donor', email='donor@example.com', password='pass12345')
+        self.client.force_login(self.donor)
+        now = timezone.now()
+        self.campaign = Campaign.objects.create(
+            title='Flood relief', description='Test', goal_amount=Decimal('1000.00'),
+            status='active', start_date=now, end_date=now + timedelta(days=30),
+        )
+
+    def sign(self, order_id, payment_id):
+        return hmac.new(b'secret', f'{order_id}|{payment_id}'.encode(), hashlib.sha256).hexdigest()
+
+    def donate(self, key='key-1'):
+        url = reverse('main_campaigns:donate', kwargs={'campaign_id': self.campaign.pk})
+        return self.client.post(url, {'amount': '125.50', 'idempotency_key': key})
+
+    def test_orders_payments_and_refunds(self):
+        order = self.client_gateway.create_order(Decimal('125.50'), 'INR', receipt='r-1')
+        self.assertTrue(order['id'].startswith('order_'))
+        self.assertEqual(order['amount'], 12550)
+        self.assertEqual(self.client_gateway.fetch_payment('pay_1')['status'], 'captured')
+        self.assertEqual(self.client_gateway.refund('pay_1', Decimal('10'))['amount'], 1000)
+
+        stats = self.client_gateway.stats()
+        self.assertEqual({name: entry['calls'] for name, entry in stats.items()},
+                         {'create_order': 1, 'fetch_payment': 1, 'refund': 1})
+        self.assertEqual(sum(entry['errors'] for entry in stats.values()), 0)
+
+    def test_only_reads_are_retried(self):
+        self.stub.error_rate = 1.0
+        with self.assertRaises(GatewayError):
+            self.client_gateway.fetch_payment('pay_1')
+        self.assertEqual(self.stub.request_count, 4)
+
+        # An order must not be created twice
+        with self.assertRaises(GatewayError):
+            self.client_gateway.create_order(Decimal('100'), 'INR', receipt='r-1')
+        self.assertEqual(self.stub.request_count, 5)
+        self.assertEqual(self.client_gateway.stats()['create_order']['errors'], 1)
+
+    def test_signatures(self):
+        self.assertTrue(self.client_gateway.verify_signature('order_1', 'pay_1', self.sign('order_1', 'pay_1')))
+        self.assertFalse(self.client_gateway.verify_signature('order_1', 'pay_2', self.sign('order_1', 'pay_1')))
+        self.assertFalse(self.client_gateway.verify_signature('order_1', 'pay_1', None))
+
+    def test_local_gateway_only_accepts_its_own_signatures(self):
+        local = LocalGateway()
+        order = local.create_order(Decimal('10'), 'INR', receipt='r-1')
+        payment = order['test_payment']
+        self.assertTrue(local.verify_signature(order['id'], payment['id'], payment['signature']))
+        self.assertFalse(local.verify_signature(order['id'], 'pay_other', payment['signature']))
+        self.assertFalse(local.verify_signature(order['id'], payment['id'], 'test_signature_1'))
+
+        with override_settings(PAYMENT_LOCAL_GATEWAY=False):
+            with self.assertRaises(ImproperlyConfigured):
+                LocalGateway()
+
+    def test_local_checkout_completes(self):
+        with mock.patch.object(payment_gateway, '_gateway', LocalGateway()):
+            checkout = self.donate()
+            self.assertContains(checkout, 'Test Mode')
+            self.assertNotContains(checkout, 'checkout.razorpay.com')
+            payment = checkout.context['test_payment']
+            order = RazorpayOrder.objects.get()
+            response = self.client.post(reverse('main_payment:payment_success'), json.dumps({
+                'razorpay_order_id': order.razorpay_order_id, 'razorpay_payment_id': payment['id'],
+                'razorpay_signature': payment['signature'],
+            }), content_type='application/json')
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(Donation.objects.get().status, 'paid')
+
+    def test_donate_creates_gateway_order(self):
+        response = self.donate()
+        self.assertEqual(response.status_code, 200)
+        order = RazorpayOrder.objects.get()
+        self.assertTrue(order.razorpay_order_id.startswith('order_'))
+        self.assertContains(response, order.razorpay_order_id)
+        # The real checkout, not the simulated card form
+        self.assertContains(response, 'checkout.razorpay.com/v1/checkout.js')
+        self.assertNotContains(response, 'Test Mode')
+
+    @override_settings(PAYMENT_GATEWAY='payments.gateway.LocalGateway', PAYMENT_LOCAL_GATEWAY=False,
+                       DEBUG_PROPAGATE_EXCEPTIONS=True)
+    def test_donate_surfaces_missing_gateway_configuration(self):
+        with mock.patch.object(payment_gateway, '_gateway', None):
+            with self.assertRaises(ImproperlyConfigured):
+                self.donate()
+        self.assertFalse(Donation.objects.exists())
+
+    def test_donate_when_gateway_fails(self):
+        self.stub.error_rate = 1.0
+        self.assertEqual(self.donate().status_code, 503)
+        self.assertFalse(Donation.objects.exists())
+
+        # The failure is not replayed to a retry with the same key
+        self.stub.error_rate = 0.0
+        self.assertEqual(self.donate().status_code, 200)
+        self.assertEqual(Donation.objects.count(), 1)
+
+    def test_payment_success_checks_signature(self):
+        self.donate()
+        order = RazorpayOrder.objects.get()
+        url = reverse('main_payment:payment_success')
+        payload = {'razorpay_order_id': order.razorpay_order_id, 'razorpay_payment_id': 'pay_1'}
+
+        forged = self.client.post(url, json.dumps({**payload, 'razorpay_signature': 'forged'}),
+                                  content_type='application/json')
+        self.assertFalse(forged.json()['success'])
+        self.assertEqual(Donation.objects.get().status, 'pending')
+
+        signature = self.sign(order.razorpay_order_id, 'pay_1')
+        response = self.client.post(url, json.dumps({**payload, 'razorpay_signature': signature}),
+                                    content_type='application/json')
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(Donation.objects.get().status, 'paid')
+
+
+@override_settings(PAYMENT_GATEWAY_BACKOFF=0, PAYMENT_SWEEP_MIN_AGE=15 * 60, PAYMENT_ORDER_EXPIRY=24 * 60 * 60)
+class StaleOrderSweeperTests(TestCase):
+    """Open orders are settled from the gateway's view of them, a checkpointed chunk at a time."""
+
+    def setUp(self):
+        self.stub = start_stub()
+        self.addCleanup(self.stub.server_close)
+        self.addCleanup(self.stub.shutdown)
+        self.gateway = RazorpayGateway(url=self.stub.url, key_id='key', key_secret='secret')
+        self.addCleanup(self.gateway.session.close)
+
+        self.donor = User.objects.create_user(username='donor', email='donor@example.com', password='pass12345')
+        now = timezone.now()
+        self.campaign = Campaign.objects.create(
+            title='Flood relief', description='Test', goal_amount=Decimal('1000.00'),
+            status='active', start_date=now, end_date=now + timedelta(days=30),
+        )
+
+    def order(self, order_id, age, payments=None, status='created'):
+        donation = Donation.objects.create(
+            campaign=self.campaign, donor=self.donor, amount=Decimal('10.00'), status='pending',
+        )
+        order = RazorpayOrder.objects.create(
+            donation=donation, razorpay_order_id=order_id, amount=Decimal('10.00'), status=status,
+        )
+        RazorpayOrder.objects.filter(pk=order.pk).update(created_at=timezone.now() - age)
+        if payments is not None:
+            self.stub.payments[order_id] = payments
+        return order
+
+    def statuses(self, order_id):
+        order = RazorpayOrder.objects.select_related('donation').get(razorpay_order_id=order_id)
+        return order.status, order.donation.status
+
+    def sweep(self, **kwargs):
+        return sweep_stale_orders(client=self.gateway, **kwargs)
+
+    def test_outcomes(self):
+        hour, day = timedelta(hours=1), timedelta(days=2)
+        self.order('order_captured', hour, [{'id': 'pay_1', 'status': 'failed'}, {'id': 'pay_2', 'status': 'captured'}])
+        self.order('order_failed', day, [{'id': 'pay_3', 'status': 'failed', 'error_code': 'BAD_REQUEST_ERROR'}],
+                   status='attempted')
+        self.order('order_retrying', hour, [{'id': 'pay_4', 'status': 'failed'}])
+        self.order('order_authorized', day, [{'id': 'pay_5', 'status': 'authorized'}])
+        self.order('order_abandoned', day)
+        self.order('order_open', hour)
+        self.order('order_in_checkout', timedelta(minutes=1))
+        orphan = Donation.objects.create(
+            campaign=self.campaign, donor=self.donor, amount=Decimal('5.00'), status='pending',
+        )
+        Donation.objects.filter(pk=orphan.pk).update(created_at=timezone.now() - day)
+
+        metrics = self.sweep()
+        self.assertEqual(self.statuses('order_captured'), ('paid', 'paid'))
+        self.assertEqual(self.statuses('order_failed'), ('failed', 'failed'))
+        self.assertEqual(RazorpayOrder.objects.get(razorpay_order_id='order_failed').error_code, 'BAD_REQUEST_ERROR')
+        self.assertEqual(self.statuses('order_abandoned'), ('cancelled', 'cancelled'))
+        for order_id in ('order_retrying', 'order_authorized', 'order_open', 'order_in_checkout'):
+            self.assertEqual(self.statuses(order_id), ('created', 'pending'))
+        self.assertEqual(Donation.objects.get(pk=orphan.pk).status, 'cancelled')
+
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.collected_amount, Decimal('10.00'))
+        self.assertEqual(metrics['orders_scanned'], 6)
+        self.assertEqual(metrics['donations_scanned'], 1)
+        self.assertEqual(
+            [metrics[key] for key in ('paid', 'failed', 'cancelled', 'left_open', 'expired_donations')],
+            [1, 1, 1, 3, 2],
+        )
+        # The gateway was asked once per open order
+        self.assertEqual(self.gateway.stats()['fetch_order_payments']['calls'], 6)
+
+        # Settled rows are not read again
+        self.assertEqual(self.sweep()['orders_scanned'], 3)
+
+    def test_resumes_from_checkpoint(self):
+        for i in range(5):
+            self.order(f'order_{i}', timedelta(hours=1, minutes=i))
+
+        scanned = [self.sweep(max_orders=2, batch_size=2)['orders_scanned'] for _ in range(4)]
+        self.assertEqual(scanned, [2, 2, 1, 2])
+        checkpoint = SweepCheckpoint.objects.get(name='razorpay_orders:created')
+        self.assertEqual(checkpoint.completed_passes, 1)
+        # Oldest first: the second pass is back at the two oldest orders
+        oldest = RazorpayOrder.objects.order_by('created_at', 'id')[1]
+        self.assertEqual(checkpoint.position_id, oldest.pk)
+        self.assertEqual(self.stub.request_count, 7)
+
+    def test_gateway_errors_leave_orders_open(self):
+        self.order('order_abandoned', timedelta(days=2))
+        self.stub.error_rate = 1.0
+        metrics = self.sweep()
+        self.assertEqual(metrics['gateway_errors'], 1)
+        self.assertEqual(self.statuses('order_abandoned'), ('created', 'pending'))
+
+        self.stub.error_rate = 0.0
+        self.sweep()
+        self.assertEqual(self.statuses('order_abandoned'), ('cancelled', 'cancelled'))
+
+
+class BeatScheduleTests(SimpleTestCase):
+    """Every periodic job names a task the worker actually registers."""
+
+    def test_scheduled_tasks_exist(self):
+        for name, entry in settings.CELERY_BEAT_SCHEDULE.items():
+            with self.subTest(name):
+                self.assertEqual(import_string(entry['task']).name, entry['task'])
@@ -8,64 +8,21 @@ from django.views.decorators.http import require_POST
 from django.contrib import messages
 import json
 from .models import RazorpayOrder, PaymentWebhook
+from .gateway import gateway, verify_webhook_signature
+from .webhooks import capture_payment, store_webhook
 
 @csrf_exempt
 @require_POST
 def razorpay_webhook(request):
-    """Handle Razorpay webhook notifications."""
+    """Store a Razorpay webhook notification for asynchronous processing."""
+    if not verify_webhook_signature(request.body, request.headers.get('X-Razorpay-Signature')):
+        return HttpResponse(status=400)
     try:
-        # Get webhook data
-        webhook_data = json.loads(request.body)
-        webhook_signature = request.headers.get('X-Razorpay-Signature')
-        
-        # Verify webhook signature (in production, use proper secret)
-        # For now, just process the webhook
-        event_type = webhook_data.get('event')
-        
-        if event_type == 'payment.captured':
-            # Payment was successful
-            payment_data = webhook_data.get('payload', {}).get('payment', {})
-            order_id = payment_data.get('order_id')
-            
-            try:
-                razorpay_order = RazorpayOrder.objects.get(razorpay_order_id=order_id)
-                razorpay_order.status = 'paid'
-                razorpay_order.razorpay_payment_id = payment_data.get('id')
-                razorpay_order.save()
-                
-                # Update donation status
-                donation = razorpay_order.donation
-                donation.status = 'paid'
-                donation.razorpay_payment_id = payment_data.get('id')
-                donation.save()
-                
-            except RazorpayOrder.DoesNotExist:
-                pass
-                
-        elif event_type == 'payment.failed':
-            # Payment failed
-            payment_data = webhook_data.get('payload', {}).get('payment', {})
-            order_id = payment_data.get('order_id')
-            
-            try:
-                razorpay_order = RazorpayOrder.objects.get(razorpay_order_id=order_id)
-                razorpay_order.status = 'failed'
-                razorpay_order.error_code = payment_data.get('error_code')
-                razorpay_order.error_description = payment_data.get('error_description')
-                razorpay_order.save()
-                
-                # Update donation status
-                donation = razorpay_order.donation
-                donation.status = 'failed'
-                donation.save()
-                
-            except RazorpayOrder.DoesNotExist:
-                pass
-        
-        return HttpResponse(status=200)
-        
-    except Exception as e:
+        store_webhook(request.body, request.headers)
+    except ValueError:
         return HttpResponse(status=400)
+    
+    return HttpResponse(status=200)
 
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
@@ -80,38 +37,12 @@ def payment_success(request):
             razorpay_payment_id = data.get('razorpay_payment_id')
             razorpay_order_id = data.get('razorpay_order_id')
             razorpay_signature = data.get('razorpay_signature')
-            donation_id = data.get('donation_id')
-            
-            # Verify payment signature (in production, use proper verification)
-            # For now, just update the donation status
             
-            from donations.models import Donation
-            from .models import RazorpayOrder
-            
-            try:
-                donation = Donation.objects.get(id=donation_id)
-                donation.status = 'paid'
-                donation.razorpay_payment_id = razorpay_payment_id
-                donation.save()
-                
-                # Update campaign statistics
-                campaign = donation.campaign
-                campaign.update_current_amount()
-                campaign.save()
-                
-                # Update order status
-                try:
-                    order = RazorpayOrder.objects.get(razorpay_order_id=razorpay_order_id)
-                    order.status = 'paid'
-                    order.razorpay_payment_id = razorpay_payment_id
-                    order.save()
-                except RazorpayOrder.DoesNotExist:
-                    pass
-                
+            if not gateway().verify_signature(razorpay_order_id, razorpay_payment_id, razorpay_signature):
+                return JsonResponse({'success': False, 'error': 'Invalid payment signature'})
+            if capture_payment(razorpay_order_id, razorpay_payment_id or ''):
                 return JsonResponse({'success': True})
-                
-            except Donation.DoesNotExist:
-                return JsonResponse({'success': False, 'error': 'Donation not found'})
+            return JsonResponse({'success': False, 'error': 'Order not found'})
                 
         except Exception as e:
             return JsonResponse({'success': False, 'error': str(e)})
@@ -0,0 +1,270 @@
+"""
+Razorpay webhook ingestion for the payments application.
+
+The webhook endpoint only persists the raw event into ``PaymentWebhook``
+(deduplicated on ``event_id``) and schedules processing; the events are
+applied to orders and donations later by ``process_pending_webhooks``,
+normally from the Celery task in ``payments.tasks``. Only webhooks signed
+with ``RAZORPAY_WEBHOOK_SECRET`` are accepted. The checkout redirect
+reports captures through ``capture_payment``, which applies them the same
+way.
+"""
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, CharField, F, Value, When
+from django.utils import timezone
+
+from donations.ledger import record_paid_donations
+from givegrip.transitions import transition
+from donations.models import Donation
+from .models import PaymentWebhook, RazorpayOrder
+
+logger = logging.getLogger(__name__)
+
+# Headers worth keeping alongside the payload for auditing and verification
+STORED_HEADERS = ['X-Razorpay-Signature', 'X-Razorpay-Event-Id', 'User-Agent']
+
+PAYMENT_EVENTS = ('payment.captured', 'payment.failed')
+
+
+def store_webhook(body, headers):
+    """Persist a raw webhook body. Raises ValueError if it is not valid JSON.
+
+    Redelivered events hit the unique ``event_id`` and are dropped by the
+    database in the same single INSERT.
+    """
+    try:
+        payload = json.loads(body)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'Invalid webhook payload: {e}')
+    if not isinstance(payload, dict):
+        raise ValueError('Invalid webhook payload: expected a JSON object')
+
+    event_id = headers.get('X-Razorpay-Event-Id') or hashlib.sha256(body).hexdigest()
+    webhook = PaymentWebhook(
+        event_type=payload.get('event', ''),
+        event_id=event_id,
+        payload=payload,
+        headers={name: headers[name] for name in STORED_HEADERS if name in headers},
+    )
+    PaymentWebhook.objects.bulk_create([webhook], ignore_conflicts=True)
+
+    transaction.on_commit(schedule_processing)
+    return webhook
+
+
+def schedule_processing():
+    """Hand stored webhooks to the configured worker."""
+    if settings.PAYMENTS_WEBHOOK_WORKER == 'inline':
+        # One batch at most, so a backlog never lands on a single webhook request;
+        # whatever is left is picked up by the next webhook or the periodic task
+        try:
+            process_pending_webhooks(max_batches=1)
+        except Exception:
+            logger.exception("Inline webhook processing failed; the events stay stored")
+        return
+
+    from .tasks import process_payment_webhooks
+    try:
+        process_payment_webhooks.delay()
+    except Exception as e:
+        # The events are already stored; the periodic sweep will pick them up
+        logger.warning(f"Could not queue webhook processing: {e}")
+
+
+def process_pending_webhooks(batch_size=None, max_batches=None):
+    """Apply unprocessed webhooks in arrival order. Returns the number handled."""
+    batch_size = batch_size or settings.PAYMENTS_WEBHOOK_BATCH_SIZE
+    handled = 0
+    batches = 0
+
+    while max_batches is None or batches < max_batches:
+        with transaction.atomic():
+            pending = PaymentWebhook.objects.filter(processed=False).order_by('received_at')
+            if transaction.get_connection().features.has_select_for_update_skip_locked:
+                pending = pending.select_for_update(skip_locked=True)
+            webhooks = list(pending[:batch_size])
+            if not webhooks:
+                break
+
+            try:
+                with transaction.atomic():
+                    process_webhook_batch(webhooks)
+            except Exception:
+                logger.exception("Webhook batch failed, retrying events one by one")
+                _process_individually(webhooks)
+
+            _bulk_write(PaymentWebhook, webhooks, ['processed', 'processed_at', 'processing_error'])
+
+        handled += len(webhooks)
+        batches += 1
+
+    return handled
+
+
+def process_webhook_batch(webhooks):
+    """Apply a batch of webhooks with a fixed number of queries.
+
+    Events are grouped by Razorpay order and applied with
+    ``apply_payment_events``. The caller owns the transaction and saves the
+    ``processed`` flags.
+    """
+    now = timezone.now()
+    webhooks_by_order = {}
+    events_by_order = {}
+    for webhook in webhooks:
+        webhook.processed = True
+        webhook.processed_at = now
+        webhook.processing_error = ''
+        event = _parse_payment_event(webhook)
+        if event is not None:
+            event_type, order_id, payment_data = event
+            webhooks_by_order.setdefault(order_id, []).append(webhook)
+            events_by_order.setdefault(order_id, []).append((event_type, payment_data))
+
+    for order_id in apply_payment_events(events_by_order):
+        for webhook in webhooks_by_order[order_id]:
+            webhook.processing_error = f'Unknown order {order_id}'
+
+
+def apply_payment_events(events_by_order):
+    """Apply ``{order_id: [(event_type, payment_data), ...]}`` in arrival order.
+
+    An order with a ``payment.captured`` event ends up paid, whatever
+    failures came before or after it; otherwise its last ``payment.failed``
+    fails it. Orders and donations move with compare-and-set updates (see
+    ``givegrip.transitions``), one statement per outcome for the whole batch,
+    so a state they have already left is never overwritten, and only the
+    donations that actually became paid are recorded in the ledger.
+    Returns the ids of orders that do not exist.
+    """
+    captured, failed = {}, {}
+    for order_id, events in events_by_order.items():
+        captures = [payment_data for event_type, payment_data in events if event_type == 'payment.captured']
+        if captures:
+            captured[order_id] = captures[-1]
+        else:
+            failed[order_id] = events[-1][1]
+
+    known = set()
+    if captured:
+        payment_ids = {order_id: data.get('id') or '' for order_id, data in captured.items()}
+        orders = transition(
+            RazorpayOrder.objects.filter(razorpay_order_id__in=list(captured)), 'paid',
+            razorpay_payment_id=_per_row('razorpay_order_id', payment_ids, 'razorpay_payment_id'),
+        )
+        donation_orders = {order.donation_id: order.razorpay_order_id for order in orders}
+        # Orders already paid (say, by the redirect) still heal their donation
+        donation_orders.update(
+            RazorpayOrder.objects.filter(razorpay_order_id__in=set(captured) - set(donation_orders.values()))
+            .values_list('donation_id', 'razorpay_order_id')
+        )
+        known.update(donation_orders.values())
+        newly_paid = transition(
+            Donation.objects.filter(pk__in=list(donation_orders)), 'paid',
+            razorpay_payment_id=_per_row(
+                'pk', {pk: payment_ids[order_id] for pk, order_id in donation_orders.items()}, 'razorpay_payment_id'
+            ),
+        )
+        record_paid_donations(newly_paid)
+
+    if failed:
+        orders = transition(
+            RazorpayOrder.objects.filter(razorpay_order_id__in=list(failed)), 'failed',
+            error_code=_per_row(
+                'razorpay_order_id', {order_id: data.get('error_code') or '' for order_id, data in failed.items()}, 'error_code'
+            ),
+            error_description=_per_row(
+                'razorpay_order_id',
+                {order_id: data.get('error_description') or '' for order_id, data in failed.items()},
+                'error_description',
+            ),
+        )
+        # A late failure for an earlier attempt never undoes a capture
+        transition(Donation.objects.filter(pk__in=[order.donation_id for order in orders]), 'failed')
+        known.update(order.razorpay_order_id for order in orders)
+        known.update(
+            RazorpayOrder.objects.filter(razorpay_order_id__in=set(failed) - known)
+            .values_list('razorpay_order_id', flat=True)
+        )
+
+    return set(events_by_order) - known
+
+
+def capture_payment(order_id, payment_id):
+    """Mark an order and its donation paid, as reported by the checkout redirect.
+
+    Returns False if the order does not exist.
+    """
+    with transaction.atomic():
+        return not apply_payment_events({order_id: [('payment.captured', {'id': payment_id})]})
+
+
+def _per_row(key_field, values, field):
+    """``CASE`` giving each row, matched on ``key_field``, its own value of ``field``."""
+    return Case(
+        *[When(**{key_field: key}, then=Value(value)) for key, value in values.items()],
+        default=F(field),
+        output_field=CharField(),
+    )
+
+
+def _bulk_write(model, objs, fields, max_groups=8):
+    """Write ``fields`` of ``objs`` back with as few and as cheap statements as possible.
+
+    Fields that take only a handful of distinct values across the batch
+    (status, flags, timestamps) are written with one plain ``UPDATE ... WHERE
+    pk IN`` per value; only the genuinely per-row fields go through
+    ``bulk_update``, whose ``CASE`` expressions grow with every row.
+    """
+    per_row_fields = []
+    for field in fields:
+        groups = {}
+        for obj in objs:
+            groups.setdefault(getattr(obj, field), []).append(obj.pk)
+        if len(groups) > max_groups:
+            per_row_fields.append(field)
+            continue
+        for value, pks in groups.items():
+            model.objects.filter(pk__in=pks).update(**{field: value})
+
+    if per_row_fields:
+        model.objects.bulk_update(objs, per_row_fields)
+
+
+def _process_individually(webhooks):
+    """Slow path used when a batch fails: isolate the failing events."""
+    for webhook in webhooks:
+        try:
+            with transaction.atomic():
+                apply_webhook(webhook)
+            webhook.processing_error = ''
+        except Exception as e:
+            logger.exception(f"Error processing webhook {webhook.event_id}")
+            webhook.processing_error = str(e)
+        webhook.processed = True
+        webhook.processed_at = timezone.now()
+
+
+def _parse_payment_event(webhook):
+    """Return ``(event_type, order_id, payment_data)`` for payment events, else None."""
+    if webhook.event_type not in PAYMENT_EVENTS:
+        return None
+    payment_data = webhook.payload.get('payload', {}).get('payment', {})
+    # Razorpay nests the payment entity under "entity"
+    payment_data = payment_data.get('entity', payment_data)
+    return webhook.event_type, payment_data.get('order_id'), payment_data
+
+
+def apply_webhook(webhook):
+    """Apply a single stored webhook to its order and donation."""
+    event = _parse_payment_event(webhook)
+    if event is None:
+        return
+    event_type, order_id, payment_data = event
+    if apply_payment_events({order_id: [(event_type, payment_data)]}):
+        raise ValueError(f'Unknown order {order_id}')